@@ -0,0 +1,161 @@
+""" Measures the crawler against a local synthetic website, so changes that make it slower can be found without crawling a real server """
+
+from mylib.crawler import Crawler
+from mylib.metrics import CrawlMetrics
+from mylib.ratecontrol import HostRateController
+from mylib.syntheticsite import SyntheticSite
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource # not on Windows
+except ImportError:
+    resource = None
+
+def peak_rss_mb():
+    """
+    Returns:
+        peak (float): The highest resident memory of this process and of its finished child processes (the parsers) in MB, None if unknown
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale / 1024 / 1024
+
+def folder_mb(path):
+    """
+    Returns:
+        size (float): The size of all files in a folder in MB
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return size / 1024 / 1024
+
+def run_phase(name, function, quiet):
+    """
+    Runs a part of the benchmark and measures it
+
+    Args:
+        name (str): The name of the phase
+        function (function): What to run
+        quiet (bool): If True the prints of the crawler are hidden
+
+    Returns:
+        result (dict): seconds, fetched pages, pages per second and the pages by result from metrics.CrawlMetrics
+    """
+    metrics = CrawlMetrics.get_instance()
+    fetched_before = metrics.total("crawler_responses_total")
+    pages_before = {result : metrics.value("crawler_pages_total", (result,)) for result in ["indexed", "updated", "unchanged", "not_modified", "duplicate", "later", "skipped"]}
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        function()
+    seconds = time.time() - start
+
+    fetched = metrics.total("crawler_responses_total") - fetched_before
+    result = {"phase" : name, "seconds" : round(seconds, 3), "fetched" : int(fetched), "pages_per_second" : round(fetched / seconds, 2) if seconds else 0.0}
+    result.update({result_name : int(metrics.value("crawler_pages_total", (result_name,)) - count) for result_name, count in pages_before.items()})
+    return result
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Crawls a local synthetic website and reports pages/sec, peak memory and index size")
+    parser.add_argument("--pages", type=int, default=500, help="how many pages the website has")
+    parser.add_argument("--fan-out", type=int, default=8, help="how many links each page has")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the server waits before every answer")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="part of the pages that answer 500")
+    parser.add_argument("--page-size", type=int, default=4000, help="about how many bytes of text each page has")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the website, the same seed gives the same website")
+    parser.add_argument("--timeout", type=float, default=0.02, help="the shortest request timeout of the crawler (the pace comes from the rate controller, see --host-rate)")
+    parser.add_argument("--host-rate", type=float, default=50.0, help="requests per second the rate controller allows the local server")
+    parser.add_argument("--concurrent", type=int, default=0, metavar="N", help="crawl with crawl_concurrent and up to N requests at the same time")
+    parser.add_argument("--processes", type=int, default=None, help="processes that parse the pages when crawling concurrently")
+    parser.add_argument("--changed", type=float, default=0.2, help="part of the pages that change before crawl_updates")
+    parser.add_argument("--no-updates", action="store_true", help="only measure the first crawl")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to this json file")
+    parser.add_argument("--baseline", metavar="FILE", help="a json file of an earlier run, exit with 1 if pages/sec got worse by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="how much slower than the baseline is still ok (0.2 = 20%%)")
+    parser.add_argument("--workdir", help="the folder for the Crawler and Index folders (default: a temporary folder that is removed)")
+    parser.add_argument("--verbose", action="store_true", help="show the prints of the crawler")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    # the crawler uses paths relative to the working directory
+    workdir = args.workdir or tempfile.mkdtemp(prefix="crawler-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    old_cwd = os.getcwd()
+    os.chdir(workdir)
+
+    # the local server can take more than a real one
+    controller = HostRateController.get_instance()
+    controller.initial_rate = args.host_rate
+    controller.max_rate = args.host_rate
+
+    site = SyntheticSite(args.pages, args.fan_out, args.latency, args.error_rate, args.page_size, args.seed).start()
+    results = []
+    try:
+        crawler = Crawler("benchmark", "benchmark", timeout=args.timeout)
+        if args.concurrent > 0:
+            crawl = lambda: crawler.crawl_concurrent(site.start_url, max_in_flight=args.concurrent, host_rate=args.host_rate, processes=args.processes)
+        else:
+            crawl = lambda: crawler.crawl(site.start_url, start=time.time())
+        results.append(run_phase("crawl", crawl, not args.verbose))
+        results[-1]["index_mb"] = round(folder_mb("Index/benchmark"), 3)
+        results[-1]["archive_mb"] = round(folder_mb("Crawler/benchmark/archive"), 3)
+        results[-1]["peak_rss_mb"] = peak_rss_mb()
+
+        if not args.no_updates:
+            site.change(args.changed)
+            results.append(run_phase("crawl_updates", lambda: crawler.crawl_updates(age_in_days=0, limit=args.pages), not args.verbose))
+            results[-1]["index_mb"] = round(folder_mb("Index/benchmark"), 3)
+            results[-1]["archive_mb"] = round(folder_mb("Crawler/benchmark/archive"), 3)
+            results[-1]["peak_rss_mb"] = peak_rss_mb()
+        # the crawler saves its lists and closes its files, that has to happen before the folder is removed
+        crawler.close()
+    finally:
+        site.stop()
+        os.chdir(old_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Synthetic website: {args.pages} pages, fan-out {args.fan_out}, latency {args.latency}s, error rate {args.error_rate}, "
+          f"page size {args.page_size} bytes, {site.requests} requests answered")
+    for result in results:
+        rss = f"{result['peak_rss_mb']:.1f} MB" if result["peak_rss_mb"] is not None else "unknown"
+        print(f"{result['phase']}: {result['fetched']} pages in {result['seconds']:.1f}s = {result['pages_per_second']:.1f} pages/sec, "
+              f"peak RSS {rss}, index {result['index_mb']:.2f} MB, archive {result['archive_mb']:.2f} MB")
+        print("    " + ", ".join(f"{name} {result[name]}" for name in ["indexed", "updated", "unchanged", "not_modified", "duplicate", "later", "skipped"]))
+
+    report = {"settings" : vars(args), "results" : results}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if baseline:
+        worse = False
+        old = {r["phase"] : r for r in baseline["results"]}
+        for result in results:
+            if result["phase"] in old and old[result["phase"]]["pages_per_second"]:
+                change = result["pages_per_second"] / old[result["phase"]]["pages_per_second"] - 1
+                print(f"{result['phase']}: {change:+.0%} pages/sec compared to the baseline")
+                worse = worse or change < -args.tolerance
+        if worse:
+            print("Slower than the baseline")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
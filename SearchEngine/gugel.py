@@ -1,9 +1,8 @@
 # myapp.py
 
-from flask import Flask, request, render_template, session #add abort for testing
+from flask import Flask, request, render_template, session, Response #add abort for testing
 from werkzeug.exceptions import HTTPException
 import threading
-import time
 import secrets
 import logging
 
@@ -11,6 +10,8 @@ from mylib.index import Index
 from mylib import website_dicts
 from mylib.updatedaemon import IndexUpdateDaemon
 from mylib.myfunctions import thread_highlights, create_logger
+from mylib.metrics import CrawlMetrics
+from mylib.archive import PageArchive
 
 # Logging
 logger = create_logger(folder = 'logs',filename = 'gugel.log', level=logging.INFO, format = '%(asctime)s - %(levelname)s - %(message)s')
@@ -25,12 +26,13 @@ v = website_dicts.uos
 
 # create index for searching
 index = Index(v["custom_header_name"],"Index/" + v["path"])
+index.archive = PageArchive("Crawler/" + v["path"] + "/archive") # highlights from the archived pages, only the others are downloaded
 
 pagelen = 15
 
 all_search_results_dict = {}
 
-IndexUpdateDaemon(v).start() # starts every day when the first request was sent.
+IndexUpdateDaemon(v).start() # checks the pages that most likely changed, spread over the whole day
 logger.info('Started Daemon')
 
 def prepare():
@@ -40,19 +42,61 @@ def prepare():
 
     if not 'user_id' in session:
         session['user_id'] = secrets.token_hex(16)
-        all_search_results_dict[session['user_id']] = {"pagecount": 0, "match": 0, "all_matches": [], "result": [], "user_id" : session['user_id'], "last_page": False, "total":0, "q":""}
+        all_search_results_dict[session['user_id']] = {"pagecount": 0, "pages": {}, "loading": {}, "user_id" : session['user_id'], "total":0, "q":""}
     return all_search_results_dict[session['user_id']]
 
+def start_loading(g, num):
+    """
+    Start a thread in the background to search page num and load its highlights and favicons, if it exists and is not loaded yet
+
+    Args:
+        g (dict): The search of the user (see prepare)
+        num (int): The page to load
+    """
+    if num <= g["pagecount"] and num not in g["pages"] and num not in g["loading"]:
+        T = threading.Thread(target = thread_highlights, args=(index, g["q"], num, pagelen, g["pages"]), name="background load highlights and favicon")
+        g["loading"][num] = T
+        T.start()
+
+def get_results(g, num):
+    """
+    Get page num of the search with highlights and favicons. Waits for the background thread if it is loading the page, else loads it now. 
+    Only the pages next to it are kept, so the memory needed does not grow with the pages the user looked at. 
+
+    Args:
+        g (dict): The search of the user (see prepare)
+        num (int): The page to get
+
+    Returns:
+        results (list): [(title, url, highlights, favicon_url), ...] # ! favicon_url might be None!
+    """
+    T = g["loading"].pop(num, None)
+    if T is not None:
+        T.join()
+    if num not in g["pages"]:
+        thread_highlights(index, g["q"], num, pagelen, g["pages"])
+    for n in list(g["pages"]):
+        if abs(n - num) > 1:
+            g["pages"].pop(n, None)
+    return g["pages"][num]
+
 @app.route("/")
 def start():
     prepare()
     return render_template("search.html", pagecount = 0, result = [], num = 1)
 
+@app.route("/metrics")
+def metrics():
+    """
+    The metrics of the update crawls and the highlight downloads of this process in the Prometheus text format
+    """
+    return Response(CrawlMetrics.get_instance().prometheus_text(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/search")
 def search():
     """
-    Do a search using argument q. Get 1 million results max (if you want to have more make sure the server can handle more). The results of the search are savid in all_search_results_dict with the user_id as key. 
-    Load highlights and favicon for first page. 
+    Do a search using argument q. Only the first page of results is searched with highlights and favicon (see Index.search_page), 
+    the search of the user is saved in all_search_results_dict with the user_id as key. 
     Try to correct string. 
     Finally load highlights and favicons for next page in a thread. 
     """
@@ -60,18 +104,15 @@ def search():
     g = prepare()
 
     g["q"] = request.args.get('q')
+    g["pages"] = {}
+    g["loading"] = {}
 
-    # only 1m to not overwhelm RAM
-    g["total"], g["result"] = index.search(g["q"],limit = 1000000) #p.total, p.pagecount, p.pagenum, p.is_last_page(), self.convert_results(p.results)
-    g["pagecount"] = int(g["total"]/pagelen) + (0 if g["total"]%pagelen else 1)
+    g["total"], g["pagecount"], results = index.search_page(g["q"], 1, pagelen)
     # get highlights and favicon
-    end = pagelen if pagelen <= g["total"] else g["total"]
-    g["all_matches"] = []
-    g["all_matches"].append(index.get_highlights_and_favicon(g["result"][:end])) # (title, url, highlights, favicon_url) # ! favicon_url might be None!
-    #print("\n\nresult:\n",all_matches)
+    g["pages"][1] = index.get_highlights_and_favicon(results) # (title, url, highlights, favicon_url) # ! favicon_url might be None!
     
-    if g["result"]:
-        match_string = str(g["total"]) + " matches estimated!"
+    if g["total"]:
+        match_string = str(g["total"]) + " matches found!"
     else:
         match_string = "No matches found!"
 
@@ -79,22 +120,16 @@ def search():
     corrected_q = index.correct_string(g["q"])
 
     # start a thread in the background to load highlights and favicon for page 2
-    reached_limit = False
-    if (len(g["result"]) > pagelen): # is there a page 2
-        end = pagelen*2 if pagelen*2 <= len(g["result"]) else len(g["result"])
-        T = threading.Thread(target = thread_highlights, args=(index, g["result"][pagelen:end],g["all_matches"]) ,name="background load highlights and favicon")
-        T.start()
-    elif 1 < g["pagecount"]: # If there is no more page, even though pagecount is not reached (limit is reached)
-        reached_limit = True
+    start_loading(g, 2)
 
-    return render_template("search.html", req = g["q"], req_corrected = corrected_q, match = match_string, result = g["all_matches"], pagecount = g["pagecount"], num = 1, reached_limit = reached_limit)
+    return render_template("search.html", req = g["q"], req_corrected = corrected_q, match = match_string, result = g["pages"][1], pagecount = g["pagecount"], num = 1, reached_limit = False)
 
 @app.route('/search-<q>/Page-<int:num>', methods=['POST']) # TODO find out how to have search q with ? as in
 def load_page(num,q):
     """
     When user wants more results
-    Wait until highlights and favicon for this page are done. Then start a thread to load them for the next page before rendering the template. 
-    Also checks whether there is another page of results (when there are more than 1 million results, total can be bigger than len(results))
+    Wait until highlights and favicon for this page are done (or load them now). Then start a thread to load them for the next page before rendering the template. 
+    Also checks whether the page still has results (the index may have changed since the first page)
 
     Args: 
         num (int): The page to load
@@ -103,21 +138,12 @@ def load_page(num,q):
 
     g = prepare()
 
-    reached_limit = False
+    results = get_results(g, num) if num >= 1 else []
+    reached_limit = not results and num > 1 # If there is no more page, even though pagecount is not reached
 
-    while (len(g["all_matches"]) < num): # while page not already in all_matches wait
-        time.sleep(0.1)
+    start_loading(g, num + 1)
 
-    if (len(g["result"]) > pagelen*num): # is there another page
-        end = pagelen*num + pagelen if len(g["result"]) >= pagelen*num + pagelen else len(g["result"]) # check how long page is
-        if (len(g["all_matches"]) < num + 1): # do have the next page already?
-            T = threading.Thread(target = thread_highlights, args=(index, g["result"][pagelen*num:end], g["all_matches"]) ,name="background load highlights and favicon")
-            T.start()
-    elif num < g["pagecount"]: # If there is no more page, even though pagecount is not reached (limit is reached)
-        reached_limit = True
-
-    
-    return render_template('search.html', req = g["q"],match = str(g["total"]) + " matches estimated!", result=g["all_matches"], pagecount = g["pagecount"], num = num, reached_limit = reached_limit)
+    return render_template('search.html', req = g["q"],match = str(g["total"]) + " matches found!", result=results, pagecount = g["pagecount"], num = num, reached_limit = reached_limit)
 
 @app.errorhandler(Exception)
 def handle_exception(e):
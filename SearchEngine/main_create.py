@@ -1,24 +1,50 @@
 from  mylib import website_dicts
 from mylib.crawler import Crawler
+from mylib.coordinator import CrawlCoordinator
 
-import sys
+import argparse
 
 def main():
 
+    parser = argparse.ArgumentParser(description="Creates the index for one entry of website_dicts.py")
+    parser.add_argument("path", help="a short term for which page to crawl out of website_dicts.py, \"all\" for all of them (only with --workers)")
+    parser.add_argument("--concurrent", type=int, default=0, metavar="N", help="crawl with up to N requests at the same time instead of one after the other")
+    parser.add_argument("--host-rate", type=float, default=4.0, help="requests per second one host gets at most when crawling concurrently (the rate controller adapts below it)")
+    parser.add_argument("--processes", type=int, default=None, help="processes that parse the pages when crawling concurrently (default: all cores, 0: parse in the download threads)")
+    parser.add_argument("--priority", choices=["depth", "inlinks", "opic"], default="depth", help="which page to visit next: smallest depth, most inlinks or most important (OPIC)")
+    parser.add_argument("--rebuild", action="store_true", help="build the index again from the archived pages instead of crawling (e.g. after the schema changed)")
+    parser.add_argument("--workers", type=int, default=0, metavar="N", help="crawl with N worker processes that each own a part of the urls, their indexes are merged at the end")
+    parser.add_argument("--shard-by", choices=["host", "url"], default="host", help="split the urls between the workers by host (one worker per website) or by url hash")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        info_dicts = website_dicts.my_dicts if args.path == "all" else [website_dicts.find_dict(args.path)]
+        if None in info_dicts:
+            print(f"No entry for {args.path}.")
+            return
+        print(f"Creating the index for {', '.join(v['path'] for v in info_dicts)} with {args.workers} workers")
+        CrawlCoordinator(info_dicts, args.workers, args.shard_by, args.host_rate, args.priority).run()
+        return
+
     # get the website to use
-    try:
-        v = website_dicts.find_dict(sys.argv[1])
-    except IndexError:
-        print("You need to enter a short term for which page to crawl out of website_dicts.py")
-        exit(-1)
+    v = website_dicts.find_dict(args.path)
 
     if v == None:
-        print(f"No entry for {sys.argv[1]}.")
+        print(f"No entry for {args.path}.")
     else:
         print(f"Creating the index for {v['path']}")
 
-        mycrawler = Crawler(v["custom_header_name"], v["path"])
-        mycrawler.crawl(v["start_url"])
+        mycrawler = Crawler(v["custom_header_name"], v["path"], priority=args.priority, canonical_rules=v.get("canonical"))
+        try:
+            if args.rebuild:
+                mycrawler.rebuild_index(processes=args.processes)
+            elif args.concurrent > 0:
+                mycrawler.crawl_concurrent(v["start_url"], max_in_flight=args.concurrent, host_rate=args.host_rate, processes=args.processes)
+            else:
+                mycrawler.crawl(v["start_url"])
+        finally:
+            # also saves what was crawled before a KeyboardInterrupt
+            mycrawler.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,134 @@
+""" Controls the access of all Index objects of a process to the whoosh indexes """
+
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from whoosh.writing import LockError
+
+class IndexAccessManager:
+    """
+    A readers/writer lock for the whoosh indexes, that wakes the waiting threads with a threading.Condition instead of letting them poll.
+    Any number of searches can read at the same time. Only one writer writes at a time, the waiting writers go in the order of their priority
+    (smallest first, then first come first served). Searches do not wait for writers, because a whoosh searcher keeps reading the last commit
+    while a writer writes, so searches always go first. Only exclusive access (e.g. to swap the index directory) waits until
+    nobody reads or writes, and new readers and writers wait for it.
+    If the whoosh index is locked by another process (LockError), write waits a bit and tries again.
+
+    Attributes:
+        _instance (IndexAccessManager): The one instance of the singleton is saved here if created
+        readers (int): How many readers are reading at the moment
+        writer (bool): True while a writer has the lock
+        exclusive_active (bool): True while an exclusive access has the lock
+        exclusive_waiting (int): How many exclusive accesses are waiting
+        waiting_writers (list): heap of (priority, number) of the waiting writers
+        max_retry_wait (float): The longest time write waits before it tries again after a LockError
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_retry_wait : float = 1.0):
+        """
+        Args:
+            max_retry_wait (float): The longest time write waits before it tries again after a LockError
+        """
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.exclusive_active = False
+        self.exclusive_waiting = 0
+        self.waiting_writers = []
+        self.counter = itertools.count()
+        self.max_retry_wait = max_retry_wait
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Get the shared instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @contextmanager
+    def reading(self):
+        """
+        Use with a with statement while reading the index: with manager.reading(): ...
+        Only waits while an exclusive access is waiting or has the lock.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self.exclusive_active and not self.exclusive_waiting)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing_lock(self, priority = 2):
+        """
+        Use with a with statement while writing the index: with manager.writing_lock(priority): ...
+
+        Args:
+            priority (int): The writers with the smallest priority get the lock first
+        """
+        entry = (priority, next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiting_writers, entry)
+            self.condition.wait_for(lambda: not self.writer and not self.exclusive_active and not self.exclusive_waiting and self.waiting_writers[0] == entry)
+            heapq.heappop(self.waiting_writers)
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Use with a with statement for changes nobody may read during (e.g. swapping the index directory): with manager.exclusive(): ...
+        Waits until the readers and the writer are done, new ones wait until it is done.
+        """
+        with self.condition:
+            self.exclusive_waiting += 1
+            self.condition.wait_for(lambda: not self.writer and not self.exclusive_active and self.readers == 0)
+            self.exclusive_waiting -= 1
+            self.exclusive_active = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.exclusive_active = False
+                self.condition.notify_all()
+
+    def write(self, function, priority = 2):
+        """
+        Calls function with the write lock. If the whoosh index is locked by another process, the lock is given back,
+        and it is tried again after a short wait (doubled every time up to max_retry_wait).
+
+        Args:
+            function (function): Writes to the index (without arguments)
+            priority (int): The writers with the smallest priority get the lock first
+
+        Returns:
+            result: What function returned
+        """
+        delay = 0.05
+        while True:
+            with self.writing_lock(priority):
+                try:
+                    return function()
+                except LockError:
+                    pass
+            # another process writes, wake up earlier if a writer of this process is done
+            with self.condition:
+                self.condition.wait(delay)
+            delay = min(delay * 2, self.max_retry_wait)
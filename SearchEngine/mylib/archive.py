@@ -0,0 +1,231 @@
+""" An append-only archive of the downloaded pages in WARC files, so the index can be built again without crawling """
+
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from http.client import responses as reason_phrases
+
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# a page read from the archive: url (str), status (int), headers (requests.structures.CaseInsensitiveDict), body (bytes), fetched (datetime.datetime, UTC)
+ArchivedPage = namedtuple("ArchivedPage", ["url", "status", "headers", "body", "fetched"])
+
+# headers that describe the transfer, the body is saved decoded, so they are not true anymore
+transfer_headers = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+archive_file_re = re.compile(r"^archive-(\d{5})\.warc\.gz$")
+
+def headers_encoding(headers):
+    """
+    Args:
+        headers (requests.structures.CaseInsensitiveDict): The headers of an archived page
+
+    Returns:
+        encoding (str): The charset the server sent or None, then the parser finds it in the html
+    """
+    if "charset" in headers.get("content-type", "").lower():
+        return get_encoding_from_headers(headers)
+    return None
+
+class PageArchive:
+    """
+    Saves every downloaded page (url, status, headers, fetch time and body) as a WARC response record. Every record is its own gzip member,
+    so it can be read without the records before it. The files are only appended to, a new file is started after max_file_bytes.
+    An SQLite table remembers the file and offset of the newest record of each url, so a page can be read at once.
+    A page whose body is the same as in its newest record is not saved again.
+
+    Attributes:
+        directory (str): The folder of the archive files and archive.sqlite3
+        max_file_bytes (int): After how many bytes a new archive file is started
+        file_number (int): The number of the file that is appended to
+        file (io.BufferedWriter): The open file that is appended to
+    """
+
+    def __init__(self, directory : str, max_file_bytes : int = 256 * 1024 * 1024):
+        """
+        Args:
+            directory (str): The folder of the archive, created if it does not exist
+            max_file_bytes (int): After how many bytes a new archive file is started
+        """
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(directory, "archive.sqlite3"), check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, file INTEGER NOT NULL, offset INTEGER NOT NULL, "
+                                "length INTEGER NOT NULL, fetched TEXT NOT NULL, body_hash TEXT NOT NULL)")
+        self.connection.commit()
+
+        numbers = [int(m.group(1)) for m in map(archive_file_re.match, os.listdir(directory)) if m]
+        self.file_number = max(numbers, default=0)
+        self.file = None
+
+    def file_path(self, number):
+        """ The path of an archive file """
+        return os.path.join(self.directory, f"archive-{number:05d}.warc.gz")
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def __contains__(self, url):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone() is not None
+
+    @staticmethod
+    def warc_record(url, status, headers, body, fetched):
+        """
+        Returns:
+            record (bytes): The WARC/1.0 response record of a page (not compressed)
+        """
+        http_headers = "".join(f"{name}: {value}\r\n" for name, value in headers.items() if name.lower() not in transfer_headers)
+        block = (f"HTTP/1.1 {status} {reason_phrases.get(status, '')}\r\n{http_headers}Content-Length: {len(body)}\r\n\r\n").encode("latin-1", "replace") + body
+        warc_headers = (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+                        f"WARC-Date: {fetched.strftime('%Y-%m-%dT%H:%M:%SZ')}\r\nWARC-Target-URI: {url}\r\n"
+                        f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(block)}\r\n\r\n")
+        return warc_headers.encode("utf-8") + block + b"\r\n\r\n"
+
+    @staticmethod
+    def parse_record(data, fetched):
+        """
+        Args:
+            data (bytes): A WARC response record written by warc_record (not compressed)
+            fetched (datetime.datetime): When the page was downloaded
+
+        Returns:
+            page (ArchivedPage): The page in the record
+        """
+        warc_part, _, block = data.partition(b"\r\n\r\n")
+        warc_headers = dict(line.split(": ", 1) for line in warc_part.decode("utf-8").split("\r\n")[1:])
+        block = block[:int(warc_headers["Content-Length"])]
+
+        http_part, _, body = block.partition(b"\r\n\r\n")
+        lines = http_part.decode("latin-1").split("\r\n")
+        headers = CaseInsensitiveDict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+        return ArchivedPage(warc_headers["WARC-Target-URI"], int(lines[0].split(" ")[1]), headers, body, fetched)
+
+    def append(self, url, response, fetched = None):
+        """
+        Saves a downloaded page, if its body changed since the newest record of url
+
+        Args:
+            url (str): The url of the page (the canonical one the crawler uses)
+            response (requests.Response): The response
+            fetched (datetime.datetime): When it was downloaded, utcnow if None
+
+        Returns:
+            value (bool): True if a record was written
+        """
+        return self.append_page(url, response.status_code, response.headers, response.content, fetched)
+
+    def append_page(self, url, status, headers, body, fetched = None):
+        """
+        Like append, but with the parts of the response
+
+        Returns:
+            value (bool): True if a record was written
+        """
+        fetched = fetched or datetime.utcnow()
+        body_hash = hashlib.blake2b(body, digest_size=16).hexdigest()
+        data = gzip.compress(self.warc_record(url, status, headers, body, fetched))
+
+        with self.lock:
+            row = self.connection.execute("SELECT body_hash FROM pages WHERE url = ?", (url,)).fetchone()
+            if row and row[0] == body_hash:
+                return False
+
+            if self.file is None:
+                self.file = open(self.file_path(self.file_number), "ab")
+            if self.file.tell() >= self.max_file_bytes:
+                self.file.close()
+                self.file_number += 1
+                self.file = open(self.file_path(self.file_number), "ab")
+
+            offset = self.file.tell()
+            self.file.write(data)
+            self.connection.execute("INSERT OR REPLACE INTO pages (url, file, offset, length, fetched, body_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (url, self.file_number, offset, len(data), fetched.isoformat(), body_hash))
+        return True
+
+    def get(self, url):
+        """
+        Args:
+            url (str): The url of the page
+
+        Returns:
+            page (ArchivedPage): The newest record of url, None if it is not in the archive
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT file, offset, length, fetched FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            if self.file is not None and row[0] == self.file_number:
+                self.file.flush()
+
+        number, offset, length, fetched = row
+        with open(self.file_path(number), "rb") as file:
+            file.seek(offset)
+            data = file.read(length)
+        return self.parse_record(gzip.decompress(data), datetime.fromisoformat(fetched))
+
+    def pages(self):
+        """
+        Reads the newest record of every url, file after file in the order they were written, so the files are read from the start to the end
+
+        Yields:
+            page (ArchivedPage)
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT file, offset, length, fetched FROM pages ORDER BY file, offset").fetchall()
+            if self.file is not None:
+                self.file.flush()
+
+        file = None
+        number = None
+        try:
+            for row_number, offset, length, fetched in rows:
+                if row_number != number:
+                    if file:
+                        file.close()
+                    file = open(self.file_path(row_number), "rb")
+                    number = row_number
+                file.seek(offset)
+                yield self.parse_record(gzip.decompress(file.read(length)), datetime.fromisoformat(fetched))
+        finally:
+            if file:
+                file.close()
+
+    def remove(self, url):
+        """
+        Forgets the records of a page that is not in the index anymore (the files are not changed)
+
+        Args:
+            url (str): The url of the page
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def commit(self):
+        """ Writes the changes to the disk """
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            self.connection.commit()
+
+    def close(self):
+        """ Commits and closes the archive """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,219 @@
+""" Brings urls into one canonical form, so the same page is not crawled and indexed under different urls """
+
+import json
+import re
+from urllib.parse import urlsplit, urlunsplit, quote_plus, unquote_plus
+
+# query parameters that only track where a visitor came from or who it is
+tracking_params = ["utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "phpsessid", "jsessionid", "sessionid"]
+
+default_ports = {"http" : 80, "https" : 443}
+
+class UrlCanonicalizer:
+    """
+    Changes an url to its canonical form. The safe rules are always used: lower case scheme and host, no default port, no fragment,
+    no ;jsessionid= in the path, the same percent-encoding and no /./ or /../ in the path.
+    The other rules can be set for each site with the "canonical" dict in website_dicts.py, the keys are the arguments of __init__.
+
+    Attributes:
+        drop_params (list): query parameters that are removed (lower case, ending with * for all parameters with that prefix)
+        keep_params (list): if not None, only these query parameters are kept
+        sort_query (bool): sort the query parameters
+        index_files (list): file names that are removed at the end of the path (/a/index.html becomes /a/)
+        trailing_slash (str): "keep", "add" (/a becomes /a/ if the last part has no file extension) or "remove" (/a/ becomes /a)
+        lowercase_path (bool): use a lower case path (only for servers that do not care about the case)
+        force_https (bool): use https instead of http
+        counts (dict): rule (str) -> how many urls were changed by this rule
+        checked (int): how many urls were canonicalized
+        variants (set): hashes of the different non canonical urls that were found
+        fetches_saved (int): how many non canonical urls were not visited, because their canonical url was already known
+    """
+
+    session_path_re = re.compile(r";(jsessionid|phpsessid)=[^/?#]*", re.I)
+    percent_re = re.compile(r"%[0-9a-fA-F]{2}")
+    unreserved = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+    def __init__(self, drop_params = None, keep_params = None, sort_query : bool = True, index_files = ("index.html", "index.htm", "index.php"),
+                 trailing_slash : str = "keep", lowercase_path : bool = False, force_https : bool = False):
+        """
+        Args:
+            drop_params (list): query parameters that are removed, tracking_params if None
+            keep_params (list): if not None, only these query parameters are kept
+            sort_query (bool): sort the query parameters
+            index_files (list): file names that are removed at the end of the path
+            trailing_slash (str): "keep", "add" or "remove"
+            lowercase_path (bool): use a lower case path
+            force_https (bool): use https instead of http
+        """
+        if trailing_slash not in ("keep", "add", "remove"):
+            raise ValueError(f"trailing_slash has to be keep, add or remove, not {trailing_slash}")
+
+        self.drop_params = [p.lower() for p in (tracking_params if drop_params is None else drop_params)]
+        self.keep_params = None if keep_params is None else {p.lower() for p in keep_params}
+        self.sort_query = sort_query
+        self.index_files = {f.lower() for f in index_files}
+        self.trailing_slash = trailing_slash
+        self.lowercase_path = lowercase_path
+        self.force_https = force_https
+
+        self.counts = {}
+        self.checked = 0
+        self.variants = set()
+        self.fetches_saved = 0
+
+    @classmethod
+    def from_dict(cls, rules):
+        """
+        Args:
+            rules (dict): The "canonical" dict of a website_dicts entry, may be None
+
+        Returns:
+            canonicalizer (UrlCanonicalizer)
+        """
+        return cls(**(rules or {}))
+
+    def _count(self, rule, before, after):
+        """ Counts a rule if it changed something and returns after """
+        if before != after:
+            self.counts[rule] = self.counts.get(rule, 0) + 1
+        return after
+
+    def _normalize_percent(self, match):
+        """ Decodes %XX of unreserved characters and writes the others in upper case """
+        character = chr(int(match.group(0)[1:], 16))
+        return character if character in self.unreserved else match.group(0).upper()
+
+    def _param_dropped(self, name):
+        """ Whether a query parameter is removed """
+        name = name.lower()
+        if self.keep_params is not None and name not in self.keep_params:
+            return True
+        return any(name.startswith(p[:-1]) if p.endswith("*") else name == p for p in self.drop_params)
+
+    @staticmethod
+    def split_query(query):
+        """
+        Splits a query into its parameters like parse_qsl with keep_blank_values, but keeps ?foo apart from ?foo=
+
+        Returns:
+            params (list): tuples (name (str), value (str, None for a parameter without =))
+        """
+        params = []
+        for part in query.split("&"):
+            if not part:
+                continue
+            name, equals, value = part.partition("=")
+            params.append((unquote_plus(name), unquote_plus(value) if equals else None))
+        return params
+
+    @staticmethod
+    def join_query(params, safe = "/:@,;"):
+        """ The opposite of split_query, quoted like urlencode """
+        return "&".join(quote_plus(name, safe) if value is None else quote_plus(name, safe) + "=" + quote_plus(value, safe) for name, value in params)
+
+    @staticmethod
+    def remove_dot_segments(path):
+        """ Removes /./ and /../ from a path (RFC 3986, 5.2.4) """
+        if "/." not in path:
+            return path
+        output = []
+        segments = path.split("/")
+        for segment in segments[1:]:
+            if segment == ".":
+                continue
+            if segment == "..":
+                if output:
+                    output.pop()
+                continue
+            output.append(segment)
+        if segments[-1] in (".", ".."):
+            output.append("")
+        return "/" + "/".join(output)
+
+    def canonicalize(self, url):
+        """
+        Args:
+            url (str): An absolute url
+
+        Returns:
+            url (str): The canonical form of url, url itself if it can not be parsed
+        """
+        self.checked += 1
+        try:
+            parsed = urlsplit(url.strip())
+            port = parsed.port
+        except ValueError:
+            return url
+
+        scheme = self._count("case", parsed.scheme, parsed.scheme.lower())
+        if self.force_https and scheme == "http":
+            scheme = self._count("https", scheme, "https")
+
+        userinfo, _, host = parsed.netloc.rpartition("@")
+        host = self._count("case", host, host.lower())
+        if port is not None and port == default_ports.get(scheme):
+            host = self._count("port", host, host.rsplit(":", 1)[0])
+        netloc = userinfo + "@" + host if userinfo else host
+
+        path = self._count("session", parsed.path, self.session_path_re.sub("", parsed.path))
+        path = self._count("percent", path, self.percent_re.sub(self._normalize_percent, path))
+        path = self._count("dot_segments", path, self.remove_dot_segments(path))
+        if not path:
+            path = "/"
+        if self.lowercase_path:
+            path = self._count("case", path, path.lower())
+
+        directory, _, last = path.rpartition("/")
+        if last.lower() in self.index_files:
+            path = self._count("index_file", path, directory + "/")
+            last = ""
+        if self.trailing_slash == "remove" and path != "/" and path.endswith("/"):
+            path = self._count("trailing_slash", path, path.rstrip("/") or "/")
+        elif self.trailing_slash == "add" and last and "." not in last:
+            path = self._count("trailing_slash", path, path + "/")
+
+        query = parsed.query
+        if query:
+            params = self.split_query(query)
+            kept = [(name, value) for name, value in params if not self._param_dropped(name)]
+            if len(kept) != len(params):
+                self._count("params", 0, 1)
+            if self.sort_query:
+                kept = self._count("query_order", kept, sorted(kept, key=lambda param: (param[0], param[1] is not None, param[1] or "")))
+            query = self.join_query(kept)
+
+        self._count("fragment", parsed.fragment, "")
+
+        return urlunsplit((scheme, netloc, path, query, ""))
+
+    def record(self, url, canonical, new):
+        """
+        Counts the fetches that were saved: a non canonical url that was found for the first time, but whose canonical url
+        was already known, would have been visited without canonicalization.
+
+        Args:
+            url (str): The url as it was found
+            canonical (str): canonicalize(url)
+            new (bool): Whether canonical was new to the crawler
+        """
+        if url != canonical and hash(url) not in self.variants:
+            self.variants.add(hash(url))
+            if not new:
+                self.fetches_saved += 1
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): checked, variants, fetches_saved and how many urls each rule changed
+        """
+        return {"checked" : self.checked, "variants" : len(self.variants), "fetches_saved" : self.fetches_saved, "rules" : dict(self.counts)}
+
+    def save_stats(self, path):
+        """
+        Writes stats() into a json file
+
+        Args:
+            path (str): The json file
+        """
+        with open(path, "w") as file:
+            json.dump(self.stats(), file, indent=2)
@@ -0,0 +1,404 @@
+""" Crawls with several worker processes that each own a part of the urls (by host or url hash) and merges their indexes at the end """
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from mylib.crawler import Crawler
+from mylib.canonical import UrlCanonicalizer
+from mylib.index import Index
+from mylib.simhash import NearDuplicateIndex
+from mylib.archive import PageArchive
+from mylib.ratecontrol import HostRateController
+
+def shard_of(url, workers, by = "host"):
+    """
+    Args:
+        url (str): A canonical url
+        workers (int): How many workers there are
+        by (str): "host" (all urls of a host belong to one worker) or "url" (the urls of one host are spread over all workers)
+
+    Returns:
+        shard (int): The number of the worker that owns url
+    """
+    key = urlparse(url).netloc.lower() if by == "host" else url
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") % workers
+
+def shard_path(path, shard):
+    """ The path (for Crawler/ and Index/) of the part of a website that one worker crawls """
+    return f"{path}-shard{shard}"
+
+class WorkState:
+    """
+    Tells the coordinator when all workers are done: it counts the urls that were sent to a worker but not taken yet and which workers are busy.
+    Both are only changed under one lock and a worker is busy before it takes an url, so an url is always counted as sent or is in the frontier of a busy worker.
+
+    Attributes:
+        lock (multiprocessing.managers.AcquirerProxy): The lock for values
+        values (multiprocessing.managers.ListProxy): [urls sent, busy of worker 0 (int), busy of worker 1, ...]
+    """
+
+    def __init__(self, manager, workers):
+        """
+        Args:
+            manager (multiprocessing.managers.SyncManager): Holds the shared objects
+            workers (int): How many workers there are
+        """
+        self.lock = manager.Lock()
+        self.values = manager.list([0] + [1] * workers) # busy until they looked at their frontier once
+
+    def sent(self):
+        """ Called before an url is put into the inbox of a worker """
+        with self.lock:
+            self.values[0] += 1
+
+    def received(self, shard):
+        """ Called by a worker after it took an url from its inbox """
+        with self.lock:
+            self.values[shard + 1] = 1
+            self.values[0] -= 1
+
+    def set_busy(self, shard, busy):
+        with self.lock:
+            self.values[shard + 1] = int(busy)
+
+    def done(self):
+        """ True if no url is sent and no worker is busy """
+        with self.lock:
+            values = list(self.values)
+        return values[0] == 0 and not any(values[1:])
+
+class HostSchedule:
+    """
+    When the next request may be sent to each host, shared by all workers, so a host gets at most host_rate requests per second
+    (and not faster than its Crawl-delay) from all workers together. Each worker sets it in its ratecontrol.HostRateController,
+    so all requests wait for it: the pages with their retries, robots.txt, sitemaps and favicons.
+
+    Attributes:
+        lock (multiprocessing.managers.AcquirerProxy): The lock for next_times
+        next_times (multiprocessing.managers.DictProxy): host (str) -> time.time() when the next request may be sent
+        interval (float): The shortest time between two requests to the same host
+    """
+
+    def __init__(self, manager, host_rate):
+        """
+        Args:
+            manager (multiprocessing.managers.SyncManager): Holds the shared objects
+            host_rate (float): How many requests per second are sent to one host at most
+        """
+        self.lock = manager.Lock()
+        self.next_times = manager.dict()
+        self.interval = 1 / host_rate
+
+    def wait(self, url, crawl_delay = None, max_wait = None):
+        """
+        Waits until a request to the host of url may be sent and reserves that time
+
+        Args:
+            url (str): The url to request
+            crawl_delay (float): The Crawl-delay of robots.txt of the host
+            max_wait (float): If given, nothing is reserved if the request would have to wait longer
+
+        Returns:
+            value (bool): False if the request would have to wait longer than max_wait
+        """
+        host = urlparse(url).netloc
+        interval = max(self.interval, crawl_delay or 0)
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_times.get(host, 0))
+            if max_wait is not None and slot - now > max_wait:
+                return False
+            self.next_times[host] = slot + interval
+        time.sleep(max(slot - now, 0))
+        return True
+
+class ShardWorker:
+    """
+    One worker process. It crawls the urls it owns with one Crawler for each website (saved in Crawler/path-shardN and Index/path-shardN,
+    so a stopped crawl continues), the urls it finds but does not own are put into the inbox of their owner.
+
+    Attributes:
+        shard (int): The number of this worker
+        workers (int): How many workers there are
+        by (str): "host" or "url", see shard_of
+        info_dicts (dict): path (str) -> the website_dicts entry
+        inboxes (list): The queues (multiprocessing.managers queue proxies) of all workers, messages are (path, url, depth) or None to stop
+        state (WorkState): The shared state to find out when all workers are done
+        schedule (HostSchedule): The shared politeness schedule
+        priority (str): The scorer of the frontiers
+        batch (int): After how many pages a Crawler updates its index
+        printing (bool): Whether to print the progress
+        crawlers (dict): path (str) -> crawler.Crawler of this worker
+        retried (set): The paths whose urls for later were tried again already
+        forwarded (set): Hashes of the urls that were given to other workers, so each one is only sent once
+    """
+
+    def __init__(self, shard, workers, by, info_dicts, inboxes, state, schedule, priority = "depth", batch = 100, printing = True):
+        self.shard = shard
+        self.workers = workers
+        self.by = by
+        self.info_dicts = {v["path"] : v for v in info_dicts}
+        self.inboxes = inboxes
+        self.state = state
+        self.schedule = schedule
+        self.priority = priority
+        self.batch = batch
+        self.printing = printing
+        self.crawlers = {}
+        self.retried = set()
+        self.forwarded = set()
+
+    def crawler(self, path):
+        """ The Crawler of this worker for a website, created the first time it is needed """
+        if path not in self.crawlers:
+            v = self.info_dicts[path]
+            crawler = Crawler(v["custom_header_name"], shard_path(path, self.shard), priority=self.priority, canonical_rules=v.get("canonical"))
+            crawler.forward = lambda url, depth: self.forward(path, url, depth)
+            self.crawlers[path] = crawler
+        return self.crawlers[path]
+
+    def forward(self, path, url, depth):
+        """
+        Gives url to the worker that owns it
+
+        Returns:
+            value (bool): False if this worker owns url
+        """
+        owner = shard_of(url, self.workers, self.by)
+        if owner == self.shard:
+            return False
+        if hash((path, url)) in self.forwarded:
+            return True
+        self.forwarded.add(hash((path, url)))
+        self.state.sent()
+        self.inboxes[owner].put((path, url, depth))
+        return True
+
+    def receive(self, block):
+        """
+        Takes all urls from the inbox and adds them to the frontiers. A depth below 0 is a start url, its sitemaps are read too.
+
+        Args:
+            block (bool): Wait up to half a second for the first url
+
+        Returns:
+            value (bool): False if the worker should stop
+        """
+        inbox = self.inboxes[self.shard]
+        while True:
+            try:
+                message = inbox.get(timeout=0.5) if block else inbox.get_nowait()
+            except queue.Empty:
+                return True
+            if message is None:
+                return False
+            block = False
+
+            path, url, depth = message
+            self.state.received(self.shard)
+            crawler = self.crawler(path)
+            crawler.append_same_server(url, depth)
+            if depth < 0:
+                crawler.discover(url)
+
+    def next_crawler(self):
+        """ The first Crawler with urls in its frontier, None if there is none """
+        return next((crawler for crawler in self.crawlers.values() if crawler.frontier), None)
+
+    def run(self):
+        """
+        Crawls until the coordinator sends None. If there is nothing to do, the urls for later are tried once more,
+        the rest of the preliminary_index is saved and the worker waits for new urls.
+        """
+        # every request of this process waits for the shared schedule
+        HostRateController.get_instance().set_schedule(self.schedule)
+
+        # continue the websites that were started before
+        for path in self.info_dicts:
+            if os.path.isdir("Crawler/" + shard_path(path, self.shard)):
+                self.crawler(path)
+
+        start = time.time()
+        counter = 0
+        running = True
+        while running:
+            running = self.receive(block=False)
+
+            crawler = self.next_crawler()
+            if crawler is None:
+                for path, later in self.crawlers.items():
+                    if later.frontier.later and path not in self.retried:
+                        later.frontier.retry_later()
+                        self.retried.add(path)
+                if self.next_crawler() is not None:
+                    continue
+
+                for idle in self.crawlers.values():
+                    if idle.preliminary_index:
+                        idle.pre_to_Index()
+                    idle.checkpoint(force = True)
+                self.state.set_busy(self.shard, False)
+                running = running and self.receive(block=True)
+                continue
+
+            next_url, depth = crawler.frontier.pop()
+            counter += crawler.crawl_page(next_url, depth, self.printing, start, counter)
+            if len(crawler.preliminary_index) >= self.batch:
+                crawler.pre_to_Index()
+            crawler.checkpoint()
+
+        for crawler in self.crawlers.values():
+            crawler.finish_crawl()
+            crawler.close()
+
+def _run_worker(*args):
+    """ The target of the worker processes """
+    ShardWorker(*args).run()
+
+def merge_shards(info_dict, workers, remove = True):
+    """
+    Merges the parts of a website that the workers crawled into Crawler/path and Index/path. The near-duplicates of pages in other shards
+    (or already in the index) are found with the fingerprints of all shards and are not merged.
+
+    Args:
+        info_dict (dict): The website_dicts entry
+        workers (int): How many workers there were
+        remove (bool): Delete the shards after they were merged
+
+    Returns:
+        count (int): How many pages where merged into the index
+    """
+    path = info_dict["path"]
+    shards = [shard_path(path, i) for i in range(workers) if os.path.isdir("Crawler/" + shard_path(path, i))]
+    if not shards:
+        return 0
+
+    crawler = Crawler(info_dict["custom_header_name"], path, canonical_rules=info_dict.get("canonical"))
+
+    duplicates = 0
+    for shard in shards:
+        shard_fingerprints = NearDuplicateIndex("Crawler/" + shard + "/simhash.sqlite3")
+        shard_index = Index(info_dict["custom_header_name"], "Index/" + shard)
+        shard_archive = PageArchive("Crawler/" + shard + "/archive")
+        for url, fingerprint, title_hash in shard_fingerprints.rows():
+            if crawler.near_duplicates.check_fingerprint(url, fingerprint, title_hash) is not None:
+                shard_index.delete_from_index(url)
+                shard_archive.remove(url)
+                duplicates += 1
+        shard_index.flush()
+        shard_fingerprints.close()
+
+        for page in shard_archive.pages():
+            crawler.archive.append_page(page.url, page.status, page.headers, page.body, page.fetched)
+        shard_archive.close()
+
+    count = crawler.index.merge_from(["Index/" + shard for shard in shards])
+
+    # the visited urls and the ones for the next update
+    for shard in shards:
+        with open("Crawler/" + shard + "/urls_visited.txt") as file:
+            visited = [line.replace("\n", "") for line in file if line.strip()]
+        with open(crawler.urls_visited_path, "a") as file:
+            file.writelines(url + "\n" for url in visited)
+        crawler.urls_visited_count += len(visited)
+        crawler.seen.add_many(visited)
+
+        update_path = "Crawler/" + shard + "/urls_to_visit_update.txt"
+        if os.path.isfile(update_path):
+            with open(update_path) as file:
+                for line in file:
+                    splitted = line.replace("\n", "").split(',')
+                    crawler.urls_to_visit_update.append((splitted[0], datetime.strptime(splitted[1], '%y-%m-%d %H:%M:%S')))
+
+    crawler.seen.add_many(crawler.index.all_urls())
+    crawler.checkpoint(force = True)
+    crawler.close()
+    print(f"Merged {len(shards)} shards of {path}: {count} pages, {duplicates} near-duplicates across the shards")
+
+    if remove:
+        for shard in shards:
+            shutil.rmtree("Crawler/" + shard, ignore_errors=True)
+            shutil.rmtree("Index/" + shard, ignore_errors=True)
+    return count
+
+class CrawlCoordinator:
+    """
+    Crawls one or more websites with workers processes that each own a part of the urls (shard_of), so every url is only deduplicated
+    by one worker and no page is crawled twice. A worker gives the urls it finds but does not own to their owner through the inboxes,
+    all requests to a host share one HostSchedule. Each worker writes its own index and they are merged with merge_shards at the end.
+    The queues and shared objects live in a multiprocessing manager, a local stand-in for a real queue (a manager can also be
+    served over the network, so the workers could run on other machines).
+
+    Attributes:
+        info_dicts (list): The website_dicts entries to crawl
+        workers (int): How many worker processes
+        by (str): "host" (each website is crawled by one worker, good for many websites) or "url" (one website is split over all workers)
+        host_rate (float): How many requests per second one host gets from all workers together
+        priority (str): The scorer of the frontiers
+        batch (int): After how many pages a worker updates its index
+    """
+
+    def __init__(self, info_dicts, workers : int = 4, by : str = "host", host_rate : float = 1.0, priority : str = "depth", batch : int = 100):
+        """
+        Args:
+            info_dicts (list): The website_dicts entries to crawl
+            workers (int): How many worker processes
+            by (str): "host" or "url"
+            host_rate (float): How many requests per second one host gets from all workers together
+            priority (str): The scorer of the frontiers
+            batch (int): After how many pages a worker updates its index
+        """
+        if by not in ("host", "url"):
+            raise ValueError(f"by has to be host or url, not {by}")
+        self.info_dicts = list(info_dicts)
+        self.workers = workers
+        self.by = by
+        self.host_rate = host_rate
+        self.priority = priority
+        self.batch = batch
+
+    def run(self):
+        """
+        Starts the workers with the start urls, waits until they are all done and merges the shards.
+        If a worker stops with an error, all workers are stopped and the shards are kept, so the next run with the same workers continues.
+
+        Returns:
+            count (int): How many pages where merged into the indexes
+        """
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager:
+            inboxes = [manager.Queue() for _ in range(self.workers)]
+            state = WorkState(manager, self.workers)
+            schedule = HostSchedule(manager, self.host_rate)
+
+            for v in self.info_dicts:
+                url = UrlCanonicalizer.from_dict(v.get("canonical")).canonicalize(v["start_url"])
+                state.sent()
+                inboxes[shard_of(url, self.workers, self.by)].put((v["path"], url, -1))
+
+            processes = [context.Process(target=_run_worker, name=f"crawl-worker-{shard}",
+                                         args=(shard, self.workers, self.by, self.info_dicts, inboxes, state, schedule, self.priority, self.batch))
+                         for shard in range(self.workers)]
+            for process in processes:
+                process.start()
+
+            failed = None
+            while failed is None and not state.done():
+                failed = next((p for p in processes if not p.is_alive()), None)
+                time.sleep(1)
+
+            for inbox in inboxes:
+                inbox.put(None)
+            for process in processes:
+                process.join()
+
+        if failed is not None:
+            raise RuntimeError(f"{failed.name} stopped with exit code {failed.exitcode}, run again with {self.workers} workers to continue")
+
+        return sum(merge_shards(v, self.workers) for v in self.info_dicts)
@@ -1,46 +1,84 @@
 """ A crawler build for a simple search engine"""
 from urllib.parse import urljoin, urlparse
+from concurrent import futures
+import asyncio
+import multiprocessing
 import time
 from datetime import datetime, timedelta
 import os
 import re
 
-from mylib.myfunctions import get_page
+from mylib.myfunctions import fetch_page, parse_page, page_validators, page_encoding, content_hash
+from mylib.extract import extract_page
 from mylib.index import Index
+from mylib.seenstore import SeenUrlStore
+from mylib.frontier import CrawlFrontier
+from mylib.fetchlog import FetchLog
+from mylib.pipeline import IndexWriterStage
+from mylib.discovery import Discovery
+from mylib.priority import create_scorer, TrapDetector
+from mylib.simhash import NearDuplicateIndex
+from mylib.canonical import UrlCanonicalizer
+from mylib.metrics import CrawlMetrics
+from mylib.recrawl import RecrawlScheduler
+from mylib.archive import PageArchive, headers_encoding
+from mylib.favicons import FaviconCache
+from mylib.ratecontrol import HostRateController
 
 class Crawler:
     """
     A crawler object that is able to crawl one server's html pages. 
 
     Attributes: 
-        url_stack_same_server (list): a list containing all the found urls on the same server to visit next during crawling. contains tuples: (url (str), depth (int))
+        frontier (frontier.CrawlFrontier): all the found urls on the same server to visit next during crawling and the ones to try again later. 
+            Saved in Crawler/path/frontier.sqlite3 so a crawl can be resumed. The url with the best priority (see priority.py) is visited next. 
+        traps (priority.TrapDetector): Finds urls that look like crawler traps (calendars, endless pagination, repeating paths), they are not visited. 
+            The counts of its url patterns are saved in Crawler/path/traps.sqlite3, so they go on after a resume
         url_stack (list): a list of all urls found on different servers we want to visit (stays empty after the start_url is removed at the 
             moment because we only want to crawl one server)
-        urls_visited (list): a list with all the urls that where visited already by this crawler object and where not relevant for the index
-        urls_visited_path (str):
+        urls_visited_count (int): how many urls where visited already by this crawler object and where not relevant for the index
+        urls_visited_path (str): Where to save the urls that where visited and not relevant for the index
+        seen (seenstore.SeenUrlStore): all urls that where already found, visited or indexed, so they are not added to the stacks again
         urls_to_visit_update (list): a list of tuples of urls to visit again next update and the date when the url was found for the first time(saved in file when crawler is not running)
         urls_to_visit_update_path (str): Where to save urls_to_visit_update
-        url_stack_same_server_for_later (list): used during Crawler.crawl. contains tuples: (url (str), depth (int))
-        preliminary_index (list): A temporary database for index information before saving it in the whoosh index. Each element has the structure (soup (bs4.BeautifulSoup), url (string))
+        preliminary_index (list): A temporary database for index information before saving it in the whoosh index. Each element has the structure (record (extract.PageRecord), url (string), etag (str), last_modified (str))
+        fetch_log (fetchlog.FetchLog): When each page was last checked by crawl_updates or recrawl and how often it had changed
+        scheduler (recrawl.RecrawlScheduler): Chooses the pages recrawl checks, from their change rate estimated with fetch_log
+        discovery (discovery.Discovery): The robots.txt rules and sitemaps of the hosts, saved in Crawler/path/discovery.sqlite3
+        near_duplicates (simhash.NearDuplicateIndex): The SimHash fingerprints of the indexed pages, near-duplicates of them are not indexed. 
+            Saved in Crawler/path/simhash.sqlite3
+        canonicalizer (canonical.UrlCanonicalizer): Brings every found url into its canonical form before it is checked and added, 
+            its stats are saved in Crawler/path/canonical_stats.json after each crawl
+        archive (archive.PageArchive): The newest downloaded version of every indexed page in WARC files in Crawler/path/archive, 
+            so rebuild_index can build the index again without crawling
+        favicons (favicons.FaviconCache): The favicon of each host, the favicon of every page is resolved with it before it is indexed. 
+            Saved in Crawler/path/favicons.sqlite3
+        metrics (metrics.CrawlMetrics): The shared throughput, latency and error metrics of the process. 
+            Exported at the checkpoints to Crawler/path/metrics.prom (Prometheus text format) and Crawler/path/metrics.jsonl (one json line each time)
         custom_headers (dict): Used as the header for requests
-        timeout_in_seconds (int): The timeout value, that can increase during myfunctions.get_page if the server is too slow (each time by 1). 
-            If it reaches 20, the crawler will stop crawling the server. 
+        timeout_in_seconds (int): The shortest timeout for requests. Slow servers get more time and fewer requests from ratecontrol.HostRateController, 
+            which is shared by all requests of the process. 
         scheme_list (list): A list containing all the url schemes we want to visit
+        forward (function): Only used by the workers of coordinator.py: forward(url, depth) gives an url to the worker that owns it 
+            and returns True, or returns False if this crawler owns it. None if this crawler owns all urls
+        closed (bool): True after close was called
     """
 
-    def __init__(self, name, path : str, start_url : str = "",timeout : int = 2):
+    def __init__(self, name, path : str, start_url : str = "",timeout : int = 2, bloom_capacity : int = 0, priority : str = "depth", canonical_rules : dict = None):
         """
 
         Args: 
             name (str): The name used for custom_headers
             start_url (str): The url to start crawling from, if "" you have to give it to crawl() as an argument before you can start crawling
             timeout (int): The default value for timeout to reset timeout when switching to crawl a different server
+            bloom_capacity (int): If bigger than 0 the seen urls are kept in a Bloom filter for this many urls instead of a set
+            priority (str): Which url is visited next: "depth" (breadth first), "inlinks" (most linked first) or "opic" (most important first)
+            canonical_rules (dict): The arguments for canonical.UrlCanonicalizer (the "canonical" dict in website_dicts.py), default rules if None
         """
 
         #pattern to exclude in find_url
         self.find_re = re.compile(r'.*\.(img|jpg|png|pdf)')
         
-        self.url_stack_same_server = []
         if start_url:
             self.url_stack = [start_url,] # only used when crawling different servers too
         else:
@@ -50,11 +88,10 @@ class Crawler:
             os.makedirs("Crawler/" + path)
 
         self.urls_visited_path = "Crawler/" + path + "/urls_visited.txt"
-        self.urls_visited = []
+        self.urls_visited_count = 0
         if os.path.isfile(self.urls_visited_path):
             with open(self.urls_visited_path) as file:
-                for line in file:
-                    self.urls_visited.append(line.replace("\n", ""))
+                self.urls_visited_count = sum(1 for _ in file)
         else:
             with open(self.urls_visited_path, 'w') as file:
                 pass
@@ -69,65 +106,159 @@ class Crawler:
                     splitted = line.replace("\n", "").split(',')
                     self.urls_to_visit_update.append((splitted[0],datetime.strptime(splitted[1],'%y-%m-%d %H:%M:%S')))
 
-        self.urls_to_visit_update = []
-        self.url_stack_same_server_for_later = []
-
         self.timeout_in_seconds = timeout
 
         self.index = Index(name,"Index/" + path,timeout)
         self.preliminary_index = []
 
+        self.seen = SeenUrlStore("Crawler/" + path + "/urls_seen.bin", bloom_capacity)
+        if self.seen.is_new:
+            # first start with this store, so fill it with everything that is known already
+            with open(self.urls_visited_path) as file:
+                self.seen.add_many(line.replace("\n", "") for line in file)
+            self.seen.add_many(url for url, _ in self.urls_to_visit_update)
+            self.seen.add_many(self.index.all_urls())
+            self.seen.flush()
+
+        self.frontier = CrawlFrontier("Crawler/" + path + "/frontier.sqlite3", scorer=create_scorer(priority))
+        self.traps = TrapDetector("Crawler/" + path + "/traps.sqlite3")
+        if self.frontier.fetched:
+            # crashed before these pages where saved in the index, check which ones did not reach it
+            self.frontier.resolve_fetched(set(self.index.all_urls()))
+        self.seen.add_many(self.frontier.urls())
+        self.seen.flush()
+
+        self.fetch_log = FetchLog("Crawler/" + path + "/fetch_log.sqlite3")
+        self.scheduler = RecrawlScheduler(self.fetch_log)
+
+        self.near_duplicates = NearDuplicateIndex("Crawler/" + path + "/simhash.sqlite3")
+
+        self.archive = PageArchive("Crawler/" + path + "/archive")
+
         # custom headers to indicate, that I am a crawler (politeness)
         self.custom_headers = {'User-Agent': "CrawlerforSearchEnginge/" + name}
 
+        self.favicons = FaviconCache("Crawler/" + path + "/favicons.sqlite3", self.custom_headers, timeout)
+
+        self.closed = False
+
+        self.canonicalizer = UrlCanonicalizer.from_dict(canonical_rules)
+        self.canonical_stats_path = "Crawler/" + path + "/canonical_stats.json"
+
+        self.discovery = Discovery("Crawler/" + path + "/discovery.sqlite3", self.custom_headers, timeout, canonicalize=self.canonicalizer.canonicalize)
+
+        self.metrics = CrawlMetrics.get_instance()
+        self.metrics.set_output("Crawler/" + path + "/metrics.prom", "Crawler/" + path + "/metrics.jsonl")
+
         self.scheme_list = ["https", "http"] # requests only works with these
+        self.forward = None
 
     def save_urls_to_visit_update(self):
         """
         Writes self.urls_to_visit_update in a txt
         """
 
-        if self.urls_to_visit_update:
+        list_to_save = [url + "," + date.strftime('%y-%m-%d %H:%M:%S') + "\n" for url, date in self.urls_to_visit_update]
 
-            list_to_save = [url + "," + date.strftime('%y-%m-%d %H:%M:%S') + "\n" for url, date in self.urls_to_visit_update]
+        with open(self.urls_to_visit_update_path, 'w') as file:
+            file.writelines(list_to_save)
 
-            with open(self.urls_to_visit_update_path, 'w') as file:
-                file.writelines(list_to_save)
-                
-                    
-    def __del__(self):
+    def checkpoint(self, force = False):
+        """
+        Saves the crawl state to the disk, so the crawl can be resumed after a crash. 
+        Runs at most every frontier.checkpoint_seconds, unless force is True. The preliminary_index stays in memory, 
+        its urls are marked as fetched in the frontier and are visited again after a crash.
+        The metrics are exported every metrics.interval seconds. 
+
+        Args:
+            force (bool): checkpoint even if the last one was just now
         """
-        Saves the preliminary_index to the real index incase this object is destroyed before saving it itself.
+        self.metrics.set("crawler_frontier_size", len(self.frontier))
+        self.metrics.set("crawler_frontier_later", len(self.frontier.later))
+        self.metrics.set("crawler_seen_urls", len(self.seen))
+        if force:
+            self.metrics.export()
+        else:
+            self.metrics.maybe_export()
+
+        if force:
+            self.frontier.commit()
+        elif not self.frontier.maybe_commit():
+            return
+        self.seen.flush()
+        self.traps.commit()
+        self.near_duplicates.commit()
+        self.archive.commit()
+        self.save_urls_to_visit_update()
+
+    def close(self):
         """
+        Saves the preliminary_index to the index, waits until all changes of the index are committed and closes the files. 
+        Call it when the crawler is not needed anymore, before the interpreter exits (the writer service of the index is closed at exit). 
+        """
+        if self.closed:
+            return
+        self.closed = True
         if self.preliminary_index:
             self.pre_to_Index()
+        self.index.flush()
         self.save_urls_to_visit_update()
+        self.frontier.close()
+        self.fetch_log.close()
+        self.discovery.close()
+        self.near_duplicates.close()
+        self.archive.close()
+        self.favicons.close()
+        self.traps.close()
+        self.seen.close()
 
-    def append_same_server(self,url, depth):
+    def __del__(self):
+        """
+        Closes the crawler incase this object is destroyed before close was called. At the exit of the interpreter this may be too late
+        for the index, so close should be called before. 
         """
-        Appends a new url to the same server list. Please check beforehand if it really is the same server. 
-        It only checks whether the url already is in the list, whether it was already visited, or is in index or preliminary_index before appending it.
+        if not getattr(self, "closed", True):
+            self.close()
+
+    def append_same_server(self,url, depth, found_url = None):
+        """
+        Appends a new url to the same server list. Please check beforehand if it really is the same server and that the url is canonical. 
+        It only appends the url if it was never seen before (self.seen contains everything in the lists, visited, in the index or preliminary_index)
+        and robots.txt allows it. New urls that look like a crawler trap are not appended. Urls another worker owns are given to self.forward.
 
         Args:
-            url (string): The url to append
+            url (string): The canonical url to append
             depth (int): Will be increased by one
+            found_url (string): The url as it was found before canonicalization (for the stats of the canonicalizer)
+
+        Returns:
+            value (bool): True if the url was appended or given to another worker
         """
 
         if depth < 100: # depth limit
-            if (all(url != tpl[0] for tpl in self.url_stack_same_server)) and (all(url != tpl[0] for tpl in self.url_stack_same_server_for_later)) and (not url in self.urls_visited) and (not self.is_in_preliminary(url)) and (all(url != tpl[0] for tpl in self.urls_to_visit_update)) and (not self.index.is_in_index(url)):
-                self.url_stack_same_server.append((url, depth + 1))
+            if self.forward is not None and self.forward(url, depth):
+                return True
+            if not self.discovery.allowed(url):
+                return False
+            new = self.seen.add(url)
+            if found_url is not None:
+                self.canonicalizer.record(found_url, url, new)
+            if new and not self.traps.is_trap(url):
+                self.frontier.push(url, depth + 1)
+                return True
+        return False
 
     def append_url(self,url):
         """
         Appends a new url to the url_stack. 
-        It only checks whether the url already is in the list, whether it was already visited, or is in index or preliminary_index before appending it.
+        It only appends the url if it was never seen before.
 
         Args:
             url (string): The url to append
         """
 
-        if (not url in self.url_stack) and (not url in self.urls_visited) and (not self.is_in_preliminary(url)) and (url != tpl[0] for tpl in  self.urls_to_visit_update) and (not self.index.is_in_index(url)):
-            self.url_stack_.append(url)
+        if self.seen.add(url):
+            self.url_stack.append(url)
 
     def pre_to_Index(self):
         """
@@ -135,14 +266,38 @@ class Crawler:
         """
 
         self.index.list_to_Index(self.preliminary_index)
+        self.frontier.mark_indexed([url for _, url, _, _ in self.preliminary_index])
         self.preliminary_index = []
+        self.seen.flush()
     
-    def find_url(self,soup, original_url, depth, original_url_parsed = None,):
+    def add_visited(self, url):
         """
-        Finds all urls in a given soup object
+        Saves an url that was visited but is not relevant for the index (not html, error or near-duplicate), so it is not visited again
 
         Args:
-            soup (bs4.BeautifulSoup): the data to search in
+            url (str): The url
+        """
+        self.urls_visited_count += 1
+        with open(self.urls_visited_path, 'a') as file:
+            file.write(url + "\n")
+
+    def delete_page(self, url):
+        """
+        Deletes a page from the index and forgets its fingerprint and its archived version
+
+        Args:
+            url (str): The url of the page
+        """
+        self.index.delete_from_index(url)
+        self.near_duplicates.remove(url)
+        self.archive.remove(url)
+
+    def find_url(self,record, original_url, depth, original_url_parsed = None,):
+        """
+        Finds all urls in the links of a page
+
+        Args:
+            record (extract.PageRecord): the page with the hrefs of all its <a> tags in outlinks
             original_url (string): the url where the data is from (used to create full urls from relative ones)
             depth (int): 
             original_url_parsed (urllib.parse.ParseResult): the same url as in original_url but already parsed (if not given it is created)
@@ -151,36 +306,63 @@ class Crawler:
         if not original_url_parsed:
             original_url_parsed = urlparse(original_url)
 
+        links = [] # all links to the same server
+
         # analyse it to find other urls, 
-        for l in soup.find_all("a"):
+        for link in record.outlinks:
+
+            # check if it is an linked image
+            if not self.find_re.search(link):
+                parsed_link = urlparse(link, allow_fragments=False)
 
-            # check if it is an linked image or does not contain an href
-            if not self.find_re.search(l.get('href', '')):
-                # print(l, "\n\n\n")
-                try: # try if href
-                    link = l['href'] # get just the href part
-                    parsed_link = urlparse(link, allow_fragments=False)
+                # check wether the link is a relative link
+                if (not parsed_link.scheme) and (not parsed_link.netloc):
 
-                    # check wether the link is a relative link
-                    if (not parsed_link.scheme) and (not parsed_link.netloc):
+                    # join original url with relative one
+                    links.append(urljoin(original_url,link))
 
-                        # join original url with relative one
-                        full_url = urljoin(original_url,link)
-                        self.append_same_server(full_url, depth)
+                # if not relative check whether kind of info we want
+                elif parsed_link.scheme in self.scheme_list:
 
-                    # if not relative check whether kind of info we want
-                    elif parsed_link.scheme in self.scheme_list:
+                    # check whether it is from the same website
+                    if parsed_link.netloc == original_url_parsed.netloc:
+                        links.append(parsed_link.geturl())
+                    else:
+                        pass # because task is to crawl only one server
+                        #self.append_url(parsed_link.geturl())
 
-                        # check whether it is from the same website
-                        if parsed_link.netloc == original_url_parsed.netloc:
-                            self.append_same_server(parsed_link.geturl(), depth)
-                        else:
-                            pass # because task is to crawl only one server
-                            #self.append_url(parsed_link.geturl())
+        # the same page is often linked with different urls (case, index.html, parameters, ...)
+        canonical_links = [(self.canonicalizer.canonicalize(link), link) for link in links]
 
-                except KeyError as e:
-                    # does not have an href
-                    print("KeyError, there was no href: ", l)
+        # the priorities of the waiting urls can change with every page (e.g. more inlinks)
+        self.frontier.links_found(original_url, [link for link, _ in canonical_links])
+        for link, found_url in canonical_links:
+            self.append_same_server(link, depth, found_url)
+
+    def discover(self, url):
+        """
+        Adds the urls from the sitemaps of the host of url to the frontier, the ones robots.txt does not allow are left out. 
+        The sitemaps are only read again after discovery.max_age. 
+
+        Args:
+            url (str): any url on the host
+
+        Returns:
+            count (int): How many new urls where added
+        """
+
+        host = urlparse(url).netloc
+        entries = self.discovery.sitemap_entries(url)
+        urls = [u for u, _ in entries if urlparse(u).netloc == host and self.discovery.allowed(u)]
+        if self.forward is not None: # the urls another worker owns are given to it
+            urls = [u for u in urls if not self.forward(u, 0)]
+        new_urls = self.seen.add_many(urls)
+        for new_url in new_urls:
+            self.frontier.push(new_url, 1)
+
+        if entries:
+            print(f"Found {len(entries)} urls in the sitemaps of {host}, {len(new_urls)} of them are new")
+        return len(new_urls)
 
     def crawl_all(self, start_url = ""):
         """
@@ -194,7 +376,6 @@ class Crawler:
 
         counter = 0
         start = time.time()
-        self.empty_crawling_lists()
 
         if start_url:
             self.url_stack.append(start_url)
@@ -204,61 +385,208 @@ class Crawler:
             counter = self.crawl(self.url_stack.pop(-1),start, counter)
             self.timeout_in_seconds = self.timeout_default
 
-    def crawl(self, start_url = "", batch = 20, start = time.time(), counter = 0):
+    def crawl(self, start_url = "", batch = 100, start = time.time(), counter = 0, max_pages = None):
         """
         crawls all websites that can be reached from a start_url on the same server. 
         This is done so the list of webpages to go does not become too long. 
+        If the last crawl was stopped before it was done, it continues where it stopped. 
+        The start_url is only visited if it was never seen before. The urls in the sitemaps of the server are added too. 
 
         Args:
             start_url (str): a string containing an url
             batch (int): After how many webpages to update the index
             start (time.Time): The starting time to calculate the running time
             counter (int): How many webpages where already crawled in this run (will be increased during this method)
+            max_pages (int): If given, stop after requesting that many pages, the rest stays in the frontier for the next crawl
         """
 
-        # self.url_stack_same_server = []
         if start_url:
-            self.url_stack_same_server.append((start_url,0))
-        self.url_stack_same_server_for_later = [] # used so save urls where the server is too slow or returns 503 to check again later
+            start_url = self.canonicalizer.canonicalize(start_url)
+            if self.discovery.allowed(start_url) and self.seen.add(start_url):
+                self.frontier.push(start_url,0)
+            self.discover(start_url)
+
+        budget = float("inf") if max_pages is None else max_pages
 
         # while the stack is not empty
-        while self.url_stack_same_server:
+        while self.frontier and budget > 0:
+            budget -= 1
 
             # take and remove first url from list
-            next_url, depth = self.url_stack_same_server.pop(-1)
-
-            # to not overwhelm the server wait before request again (politeness)
-            time.sleep(self.timeout_in_seconds / 2)
+            next_url, depth = self.frontier.pop()
 
+            # to not overwhelm the server, request_url waits for the HostRateController (politeness)
             counter += self.crawl_page(next_url, depth, True, start,counter) # return 1 if added to index / preliminary index
 
             if len(self.preliminary_index) >= batch:
                 self.pre_to_Index()
+            self.checkpoint()
 
-        self.url_stack_same_server.extend(self.url_stack_same_server_for_later)
+        # the urls where the server is too slow or returned 503
+        self.frontier.retry_later()
 
         # crawl server one more time, then add rest of ...for_later to for next_update
 
         # while the stack is not empty
-        while self.url_stack_same_server:
+        while self.frontier and budget > 0:
+            budget -= 1
 
             # take and remove first url from list
-            next_url = self.url_stack_same_server.pop(-1)
-
-            # to not overwhelm the server wait before request again (politeness)
-            time.sleep(self.timeout_in_seconds / 2)
+            next_url, depth = self.frontier.pop()
 
-            counter += self.crawl_page(True, next_url, depth, start,counter) # return 1 if added to index / preliminary index
+            counter += self.crawl_page(next_url, depth, True, start,counter) # return 1 if added to index / preliminary index
 
             if len(self.preliminary_index) >= batch:
                 self.pre_to_Index()
+            self.checkpoint()
+
+        self.finish_crawl()
+
+        return counter
+
+    def finish_crawl(self):
+        """
+        Saves the rest of the preliminary_index to the index and remembers the urls that could not be crawled for the next update
+        """
 
         self.pre_to_Index()
 
         # save rest for next index update
         date = datetime.utcnow()
-        self.urls_to_visit_update.extend([(u,date) for u,_ in self.url_stack_same_server_for_later])
+        self.urls_to_visit_update.extend([(u,date) for u,_ in self.frontier.later])
         self.save_urls_to_visit_update()
+        self.frontier.take_later()
+        self.checkpoint(force = True)
+
+        if self.traps.traps:
+            print(f"Skipped {self.traps.traps} urls that looked like crawler traps")
+
+        stats = self.canonicalizer.stats()
+        print(f"Canonicalization: {stats['variants']} different non canonical urls found, {stats['fetches_saved']} fetches saved")
+        self.canonicalizer.save_stats(self.canonical_stats_path)
+
+    def crawl_concurrent(self, start_url = "", batch = 100, max_in_flight = 16, host_rate = 4.0, processes = None, start = None, counter = 0):
+        """
+        crawls the same pages as crawl, but as a pipeline of stages that run at the same time: 
+        threads download up to max_in_flight pages, a pool of processes parses them and extracts the links, 
+        and one writer thread saves the batches in the whoosh index. 
+        Every request waits for the shared ratecontrol.HostRateController (politeness), which changes the rate of each host
+        to how it answers, so the pages per second grow with max_in_flight until the rate of the server (at most host_rate) is reached. 
+
+        Args:
+            start_url (str): a string containing an url
+            batch (int): After how many webpages to update the index
+            max_in_flight (int): How many requests may run at the same time in total
+            host_rate (float): How many requests per second are sent to one host at most, None to keep the limit of the HostRateController
+            processes (int): How many processes parse the pages, all cores if None, 0 to parse in the download threads
+            start (float): The starting time to calculate the running time, now if None
+            counter (int): How many webpages where already crawled in this run (will be increased during this method)
+
+        Returns:
+            counter (int): How many webpages where added to the index
+        """
+
+        if start is None:
+            start = time.time()
+        if start_url:
+            start_url = self.canonicalizer.canonicalize(start_url)
+            if self.discovery.allowed(start_url) and self.seen.add(start_url):
+                self.frontier.push(start_url,0)
+            self.discover(start_url)
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        if host_rate:
+            HostRateController.get_instance().limit_rate(host_rate)
+        writer = IndexWriterStage(self.index, self.frontier.mark_indexed)
+        writer.start()
+        try:
+            with futures.ThreadPoolExecutor(max_workers=max_in_flight) as io_executor:
+                parse_executor = futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) if processes else None
+                try:
+                    counter = asyncio.run(self._crawl_concurrent_pass(io_executor, parse_executor, writer, batch, max_in_flight, processes, start, counter))
+
+                    # crawl the pages where the server was too slow one more time, then add the rest to for next_update
+                    self.frontier.retry_later()
+                    counter = asyncio.run(self._crawl_concurrent_pass(io_executor, parse_executor, writer, batch, max_in_flight, processes, start, counter))
+                finally:
+                    if parse_executor:
+                        parse_executor.shutdown()
+        finally:
+            writer.close()
+
+        self.finish_crawl()
+
+        return counter
+
+    async def _crawl_concurrent_pass(self, io_executor, parse_executor, writer, batch, max_in_flight, processes, start, counter):
+        """
+        Crawls until the frontier is empty and no page is in the pipeline anymore. 
+        Downloads run in the threads of io_executor, parsing in parse_executor, writing in writer. 
+        Everything else runs in the event loop, so preliminary_index is only changed by one thread here. 
+        The frontier is changed by the writer thread too (frontier.mark_indexed after a batch was saved), so it needs its lock. 
+        The number of pages in the pipeline is limited by max_in_flight, so downloading waits if parsing or writing is too slow. 
+
+        Args:
+            io_executor (concurrent.futures.ThreadPoolExecutor): The threads used for downloading
+            parse_executor (concurrent.futures.ProcessPoolExecutor): The processes used for parsing, if None the io_executor parses too
+            writer (pipeline.IndexWriterStage): The stage that saves the batches in the index
+            batch (int): After how many webpages to update the index
+            max_in_flight (int): How many pages may be downloaded or parsed at the same time
+            processes (int): How many processes are in parse_executor
+            start (float): The starting time to calculate the running time
+            counter (int): How many webpages where already crawled in this run
+
+        Returns:
+            counter (int): counter increased by the pages added to the index
+        """
+
+        loop = asyncio.get_running_loop()
+        parse_slots = asyncio.Semaphore(2 * max(processes, 1)) # the queue in front of the parsing processes
+
+        async def process(url, depth):
+            code, response = await loop.run_in_executor(io_executor, fetch_page, url, self.timeout_in_seconds, self.custom_headers, True)
+            if code != 1:
+                return url, depth, (code, None, None, None)
+
+            if parse_executor:
+                async with parse_slots:
+                    started = time.monotonic() # with sending the page to the process and the record back
+                    record = await loop.run_in_executor(parse_executor, extract_page, response.content, url, page_encoding(response))
+            else:
+                started = time.monotonic()
+                record = await loop.run_in_executor(io_executor, parse_page, response, url)
+            self.metrics.observe("crawler_parse_seconds", time.monotonic() - started)
+
+            if record is None:
+                return url, depth, (0, None, None, None)
+            # compressing and writing the archive and the /favicon.ico request of a new host would block the loop
+            await loop.run_in_executor(io_executor, self.archive.append, url, response)
+            page = await loop.run_in_executor(io_executor, self.with_favicon, url, (1, record) + page_validators(response))
+            return url, depth, page
+
+        running = set()
+        while self.frontier or running:
+
+            # fill up the free places with new requests
+            while self.frontier and len(running) < max_in_flight:
+                next_url, depth = self.frontier.pop()
+                running.add(asyncio.ensure_future(process(next_url, depth)))
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                next_url, depth, page = task.result()
+                counter += self.handle_page(next_url, depth, page, True, start, counter)
+
+            if len(self.preliminary_index) >= batch:
+                # blocks only this loop if the writer is still busy with older batches
+                pages, self.preliminary_index = self.preliminary_index, []
+                await loop.run_in_executor(None, writer.submit, pages)
+            self.checkpoint()
+
+        writer.submit(self.preliminary_index)
+        self.preliminary_index = []
 
         return counter
     
@@ -279,43 +607,115 @@ class Crawler:
 
         # print information
         if printing:
-            len_all_visited = len(self.urls_visited) + counter
-            len_togo = len(self.url_stack_same_server) + len(self.url_stack_same_server_for_later)
-            if len_all_visited > 0:
-                time_estimation = ((time.time() - start ) /len_all_visited) * len_togo
-            else: 
-                time_estimation = self.timeout_in_seconds
-            print(f"Total: {len_all_visited } from {len_all_visited+len_togo} of this server; {self.convert_time(time.time() - start)}")
-            print(f"Estimated time left for {len_togo} pages: {self.convert_time(time_estimation)}")
-
-        # if not visited recently
-        #if next_url not in self.urls_visited and not self.index.is_in_index(next_url) and not self.is_in_preliminary(next_url):
+            self.print_progress(start, counter)
 
         # get page
-        code, soup = get_page(next_url,self.timeout_in_seconds,self.custom_headers, True)
-        print("current depth: ", depth)
+        page = self.with_favicon(next_url, self.fetch(next_url))
+        return self.handle_page(next_url, depth, page, printing)
+
+    def fetch(self, url, etag = None, last_modified = None):
+        """
+        Downloads and parses one page. If etag or last_modified are given the request is conditional. 
+
+        Args:
+            url (str): The url of the page
+            etag (str): The ETag of the version in the index
+            last_modified (str): The Last-Modified header of the version in the index
+
+        Returns:
+            code (int): 1 for successful, 0 for was not html or not ok, -1 for server is too slow, 503 for 503, 304 for not modified
+            record (extract.PageRecord): The title, text, links and favicon of the webpage if code = 1
+            etag (str): The ETag header of the response if code = 1
+            last_modified (str): The Last-Modified header of the response if code = 1
+        """
+
+        code, response = fetch_page(url, self.timeout_in_seconds, self.custom_headers, True, etag, last_modified)
+        if code != 1:
+            return code, None, None, None
+
+        started = time.monotonic()
+        record = parse_page(response, url)
+        self.metrics.observe("crawler_parse_seconds", time.monotonic() - started)
+        if record is None:
+            return 0, None, None, None
+        self.archive.append(url, response)
+        return (1, record) + page_validators(response)
+
+    def with_favicon(self, url, page):
+        """
+        Sets the favicon of a fetched page to the one of favicons.FaviconCache, for a new host this may request /favicon.ico
+
+        Args:
+            url (str): The url of the page
+            page (tuple): The tuple returned by fetch (code, record, etag, last_modified)
+
+        Returns:
+            page (tuple): The same tuple with the favicon in the record if code = 1
+        """
+        code, record, etag, last_modified = page
+        if code != 1:
+            return page
+        return code, record._replace(favicon=self.favicons.resolve(url, record.favicon)), etag, last_modified
+
+    def handle_page(self, next_url, depth, page, printing = True, start = None, counter = 0):
+        """
+        Saves the result of fetch for one page. Used by crawl_page and crawl_concurrent. 
+
+        Args:
+            next_url (str): The url of the page
+            depth (int): 
+            page (tuple): The tuple returned by fetch (code, record, etag, last_modified), the favicon already resolved by with_favicon
+            printing (bool): Whether to print some information in the terminal
+            start (float): The start time of the crawling algorithm, if given the progress is printed
+            counter (int): Used for printing only. How many webpages where already visited
+
+        Returns:
+            counter_add (int): 1 if new page added to index, else 0
+        """
+
+        if printing and start is not None:
+            self.print_progress(start, counter)
+        if printing:
+            print("current depth: ", depth)
+
+        code, record, etag, last_modified = page
 
         if code == 1:
-            # update index
-            self.preliminary_index.append((soup,next_url))
-            
             # finds all urls and saves the ones we want to visit in the future
             if depth < 100: # depth limit, do not even search for more links
-                self.find_url(soup, next_url, depth, urlparse(next_url))
+                self.find_url(record, next_url, depth, urlparse(next_url))
+
+            # the same content under another url (print view, language switch, session id) is not indexed again
+            canonical = self.near_duplicates.check(next_url, record.title, record.text)
+            if canonical is not None:
+                if printing:
+                    print("Near-duplicate of ", canonical)
+                self.metrics.inc("crawler_pages_total", ("duplicate",))
+                self.archive.remove(next_url)
+                self.add_visited(next_url)
+                self.frontier.mark_done(next_url)
+                return 0
+
+            # update index
+            self.metrics.inc("crawler_pages_total", ("indexed",))
+            self.preliminary_index.append((record,next_url,etag,last_modified))
+            self.frontier.mark_fetched(next_url, depth)
             return 1 
         elif code == -1: # if the server is too slow
             if printing:
                 print("The server of: ", next_url, " is too slowly.")
                 print("The crawler will stop to crawl this page now.")
-            self.url_stack_same_server_for_later.append((next_url, depth))
+            self.metrics.inc("crawler_pages_total", ("later",))
+            self.frontier.push_later(next_url, depth)
         elif code == 503:
-            self.url_stack_same_server_for_later.append((next_url, depth))
+            self.metrics.inc("crawler_pages_total", ("later",))
+            self.frontier.push_later(next_url, depth)
         else: # if 0 then the returns where not html or not ok code
             # update visited list
             # add errors and not html so they are not visited again. 
-            self.urls_visited.append(next_url)
-            with open(self.urls_visited_path, 'a') as file:
-                file.write(next_url + "\n")
+            self.metrics.inc("crawler_pages_total", ("skipped",))
+            self.add_visited(next_url)
+            self.frontier.mark_done(next_url)
 
         return 0
 
@@ -323,84 +723,247 @@ class Crawler:
         """
         crawls pages again to get new information to make the index up to date
         https://docs.python.org/3/library/threading.html#rlock-objects
+        The requests are conditional (ETag / Last-Modified saved in the index), and a page is only written to the index again 
+        if the server did not answer 304 and its content hash changed. Pages checked in the last age_in_days days are skipped. 
+        The sitemaps are read first: pages whose lastmod is newer than the index are checked first, pages whose lastmod is older are skipped 
+        and pages robots.txt does not allow anymore are deleted from the index. Pages with a non canonical url are replaced by the canonical url. 
+        The new urls found in the checked pages are queued in the frontier and crawled once after all checks. 
+        The changes of the index are committed in batches by writerservice.IndexWriterService, at the end they are flushed. 
 
         Args:
             age_in_days (int): Information that is older than that will be updated
+            limit (int): How many pages to check at most
         """
 
-        urls_to_update = []
-        limit_2 = int(limit/2)
-        if len(self.urls_to_visit_update) < (limit_2):
-            urls_to_update = self.urls_to_visit_update.copy() + self.index.find_old(age_in_days,int(limit-len(self.urls_to_visit_update)))
-            self.urls_to_visit_update = []
-        else:
-            urls_to_update = self.urls_to_visit_update[:limit_2] + self.index.find_old(age_in_days,(limit_2))
-            self.urls_to_visit_update = self.urls_to_visit_update[limit_2:]
+        lastmods = self.rediscover()
+
+        threshold = datetime.utcnow() - timedelta(days=age_in_days)
+        # skip pages that were checked recently or did not change since they were indexed according to the sitemap
+        skip = lambda url, date: self.fetch_log.checked_since(url, threshold) or (url in lastmods and lastmods[url] <= date)
+        # pages that changed according to the sitemap first, then the oldest ones
+        priority = lambda url, date: (0, date) if url in lastmods else (1, date)
+
+        urls_to_update = self.take_urls_to_visit_update(limit)
+        urls_to_update += self.index.find_old(age_in_days, limit - len(urls_to_update), skip, priority)
 
-        self.empty_crawling_lists()
         self.url_stack = []
 
+        validators = self.index.find_validators([url for url, _ in urls_to_update])
+
         for next_url,next_date in urls_to_update:
-            print(f"Page: {next_url} is from {next_date.date()}")
-            code, soup = get_page(next_url,self.timeout_in_seconds,self.custom_headers, True)
-
-            if code == 1:
-                # update index
-                self.index.update_index(next_url,soup)
-                
-                # finds all urls and saves the ones we want to visit in the future
-                self.find_url(soup,next_url,0, urlparse(next_url))
-                
-            elif code == -1: # if the server is too slow
-
-                # if older than half a year delete & forget
-                if next_date < datetime.utcnow() - timedelta(days=183): # the older one is smaller
-                    self.index.delete_from_index(next_url)
+            self.update_page(next_url, next_date, validators.get(next_url, (None, None, None)))
+            self.checkpoint()
 
-                # if not old, but not in index add to list to remember
-                elif not self.index.is_in_index(next_url):
-                    # save with the original date to check again next time
-                    self.urls_to_visit_update.append((next_url,next_date))
+        # now crawl the new urls that where found in all checked pages, finish_crawl runs once at the end of it
+        self.crawl()
 
-            elif code == 503: # Service Unavailable
+        self.index.flush()
 
-                self.index.delete_from_index(next_url)
-                if next_date > datetime.utcnow() - timedelta(days=365): # if older than one year
-                    self.urls_to_visit_update.append((next_url,next_date))
+    def recrawl(self, limit):
+        """
+        Checks the limit pages that most likely changed since they were checked the last time (see recrawl.RecrawlScheduler) 
+        like crawl_updates does, and crawls the new urls that were found in these pages. Meant to be called again and again with small limits 
+        (IndexUpdateDaemon does this), so the index is updated during the whole day instead of in one big update. 
+        The new urls are crawled with what is left of limit, so one call never requests more than limit pages. 
+        The ones that are left stay in the frontier and are crawled by the next calls. 
+
+        Args:
+            limit (int): How many pages to request at most
+
+        Returns:
+            count (int): How many pages were checked
+        """
+
+        self.scheduler.refresh(self.rediscover())
+
+        urls_to_update = self.take_urls_to_visit_update(limit)
+        urls_to_update += self.index.find_old(-1, limit - len(urls_to_update), self.scheduler.skip, self.scheduler.priority)
+
+        validators = self.index.find_validators([url for url, _ in urls_to_update])
+        for next_url,next_date in urls_to_update:
+            self.update_page(next_url, next_date, validators.get(next_url, (None, None, None)))
+
+        remaining = limit - len(urls_to_update)
+        if self.frontier and remaining > 0:
+            self.crawl(max_pages = remaining)
+        else:
+            self.checkpoint(force = True)
+        self.index.flush()
+
+        return len(urls_to_update)
+
+    def rediscover(self):
+        """
+        Reads the sitemaps of all known hosts again (only if they were not read within discovery.max_age), new urls are added to the frontier
+
+        Returns:
+            lastmods (dict): url (str) -> lastmod (datetime.datetime) of all sitemap urls, they tell which pages changed
+        """
+        for origin in self.discovery.origins():
+            self.discover(origin + "/")
+        return self.discovery.lastmods()
+
+    def take_urls_to_visit_update(self, limit):
+        """
+        Removes the urls that could not be checked last time from urls_to_visit_update, at most half of limit
+
+        Args:
+            limit (int): How many pages will be checked
+
+        Returns:
+            urls (list): tuples (url (str), date (datetime.datetime))
+        """
+        limit_2 = int(limit/2)
+        taken, self.urls_to_visit_update = self.urls_to_visit_update[:limit_2], self.urls_to_visit_update[limit_2:]
+        return taken
+
+    def update_page(self, next_url, next_date, validator):
+        """
+        Checks one page of the index again. Used by crawl_updates and recrawl. 
+        Every check is added to the change history in fetch_log. 
+
+        Args:
+            next_url (str): The url of the page
+            next_date (datetime.datetime): The date of the page in the index (or when it was found, if it could not be checked last time)
+            validator (tuple): (etag, last_modified, content_hash) from index.Index.find_validators
+        """
+        print(f"Page: {next_url} is from {next_date.date()}")
+
+        if not self.discovery.allowed(next_url): # robots.txt does not allow it anymore
+            print("Not allowed by robots.txt")
+            self.delete_page(next_url)
+            return
+
+        canonical = self.canonicalizer.canonicalize(next_url)
+        if canonical != next_url: # found before the urls where canonicalized
+            # only replaced if the canonical url is indexed or will be crawled, else the page is checked under its old url
+            if self.index.is_in_index(canonical) or self.append_same_server(canonical, 0, next_url):
+                print("Replaced by ", canonical)
+                self.delete_page(next_url)
+                return
+
+        etag, last_modified, old_hash = validator
+        code, record, new_etag, new_last_modified = self.fetch(next_url, etag, last_modified)
+
+        if code == 304: # Not Modified, the index is still up to date
+            print("Not modified")
+            self.metrics.inc("crawler_pages_total", ("not_modified",))
+            self.fetch_log.record_check(next_url, changed=False, previous=next_date)
+
+        elif code == 1:
+            # update index only if the content changed
+            if old_hash == content_hash(record.title, record.text):
+                print("Content did not change")
+                self.metrics.inc("crawler_pages_total", ("unchanged",))
+                self.fetch_log.record_check(next_url, changed=False, previous=next_date)
+            else:
+                canonical = self.near_duplicates.check(next_url, record.title, record.text)
+                if canonical is None:
+                    self.metrics.inc("crawler_pages_total", ("updated",))
+                    record = record._replace(favicon=self.favicons.resolve(next_url, record.favicon))
+                    self.index.update_index(next_url,record,new_etag,new_last_modified)
+                else: # the page is a near-duplicate of another page now
+                    print("Near-duplicate of ", canonical)
+                    self.metrics.inc("crawler_pages_total", ("duplicate",))
+                    self.index.delete_from_index(next_url)
+                    self.archive.remove(next_url)
+                # without a saved hash (indexed before it was saved) it is not known whether the page changed
+                self.fetch_log.record_check(next_url, changed=True if old_hash is not None else None, previous=next_date)
             
-            else: # if not html or just not working forget
-                self.urls_visited.append(next_url)
-                with open(self.urls_visited_path, 'a') as file:
-                    file.writelines([next_url])
-                self.index.delete_from_index(next_url)
+            # finds all urls and saves the ones we want to visit in the future
+            self.find_url(record,next_url,0, urlparse(next_url))
+            
+        elif code == -1: # if the server is too slow
 
-            # now do a quick crawl though the new urls that where found: 
-            self.crawl()
-            # self.crawl_all()
+            # if older than half a year delete & forget
+            if next_date < datetime.utcnow() - timedelta(days=183): # the older one is smaller
+                self.delete_page(next_url)
 
-    def is_in_preliminary(self,url):
+            # if not old, but not in index add to list to remember
+            elif not self.index.is_in_index(next_url):
+                # save with the original date to check again next time
+                self.urls_to_visit_update.append((next_url,next_date))
+
+        elif code == 503: # Service Unavailable
+
+            self.delete_page(next_url)
+            if next_date > datetime.utcnow() - timedelta(days=365): # if older than one year
+                self.urls_to_visit_update.append((next_url,next_date))
+        
+        else: # if not html or just not working forget
+            self.add_visited(next_url)
+            self.delete_page(next_url)
+
+    def rebuild_index(self, processes = None, batch = 500):
         """
-        checks whether there is a tuple with url in self.preliminary_index
+        Builds the whoosh index again from the archive without downloading anything, e.g. after the schema or the analyzer 
+        in index.Index changed. The archive files are read from the start to the end and parsed by a pool of processes. 
+        Pages that are in the old index but not in the archive (crawled before there was an archive) are checked by the next update. 
 
         Args:
-            url (str): The url to search for
+            processes (int): How many processes parse the pages, all cores if None, 0 to parse in this process
+            batch (int): How many pages are parsed at once
 
         Returns:
-            value (bool): True if url is in self.preliminary_index else False
+            count (int): How many pages are in the new index
         """
 
-        for _, url2 in self.preliminary_index:
-            if url == url2:
-                return True
-        return False
-    
-    def empty_crawling_lists(self):
-        """ 
-        Empty all lists that are used during one of the crawling algorithms
+        if processes is None:
+            processes = os.cpu_count() or 1
+        old_urls = set(self.index.all_urls())
+        archived = set()
+
+        def parse(pages, executor):
+            args = ([p.body for p in pages], [p.url for p in pages], [headers_encoding(p.headers) for p in pages])
+            records = executor.map(extract_page, *args, chunksize=16) if executor else map(extract_page, *args)
+            # nothing is downloaded, so hosts without a known favicon get none
+            entries = [(record._replace(favicon=self.favicons.resolve(p.url, record.favicon, download=False)), p.url, p.fetched,
+                        p.headers.get("ETag"), p.headers.get("Last-Modified"))
+                       for p, record in zip(pages, records) if record is not None]
+            archived.update(url for _, url, _, _, _ in entries)
+            print(f"Parsed {len(archived)} archived pages")
+            return entries
+
+        def batches():
+            executor = futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) if processes else None
+            try:
+                pages = []
+                for page in self.archive.pages():
+                    pages.append(page)
+                    if len(pages) >= batch:
+                        yield parse(pages, executor)
+                        pages = []
+                yield parse(pages, executor)
+            finally:
+                if executor:
+                    executor.shutdown()
+
+        count = self.index.rebuild(batches())
+
+        missing = old_urls - archived
+        if missing:
+            date = datetime.utcnow()
+            self.urls_to_visit_update.extend((url, date) for url in missing)
+            self.save_urls_to_visit_update()
+        print(f"Rebuilt the index with {count} pages from the archive, {len(missing)} pages that are not archived will be checked by the next update")
+        return count
+
+    def print_progress(self, start, counter):
         """
-        self.url_stack_same_server = []
-        self.url_stack_same_server_for_later = []
-        self.preliminary_index = []
+        Prints how many pages are done and an estimation of how long the rest will take
+
+        Args:
+            start (float): The start time of the crawling algorithm
+            counter (int): How many webpages where already visited in this run
+        """
+        len_all_visited = self.urls_visited_count + counter
+        len_togo = len(self.frontier) + len(self.frontier.later)
+        if len_all_visited > 0:
+            time_estimation = ((time.time() - start ) /len_all_visited) * len_togo
+        else: 
+            time_estimation = self.timeout_in_seconds
+        print(f"Total: {len_all_visited } from {len_all_visited+len_togo} of this server; {self.convert_time(time.time() - start)}")
+        print(f"Estimated time left for {len_togo} pages: {self.convert_time(time_estimation)}")
 
     def convert_time(self,time):
         """
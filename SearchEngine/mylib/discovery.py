@@ -0,0 +1,261 @@
+""" Reads robots.txt and the sitemaps of a host, so the crawler knows what it may visit and finds urls without following links """
+
+import gzip
+import sqlite3
+import threading
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from mylib.myfunctions import request_url
+from mylib.httpsession import ResponseTooLarge
+from mylib.ratecontrol import HostRateController
+
+class Discovery:
+    """
+    Caches the robots.txt of every host (with its Crawl-delay) and the urls and lastmod dates of its sitemaps in an SQLite database,
+    so they are only downloaded again after max_age. The Crawl-delay is given to the HostRateController, so no request is sent faster.
+
+    Attributes:
+        path (str): The SQLite file
+        custom_headers (dict): Used as the header for requests
+        user_agent (str): The User-Agent that robots.txt is checked for
+        timeout_in_seconds (int): The shortest timeout for requests
+        max_age (datetime.timedelta): After which time robots.txt and the sitemaps are downloaded again
+        max_sitemaps (int): How many sitemap files are read at most for one host (sitemap indexes can link to many)
+        retry_unreachable (datetime.timedelta): After which time robots.txt of a host that could not be reached is tried again
+        canonicalize (function): Used for all urls from the sitemaps
+        policies (dict): origin (str, scheme://netloc) -> (urllib.robotparser.RobotFileParser, datetime.datetime until when it is used)
+    """
+
+    def __init__(self, path : str, custom_headers : dict, timeout_in_seconds : int = 2, max_age_in_days : float = 1, max_sitemaps : int = 50, canonicalize = None):
+        """
+        Args:
+            path (str): The SQLite file
+            custom_headers (dict): Used as the header for requests
+            timeout_in_seconds (int): The shortest timeout for requests
+            max_age_in_days (float): After how many days robots.txt and the sitemaps are downloaded again
+            max_sitemaps (int): How many sitemap files are read at most for one host
+            canonicalize (function): Used for all urls from the sitemaps (e.g. canonical.UrlCanonicalizer.canonicalize), the urls stay as they are if None
+        """
+        self.path = path
+        self.custom_headers = custom_headers
+        self.user_agent = custom_headers.get("User-Agent", "*")
+        self.timeout_in_seconds = timeout_in_seconds
+        self.max_age = timedelta(days=max_age_in_days)
+        self.max_sitemaps = max_sitemaps
+        self.canonicalize = canonicalize or (lambda url: url)
+        self.retry_unreachable = timedelta(minutes=10)
+        self.policies = {}
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS robots (origin TEXT PRIMARY KEY, body TEXT NOT NULL, fetched TEXT NOT NULL, sitemaps_read TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS lastmod (url TEXT PRIMARY KEY, lastmod TEXT)")
+        self.connection.commit()
+
+    @staticmethod
+    def origin(url):
+        """
+        Args:
+            url (str): any url
+
+        Returns:
+            origin (str): scheme://netloc of the url
+        """
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def origins(self):
+        """ All origins whose robots.txt is saved """
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT origin FROM robots")]
+
+    def policy(self, url):
+        """
+        Get the parsed robots.txt of the host of url. It is downloaded if it is not saved or older than max_age.
+        If the server answers 4xx there are no rules. If it can not be reached everything is allowed for now, but it is not saved,
+        so it is tried again after retry_unreachable.
+
+        Args:
+            url (str): any url on the host
+
+        Returns:
+            parser (urllib.robotparser.RobotFileParser): The rules of the host
+        """
+        origin = self.origin(url)
+        now = datetime.utcnow()
+        if origin in self.policies and self.policies[origin][1] > now:
+            return self.policies[origin][0]
+
+        with self.lock:
+            row = self.connection.execute("SELECT body, fetched FROM robots WHERE origin = ?", (origin,)).fetchone()
+
+        if row and datetime.fromisoformat(row[1]) > now - self.max_age:
+            body = row[0]
+            valid_until = datetime.fromisoformat(row[1]) + self.max_age
+        else:
+            body = self._download_robots(origin)
+            if body is not None:
+                with self.lock:
+                    self.connection.execute("INSERT INTO robots (origin, body, fetched) VALUES (?, ?, ?) ON CONFLICT(origin) DO UPDATE SET body = excluded.body, fetched = excluded.fetched",
+                                            (origin, body, now.isoformat()))
+                    self.connection.commit()
+                valid_until = now + self.max_age
+            else:
+                valid_until = now + self.retry_unreachable
+
+        parser = RobotFileParser(origin + "/robots.txt")
+        parser.parse((body or "").splitlines())
+
+        delay = parser.crawl_delay(self.user_agent)
+        HostRateController.get_instance().set_crawl_delay(origin, float(delay) if delay else None)
+
+        self.policies[origin] = (parser, valid_until)
+        return parser
+
+    def _download_robots(self, origin):
+        """
+        Returns:
+            body (str): The robots.txt, "" if the host has none, None if the host could not be reached
+        """
+        try:
+            response = request_url(origin + "/robots.txt", self.timeout_in_seconds, self.custom_headers)
+        except ResponseTooLarge:
+            return ""
+        if response is None or response.status_code >= 500:
+            return None
+        if response.status_code >= 400:
+            return ""
+        return response.text
+
+    def allowed(self, url):
+        """
+        Args:
+            url (str): The url to visit
+
+        Returns:
+            value (bool): True if robots.txt allows the crawler to visit url
+        """
+        return self.policy(url).can_fetch(self.user_agent, url)
+
+    def sitemap_entries(self, url, force = False):
+        """
+        Reads all sitemaps of the host of url (the ones in robots.txt or /sitemap.xml) and the sitemap indexes they are in.
+        The lastmod dates are saved. If the sitemaps were read within max_age nothing is downloaded.
+
+        Args:
+            url (str): any url on the host
+            force (bool): Read them even if they were read recently
+
+        Returns:
+            entries (list): tuples (url (str), lastmod (datetime.datetime or None)), empty if the sitemaps were read recently
+        """
+        origin = self.origin(url)
+        policy = self.policy(url)
+
+        with self.lock:
+            row = self.connection.execute("SELECT sitemaps_read FROM robots WHERE origin = ?", (origin,)).fetchone()
+        if not force and row and row[0] and datetime.fromisoformat(row[0]) > datetime.utcnow() - self.max_age:
+            return []
+
+        to_read = list(policy.site_maps() or [origin + "/sitemap.xml"])
+        read = set()
+        entries = {}
+        while to_read and len(read) < self.max_sitemaps:
+            sitemap_url = to_read.pop(0)
+            if sitemap_url in read:
+                continue
+            read.add(sitemap_url)
+
+            try:
+                response = request_url(sitemap_url, self.timeout_in_seconds, self.custom_headers)
+            except ResponseTooLarge:
+                continue
+            if response is None or not response.ok:
+                continue
+
+            urls, sitemaps = self.parse_sitemap(response.content)
+            entries.update((self.canonicalize(u), d) for u, d in urls)
+            to_read.extend(sitemaps)
+
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO lastmod (url, lastmod) VALUES (?, ?)",
+                                        [(u, d.isoformat() if d else None) for u, d in entries.items()])
+            # only remembered if robots.txt was saved, else everything is tried again next time
+            self.connection.execute("UPDATE robots SET sitemaps_read = ? WHERE origin = ?", (datetime.utcnow().isoformat(), origin))
+            self.connection.commit()
+
+        return list(entries.items())
+
+    @staticmethod
+    def parse_sitemap(content):
+        """
+        Parses a sitemap or a sitemap index (may be gzipped)
+
+        Args:
+            content (bytes): The downloaded file
+
+        Returns:
+            urls (list): tuples (url (str), lastmod (datetime.datetime or None)) of a sitemap
+            sitemaps (list): the urls (str) of the sitemaps in a sitemap index
+        """
+        if content[:2] == b"\x1f\x8b": # gzip
+            try:
+                content = gzip.decompress(content)
+            except (OSError, EOFError):
+                return [], []
+
+        try:
+            root = ElementTree.fromstring(content)
+        except ElementTree.ParseError:
+            return [], []
+
+        # the tags have the sitemap namespace, only the local name matters
+        local_name = lambda element: element.tag.rsplit("}", 1)[-1]
+
+        urls = []
+        sitemaps = []
+        for entry in root:
+            values = {local_name(child) : (child.text or "").strip() for child in entry}
+            if not values.get("loc"):
+                continue
+            if local_name(root) == "sitemapindex":
+                sitemaps.append(values["loc"])
+            else:
+                urls.append((values["loc"], Discovery.parse_lastmod(values.get("lastmod"))))
+        return urls, sitemaps
+
+    @staticmethod
+    def parse_lastmod(value):
+        """
+        Args:
+            value (str): A W3C datetime like 2024-01-31 or 2024-01-31T10:00:00+01:00
+
+        Returns:
+            date (datetime.datetime): The date in UTC without tzinfo (like datetime.utcnow()), None if value is empty or not valid
+        """
+        if not value:
+            return None
+        try:
+            date = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        return date
+
+    def lastmods(self):
+        """
+        Returns:
+            lastmods (dict): url (str) -> lastmod (datetime.datetime) of all saved sitemap urls that have a lastmod
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT url, lastmod FROM lastmod WHERE lastmod IS NOT NULL").fetchall()
+        return {url : datetime.fromisoformat(lastmod) for url, lastmod in rows}
+
+    def close(self):
+        """ Closes the database """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,129 @@
+""" Turns a downloaded html page into a small record right after it was fetched """
+
+import re
+from collections import namedtuple
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError: # fall back to the slower html.parser of BeautifulSoup
+    lxml = None
+
+# everything the crawler and the index need from a page, the parsed html is dropped after creating it
+# title (str), text (str), outlinks (list of the href strings of all <a> tags), favicon (str, full url or None)
+PageRecord = namedtuple("PageRecord", ["title", "text", "outlinks", "favicon"])
+
+# elements whose text is not shown on the page
+not_visible_tags = ("script", "style", "noscript", "template")
+
+favicon_rel_re = re.compile("^(shortcut icon|icon)$", re.I)
+
+# the encoding of an xml declaration (xhtml pages), the html parser of lxml does not read it
+xml_encoding_re = re.compile(rb"""^\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+def clean_text(text):
+    """
+    Joins all whitespace to single spaces
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        text (str): The cleaned text
+    """
+    return " ".join(text.split())
+
+def find_favicon(url, href):
+    """
+    Creates the full url of a favicon link
+
+    Args:
+        url (str): The url of the page
+        href (str): The href of the <link rel="icon"> tag, may be None
+
+    Returns:
+        favicon_url (str): The full url to the favicon or None
+    """
+    if not href:
+        return None
+
+    # check wether the link is a relative link
+    parsed_link = urlparse(href)
+    if (not parsed_link.scheme) and (not parsed_link.netloc):
+        return urljoin(url, href)
+    return href
+
+def extract_page(content, url, encoding = None):
+    """
+    Parses the html of a page and keeps only the title, the visible text, the links and the favicon
+
+    Args:
+        content (bytes): The html
+        url (str): The url of the page (for the favicon url)
+        encoding (str): The charset from the http header, if None it is found in the html
+
+    Returns:
+        record (PageRecord): The record, None if the page has no title or no text
+    """
+    if lxml is None:
+        return _extract_page_bs4(content, url)
+
+    if not encoding:
+        # most pages are utf-8, if it is not valid utf-8 the parser looks for an xml declaration or a meta charset.
+        # the bytes are given to lxml in both cases, it does not parse a str with an xml declaration (ValueError)
+        try:
+            content.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            declaration = xml_encoding_re.match(content)
+            if declaration:
+                encoding = declaration.group(1).decode("ascii")
+
+    try:
+        parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+        document = lxml.html.document_fromstring(content, parser=parser)
+    except (lxml.etree.ParserError, LookupError): # empty document or unknown encoding
+        return None
+
+    title = clean_text(document.findtext(".//title") or "")
+
+    favicon = None
+    for link in document.iter("link"):
+        if favicon_rel_re.match(link.get("rel", "").strip()):
+            favicon = find_favicon(url, link.get("href"))
+            break
+
+    outlinks = [a.get("href") for a in document.iter("a") if a.get("href") is not None]
+
+    for element in list(document.iter(*not_visible_tags)):
+        element.drop_tree()
+    text = clean_text(" ".join(document.itertext()))
+
+    if not title or not text:
+        return None
+    return PageRecord(title, text, outlinks, favicon)
+
+def _extract_page_bs4(content, url):
+    """
+    The same as extract_page, but with BeautifulSoup if lxml is not installed
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    if not soup.title:
+        return None
+
+    title = clean_text(soup.title.text)
+
+    favicon_link = soup.find("link", attrs={'rel': favicon_rel_re})
+    favicon = find_favicon(url, favicon_link.get("href") if favicon_link else None)
+
+    outlinks = [a["href"] for a in soup.find_all("a") if a.has_attr("href")]
+
+    for element in soup(not_visible_tags):
+        element.decompose()
+    text = clean_text(soup.get_text(" "))
+
+    if not title or not text:
+        return None
+    return PageRecord(title, text, outlinks, favicon)
@@ -0,0 +1,98 @@
+""" Remembers the favicon of each host, so the search results can show it without downloading anything """
+
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+from mylib.httpsession import HttpSession
+from mylib.ratecontrol import HostRateController
+
+class FaviconCache:
+    """
+    The favicon url of each host (scheme and netloc), resolved while crawling and saved in SQLite.
+    A page with a <link rel="icon"> keeps its own favicon, the first one found on a host is the favicon of the host.
+    A page without one gets the favicon of its host. If no page of the host had one, /favicon.ico is requested once
+    and used if it exists. Hosts without any favicon are saved too (as ""), so they are not requested again.
+
+    Attributes:
+        path (str): The SQLite file
+        custom_headers (dict): The headers for the /favicon.ico requests
+        timeout (float): The timeout for the /favicon.ico requests
+        hosts (dict): origin (str, e.g. https://www.uni-osnabrueck.de) -> favicon url (str, "" if there is none)
+    """
+
+    def __init__(self, path : str, custom_headers : dict = None, timeout : float = 2):
+        """
+        Args:
+            path (str): The SQLite file
+            custom_headers (dict): The headers for the /favicon.ico requests
+            timeout (float): The timeout for the /favicon.ico requests
+        """
+        self.path = path
+        self.custom_headers = custom_headers
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hosts (origin TEXT PRIMARY KEY, favicon TEXT NOT NULL)")
+        self.connection.commit()
+        self.hosts = dict(self.connection.execute("SELECT origin, favicon FROM hosts"))
+
+    def save(self, origin, favicon):
+        """ Remembers the favicon of a host ("" for none) """
+        with self.lock:
+            self.hosts[origin] = favicon
+            self.connection.execute("INSERT OR REPLACE INTO hosts (origin, favicon) VALUES (?, ?)", (origin, favicon))
+            self.connection.commit()
+
+    def resolve(self, url, found = None, download = True):
+        """
+        Args:
+            url (str): The url of a page
+            found (str): The favicon url found in the page (extract.PageRecord.favicon), None if it had none
+            download (bool): If False /favicon.ico is not requested for an unknown host
+
+        Returns:
+            favicon (str): The favicon url for the page, None if there is none
+        """
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+
+        if found:
+            if not self.hosts.get(origin):
+                self.save(origin, found)
+            return found
+
+        if origin not in self.hosts:
+            if not download:
+                return None
+            self.save(origin, self.check_fallback(origin) or "")
+        return self.hosts[origin] or None
+
+    def check_fallback(self, origin):
+        """
+        Requests /favicon.ico of a host
+
+        Args:
+            origin (str): scheme and netloc of the host
+
+        Returns:
+            favicon (str): The url of /favicon.ico if it exists, else None
+        """
+        url = origin + "/favicon.ico"
+        controller = HostRateController.get_instance()
+        if not controller.wait(url, max_wait=self.timeout):
+            return None
+        try:
+            response = HttpSession.get_instance().get(url, max(self.timeout, controller.timeout(url)), self.custom_headers)
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code == 200 and response.headers.get("content-type", "image").lower().startswith("image"):
+            return url
+        return None
+
+    def close(self):
+        """ Closes the SQLite file """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,97 @@
+""" Remembers when the crawler last checked each page during updates and how often it had changed """
+
+import sqlite3
+import threading
+from datetime import datetime
+
+class FetchLog:
+    """
+    Saves for each url when it was last checked by Crawler.crawl_updates. Pages that did not change are not written to the index again,
+    so the date in the index stays old. The FetchLog is used to not check them again every day.
+    It also counts the checks and how many of them found a changed page, recrawl.RecrawlScheduler estimates the change rate from that.
+
+    Attributes:
+        path (str): The SQLite file
+    """
+
+    def __init__(self, path : str):
+        """
+        Args:
+            path (str): The SQLite file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS checks (url TEXT PRIMARY KEY, checked TEXT NOT NULL)")
+        # the change history was added later, older logs get the columns here
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(checks)")}
+        for column in ("checks INTEGER NOT NULL DEFAULT 0", "changes INTEGER NOT NULL DEFAULT 0", "observed REAL NOT NULL DEFAULT 0"):
+            if column.split()[0] not in columns:
+                self.connection.execute("ALTER TABLE checks ADD COLUMN " + column)
+        self.connection.commit()
+
+    def record_check(self, url, date = None, changed = None, previous = None):
+        """
+        Saves that url was checked. If changed is given, the check is added to the change history of the url: 
+        the time since the check before (or since previous, if the url was never checked) is observed and counted as changed or not.
+
+        Args:
+            url (str): The url that was checked
+            date (datetime.datetime): When it was checked, utcnow if None
+            changed (bool): Whether the content had changed since the last check, None if that is not known
+            previous (datetime.datetime): When the url was seen the last time before, if it was never checked (e.g. the date in the index)
+        """
+        date = date or datetime.utcnow()
+        with self.lock:
+            row = self.connection.execute("SELECT checked FROM checks WHERE url = ?", (url,)).fetchone()
+            if row:
+                previous = datetime.fromisoformat(row[0])
+
+            observed = (date - previous).total_seconds() if changed is not None and previous is not None else 0
+            if observed <= 0: # nothing to learn from without a time span
+                changed = None
+            checks, changes = (0, 0) if changed is None else (1, int(changed))
+
+            self.connection.execute("INSERT INTO checks (url, checked, checks, changes, observed) VALUES (?, ?, ?, ?, ?) "
+                                    "ON CONFLICT(url) DO UPDATE SET checked = excluded.checked, checks = checks + excluded.checks, "
+                                    "changes = changes + excluded.changes, observed = observed + excluded.observed",
+                                    (url, date.isoformat(), checks, changes, max(observed, 0)))
+            self.connection.commit()
+
+    def last_checked(self, url):
+        """
+        Args:
+            url (str): The url
+
+        Returns:
+            date (datetime.datetime): When the url was checked the last time, None if never
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT checked FROM checks WHERE url = ?", (url,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def checked_since(self, url, date):
+        """
+        Args:
+            url (str): The url
+            date (datetime.datetime): The threshold
+
+        Returns:
+            value (bool): True if the url was checked after date
+        """
+        last = self.last_checked(url)
+        return last is not None and last > date
+
+    def history(self):
+        """
+        Returns:
+            history (dict): url (str) -> (last check (datetime.datetime), checks (int), changes (int), observed seconds (float)) of all checked urls
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT url, checked, checks, changes, observed FROM checks").fetchall()
+        return {url : (datetime.fromisoformat(checked), checks, changes, observed) for url, checked, checks, changes, observed in rows}
+
+    def close(self):
+        """ Closes the database """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,269 @@
+""" A crawl frontier that is saved in SQLite, so a crawl can be resumed after a crash or restart """
+
+import heapq
+import sqlite3
+import threading
+import time
+
+from mylib.priority import DepthScorer
+
+class CrawlFrontier:
+    """
+    The urls the crawler still has to visit. The urls are kept in memory to pop them quickly and every change is also written to an SQLite
+    database. The database is committed at checkpoints, so after a crash the crawl continues at the last checkpoint.
+    The WAITING urls are in a heap ordered by a scorer (see priority.py), so the most valuable url is visited next and not the last one found.
+    The scores of the scorer (e.g. the inlinks) are saved in the same database at each commit, so a resumed crawl keeps the order.
+
+    Each url has a state:
+        WAITING: In the heap, has to be requested
+        LATER: The server was too slow or returned 503, will be tried again at the end of the crawl
+        FETCHED: In the preliminary_index of the crawler, but not saved in the whoosh index yet
+
+    Attributes:
+        path (str): The SQLite file
+        scorer (priority.DepthScorer): Gives the priority of each url, the smallest is visited next
+        heap (list): heapq of tuples (priority, seq, url) of the WAITING urls, may contain old entries of urls whose priority changed
+        waiting (dict): url (str) -> (depth (int), priority) of the WAITING urls
+        later (list): The LATER urls as tuples (url (str), depth (int))
+        fetched (list): FETCHED urls from before a crash, the crawler has to check whether they reached the index (see resolve_fetched)
+        checkpoint_seconds (float): After how many seconds maybe_commit commits again
+        last_commit (float): time.time() of the last commit
+    """
+
+    WAITING = 0
+    LATER = 1
+    FETCHED = 2
+
+    def __init__(self, path : str, checkpoint_seconds : float = 30, scorer = None):
+        """
+        Opens the database or creates it and loads the urls of the last run
+
+        Args:
+            path (str): The SQLite file
+            checkpoint_seconds (float): After how many seconds maybe_commit commits again
+            scorer (priority.DepthScorer): Gives the priority of each url, breadth first if None
+        """
+        self.path = path
+        self.scorer = scorer or DepthScorer()
+        self.checkpoint_seconds = checkpoint_seconds
+        self.lock = threading.RLock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, depth INTEGER NOT NULL, state INTEGER NOT NULL, seq INTEGER NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS scores (url TEXT PRIMARY KEY, score REAL NOT NULL)")
+        self.connection.commit()
+
+        # the scores are needed before the priorities of the waiting urls are computed
+        self.scorer.load(self.connection.execute("SELECT url, score FROM scores"))
+
+        self.heap = []
+        self.waiting = {}
+        self.later = []
+        self.fetched = []
+        for url, depth, state, seq in self.connection.execute("SELECT url, depth, state, seq FROM frontier ORDER BY seq"):
+            if state == self.WAITING:
+                priority = self.scorer.priority(url, depth)
+                self.waiting[url] = (depth, priority)
+                self.heap.append((priority, seq, url))
+            elif state == self.LATER:
+                self.later.append((url, depth))
+            else:
+                self.fetched.append(url)
+
+        heapq.heapify(self.heap)
+
+        self.seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier").fetchone()[0]
+        self.last_commit = time.time()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __bool__(self):
+        return bool(self.waiting)
+
+    def urls(self):
+        """ All urls in the frontier, in all states """
+        return list(self.waiting) + [url for url, _ in self.later] + self.fetched
+
+    def _set(self, url, depth, state):
+        """ Writes the state of one url into the database (not committed) """
+        self.seq += 1
+        self.connection.execute("INSERT OR REPLACE INTO frontier (url, depth, state, seq) VALUES (?, ?, ?, ?)", (url, depth, state, self.seq))
+
+    def push(self, url, depth):
+        """
+        Adds an url to the heap
+
+        Args:
+            url (str): The url to visit
+            depth (int): The depth of the url
+        """
+        with self.lock:
+            self._set(url, depth, self.WAITING)
+            priority = self.scorer.priority(url, depth)
+            self.waiting[url] = (depth, priority)
+            heapq.heappush(self.heap, (priority, self.seq, url))
+
+    def pop(self):
+        """
+        Removes the url with the smallest priority from the heap. It stays WAITING in the database until one of the mark_ methods is called,
+        so it is visited again if the crawler stops before.
+
+        Returns:
+            url (str): The url to visit next
+            depth (int): The depth of the url
+
+        Raises:
+            IndexError: If no url is waiting
+        """
+        with self.lock:
+            while self.heap:
+                priority, _, url = heapq.heappop(self.heap)
+                entry = self.waiting.get(url)
+                if entry is not None and entry[1] == priority: # else it is an old entry
+                    del self.waiting[url]
+                    return url, entry[0]
+            raise IndexError("pop from empty frontier")
+
+    def links_found(self, url, links):
+        """
+        Tells the scorer which urls a downloaded page links to and moves the waiting urls whose priority changed
+
+        Args:
+            url (str): The url of the downloaded page
+            links (list): All urls on the same server it links to, also the ones that were seen before
+        """
+        with self.lock:
+            for link in self.scorer.links_found(url, links):
+                if link in self.waiting:
+                    depth, old_priority = self.waiting[link]
+                    priority = self.scorer.priority(link, depth)
+                    if priority != old_priority:
+                        self.waiting[link] = (depth, priority)
+                        self.seq += 1
+                        heapq.heappush(self.heap, (priority, self.seq, link))
+
+            # remove the old entries if there are too many of them
+            if len(self.heap) > 2 * len(self.waiting) + 1000:
+                self.heap = [entry for entry in self.heap if self.waiting.get(entry[2], (None, None))[1] == entry[0]]
+                heapq.heapify(self.heap)
+
+    def push_later(self, url, depth):
+        """
+        Saves an url to try again at the end of the crawl
+
+        Args:
+            url (str): The url that could not be visited
+            depth (int): The depth of the url
+        """
+        with self.lock:
+            self.later.append((url, depth))
+            self._set(url, depth, self.LATER)
+
+    def retry_later(self):
+        """
+        Moves all LATER urls back to the heap
+        """
+        with self.lock:
+            for url, depth in self.later:
+                self.push(url, depth)
+            self.later = []
+
+    def take_later(self):
+        """
+        Removes all LATER urls, use it after they where saved somewhere else
+
+        Returns:
+            later (list): tuples (url (str), depth (int))
+        """
+        with self.lock:
+            later = self.later
+            self.later = []
+            self.connection.executemany("DELETE FROM frontier WHERE url = ?", [(url,) for url, _ in later])
+            return later
+
+    def mark_fetched(self, url, depth):
+        """
+        Marks an url as downloaded and waiting to be saved in the whoosh index
+
+        Args:
+            url (str): The url
+            depth (int): The depth of the url
+        """
+        with self.lock:
+            self._set(url, depth, self.FETCHED)
+
+    def mark_done(self, url):
+        """
+        Removes an url that does not need to be visited again (e.g. not html)
+
+        Args:
+            url (str): The url
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM frontier WHERE url = ?", (url,))
+
+    def mark_indexed(self, urls):
+        """
+        Removes urls that are saved in the whoosh index now and commits (checkpoint)
+
+        Args:
+            urls (list): The urls that are in the index now
+        """
+        with self.lock:
+            self.connection.executemany("DELETE FROM frontier WHERE url = ?", [(url,) for url in urls])
+            self.commit()
+
+    def resolve_fetched(self, indexed_urls):
+        """
+        Handles the FETCHED urls from before a crash. The ones that reached the index are removed, the others are visited again.
+
+        Args:
+            indexed_urls (set): urls that are in the whoosh index
+        """
+        with self.lock:
+            for url, depth in self.connection.execute("SELECT url, depth FROM frontier WHERE state = ? ORDER BY seq", (self.FETCHED,)).fetchall():
+                if url in indexed_urls:
+                    self.mark_done(url)
+                else:
+                    self.push(url, depth)
+            self.fetched = []
+            self.commit()
+
+    def _save_scores(self):
+        """ Writes the scores that changed since the last commit into the database (not committed) """
+        scores, removed = self.scorer.changes()
+        self.connection.executemany("INSERT OR REPLACE INTO scores (url, score) VALUES (?, ?)", scores)
+        self.connection.executemany("DELETE FROM scores WHERE url = ?", [(url,) for url in removed])
+
+    def commit(self):
+        """
+        Commits all changes and the changed scores to the disk (checkpoint)
+        """
+        with self.lock:
+            self._save_scores()
+            self.connection.commit()
+            self.last_commit = time.time()
+
+    def maybe_commit(self):
+        """
+        Commits if the last commit is longer ago than checkpoint_seconds
+
+        Returns:
+            value (bool): True if committed
+        """
+        if time.time() - self.last_commit >= self.checkpoint_seconds:
+            self.commit()
+            return True
+        return False
+
+    def close(self):
+        """
+        Commits and closes the database
+        """
+        with self.lock:
+            self._save_scores()
+            self.connection.commit()
+            self.connection.close()
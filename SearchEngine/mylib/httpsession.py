@@ -0,0 +1,99 @@
+""" One shared http session for all downloads of a process, so connections are kept alive and reused """
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING # contains br if brotli is installed
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """ The response is bigger than HttpSession.max_bytes and was not downloaded completely """
+
+class HttpSession:
+    """
+    A requests.Session shared by the crawler, the update daemon and the highlights. Connections to a host stay open (keep-alive),
+    so the TCP and TLS handshake is only needed once per connection and not once per page.
+    The body is compressed if the server can (gzip, deflate and brotli if it is installed) and downloads bigger than max_bytes are stopped.
+
+    Attributes:
+        _instance (HttpSession): The one shared instance, use get_instance
+        session (requests.Session): The session with the connection pools
+        max_bytes (int): The biggest response body that is downloaded
+        chunk_size (int): How many bytes are read at once
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, pool_hosts : int = 100, connections_per_host : int = 8, max_bytes : int = 5 * 1024 * 1024, chunk_size : int = 64 * 1024):
+        """
+        Args:
+            pool_hosts (int): For how many hosts connections are kept open
+            connections_per_host (int): How many connections to one host may be open at the same time, more requests wait for a free one
+            max_bytes (int): The biggest response body that is downloaded
+            chunk_size (int): How many bytes are read at once
+        """
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=connections_per_host, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = DEFAULT_ACCEPT_ENCODING
+        self.session.headers["Connection"] = "keep-alive"
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Get the shared instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def get(self, url, timeout, headers = None):
+        """
+        Downloads url completely, but not more than max_bytes
+
+        Args:
+            url (str): The url to download
+            timeout (float): The timeout for requests
+            headers (dict): Headers for this request (added to the headers of the session)
+
+        Returns:
+            response (requests.Response): The response, response.content is already downloaded
+
+        Raises:
+            ResponseTooLarge: If the body is bigger than max_bytes
+            requests.exceptions.RequestException: The same as requests.get
+        """
+        response = self.session.get(url, timeout=timeout, headers=headers, stream=True)
+
+        try:
+            length = int(response.headers.get("content-length", 0))
+        except ValueError:
+            length = 0
+        if length > self.max_bytes:
+            response.close()
+            raise ResponseTooLarge(f"{url} has {length} bytes", response=response)
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(self.chunk_size):
+            size += len(chunk)
+            if size > self.max_bytes:
+                response.close()
+                raise ResponseTooLarge(f"{url} has more than {self.max_bytes} bytes", response=response)
+            chunks.append(chunk)
+
+        # everything was read, so the connection goes back into the pool for the next request
+        response._content = b"".join(chunks)
+        response.close()
+        return response
+
+    def post(self, url, timeout, **kwargs):
+        """
+        Sends a POST request over the shared connections, the arguments are the same as for requests.post
+        """
+        return self.session.post(url, timeout=timeout, **kwargs)
@@ -2,29 +2,37 @@
 
 import os
 import re
-import time
+import shutil
+import zlib
 from datetime import datetime, timedelta
 from concurrent import futures
-from urllib.parse import urljoin, urlparse
 from whoosh.index import create_in, exists_in, open_dir
-from whoosh.fields import Schema, TEXT, ID, DATETIME
+from whoosh.fields import Schema, TEXT, ID, DATETIME, STORED
 from whoosh.qparser import MultifieldParser, QueryParser, OrGroup
-from whoosh.scoring import BM25F
-from whoosh.writing import IndexingError, LockError
 
-from mylib.myfunctions import get_page
-from mylib.queuesingleton import ThreadQueueSingleton
+from mylib.myfunctions import get_page, content_hash
+from mylib.extract import extract_page
+from mylib.archive import headers_encoding
+from mylib.accessmanager import IndexAccessManager
 from mylib.myhighlighter import SavingHighlighter
+from mylib.sharedsearcher import SharedSearcher
+from mylib.writerservice import IndexWriterService
+from mylib.querycache import QueryCache, normalize_query
 
 class Index:
     """
-    An object to manage a whoosh index. It has a priority as attribute and is comparable to other instances of Index. 
+    An object to manage a whoosh index. The access of all Index objects of a process is controlled by accessmanager.IndexAccessManager. 
 
     Attributes:
         index_path (str): A directory of where to save or load the whoosh index
         custom_headers (dict): Used as the header for requests when searching
         timeout_default (int): The default value for timeout before retrying the same server
-        priority (int): How important it is that this instance of Index has quick access to the whoosh index (0 for searching, else 2)
+        priority (int): Which writer writes first if several wait (smallest first), searches never wait for writers
+        access (accessmanager.IndexAccessManager): The readers/writer lock of the process
+        highlight_max_wait (float): How many seconds get_highlights_and_favicon waits at most for a host that is slowed down or paused
+        live_highlights (bool): If True get_highlights_and_favicon loads all pages (archive or download) instead of using the text saved in the index
+        archive (archive.PageArchive): If set, get_highlights_and_favicon uses the archived pages and only downloads the ones that are not in it
+        use_cache (bool): If True search and correct_string save their results in querycache.QueryCache
         limitmb_index
     """
 
@@ -34,7 +42,7 @@ class Index:
             index_path (str): A directory of where to save or load the whoosh index
             name (str): The name used for custom_headers
             timeout_default (int): The default value for timeout before retrying the same server
-            priority (int): How important it is that this instance of Index has quick access to the whoosh index (0 for searching, else 2)
+            priority (int): Which writer writes first if several wait (smallest first)
         """
 
         self.index_path = index_path
@@ -42,59 +50,51 @@ class Index:
         self.custom_headers = {'User-Agent': "SearchEnginge Gugel/" + name}
 
         self.timeout_default = timeout_default
+        self.highlight_max_wait = 1.0
+        self.live_highlights = False
+        self.archive = None
+        self.use_cache = True
 
         self.priority = priority
 
-        self.queue_thread = ThreadQueueSingleton.get_instance()
-        self.wish_granted = False # changed in 
+        self.access = IndexAccessManager.get_instance()
 
-    # the following methods are used for queue.PriorityQueue. They make instances of Index comparable
+    # normal methods
 
-    def __ne__(self,other):
-        if not isinstance(other,Index):
-            return self != other
-        return self.priority != other.priority
-    
-    def __eq__(self,other):
-        if not isinstance(other,Index):
-            return self == other
-        return self.priority == other.priority
-    
-    def __lt__(self,other):
-        if not isinstance(other,Index):
-            return self < other
-        return self.priority < other.priority
-    
-    def __le__(self,other):
-        if not isinstance(other,Index):
-            return self <= other
-        return self.priority <= other.priority
-    
-    def __gt__(self,other):
-        if not isinstance(other,Index):
-            return self > other
-        return self.priority > other.priority
-    
-    def __gt__(self,other):
-        if not isinstance(other,Index):
-            return self >= other
-        return self.priority >= other.priority
-    
-    # the following methods are used to communicate with ThreadQueeSingleson in self.queue_thread
+    @staticmethod
+    def create_schema():
+        """
+        The schema of the whoosh index. 
+        etag and last_modified are the headers of the indexed version for conditional requests, content_hash is myfunctions.content_hash of it. 
+        compressed_text is the text of the page compressed with zlib, so the highlights can be made without downloading the page. 
+        favicon is the favicon url resolved by the crawler (see favicons.FaviconCache), None if the page has none. 
 
-    def wish_and_wait(self):
+        returns:
+            schema (whoosh.fields.Schema)
         """
-        Adds a wish to the Queue of QueueThread and waits until it was granted
+        # stored content to do easy highlights
+        return Schema(title=TEXT(stored=True), content=TEXT, url=ID(stored=True), date=DATETIME(stored=True, sortable=True),
+                      etag=STORED, last_modified=STORED, content_hash=ID(stored=True), compressed_text=STORED, favicon=STORED)
+
+    def open_index(self):
         """
-        self.queue_thread.add_wish(self)
-        while not self.wish_granted:
-            time.sleep(0.1)
+        Gets the whoosh index, it is only opened once per process (see sharedsearcher.SharedSearcher)
 
-    # normal methods
+        returns:
+            index (whoosh.index.Index): The index to use for creating writer and searcher
+        """
+        return self.shared_searcher().index
 
-    def open_index(self):
+    def shared_searcher(self):
+        """
+        returns:
+            shared (sharedsearcher.SharedSearcher): The searcher of the index that is shared by all Index objects of the process
+        """
+        return SharedSearcher.get_instance(self.index_path, self.create_or_open_index)
+
+    def create_or_open_index(self):
         """
-        Opens or creates the whoosh index
+        Opens or creates the whoosh index. Fields of create_schema that are missing in an older index are added. 
 
         returns:
             index (whoosh.index.Index): The index to use for creating writer and searcher
@@ -105,39 +105,65 @@ class Index:
 
         # if there is no existing index create a new one
         if not exists_in(self.index_path):
-            # stored content to do easy highlights
-            schema = Schema(title=TEXT(stored=True), content=TEXT, url=ID(stored=True), date=DATETIME(stored=True, sortable=True))
-            index = create_in(self.index_path, schema)
+            index = create_in(self.index_path, self.create_schema())
         else:
             # open the existing index
             index = open_dir(self.index_path)
+
+            schema = self.create_schema()
+            missing = [name for name in schema.names() if name not in index.schema]
+            if missing:
+                self.add_fields(index, [(name, schema[name]) for name in missing])
+                index = open_dir(self.index_path)
         return index
+
+    def add_fields(self, index, fields):
+        """
+        Adds new fields to the schema of an existing index
+
+        Args:
+            index (whoosh.index.Index): The opened index
+            fields (list): tuples (fieldname (str), fieldtype (whoosh.fields.FieldType))
+        """
+
+        def write():
+            with index.writer() as writer:
+                for name, fieldtype in fields:
+                    writer.add_field(name, fieldtype)
+
+        self.access.write(write, self.priority)
+
+    def add_document(self, writer, record, url, date, etag = None, last_modified = None):
+        """
+        Adds the document of one page with a writer
+
+        Args:
+            writer (whoosh.writing.IndexWriter): The writer to use
+            record (extract.PageRecord): The object containing the information about the webpage
+            url (str): The url where the data of the record was found
+            date (datetime.datetime): When the page was downloaded
+            etag (str): The ETag header of the response
+            last_modified (str): The Last-Modified header of the response
+        """
+        writer.add_document(title=record.title, content=record.text, url=url, date=date,
+                            etag=etag, last_modified=last_modified, content_hash=content_hash(record.title, record.text),
+                            compressed_text=zlib.compress(record.text.encode("utf-8")), favicon=record.favicon)
     
-    def add_to_Index(self,soup,url):
+    def add_to_Index(self,record,url, etag = None, last_modified = None):
         """
         Adds one single element to the whoosh index
 
         Args: 
-            soup (bs4.BeautifulSoup): The object containing the information about the webpage
-            url (string): The url where the data of the soup was found
-        """
+            record (extract.PageRecord): The object containing the information about the webpage
+            url (string): The url where the data of the record was found
+            etag (str): The ETag header of the response
+            last_modified (str): The Last-Modified header of the response
 
-        index = self.open_index()
-        date = datetime.utcnow()
-
-        done = False
-        while not done:
+        Returns:
+            ticket (writerservice.WriteTicket): ticket.wait() returns when the page was committed
+        """
 
-            self.wish_and_wait()
-            try:
-                with index.writer() as writer:
-                    writer.add_document(title=soup.title.text, content=soup.text, url=url, date=date)
-                    done = True
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
-            
+        return self.writer_service().add(record, url, datetime.utcnow(), etag, last_modified)
 
     def list_to_Index(self,input_list):
         """
@@ -145,57 +171,104 @@ class Index:
         the preliminary_index will be emptied afterwards
 
         Args:
-            input_list (list): containing elements to save in the format (bs4.BeautifulSoup,str), where the string is meant to be an url
+            input_list (list): containing elements to save in the format (extract.PageRecord, url (str), etag (str), last_modified (str))
         """
 
-        index = self.open_index()
-        date = datetime.utcnow()
+        if not input_list: # do not commit the waiting updates of other callers
+            return
 
-        done = False
-        while not done:
+        service = self.writer_service()
+        date = datetime.utcnow()
 
-            self.wish_and_wait()
-            try:
-                # automatically committed and closed writer
-                with index.writer() as writer:
-                    for soup, url in input_list:
-                        writer.add_document(title=soup.title.text, content=soup.text, url=url, date=date)
-                self.preliminary_index = []
-                done = True
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
+        for record, url, etag, last_modified in input_list:
+            service.add(record, url, date, etag, last_modified)
+        # the crawler marks the pages as indexed in the frontier afterwards, so they have to be committed
+        service.flush()
+        self.preliminary_index = []
 
-    def update_index(self,url,new_soup):
+    def update_index(self,url,new_record, etag = None, last_modified = None):
         """
         delete old entry for url and save a new one given new content
 
         Args: 
             url (str): the entry with this url will be updated if it exists, else just added
-            new_soup (bs4.BeautifulSoup): content for the new entry
+            new_record (extract.PageRecord): content for the new entry
+            etag (str): The ETag header of the new response
+            last_modified (str): The Last-Modified header of the new response
+
+        Returns:
+            ticket (writerservice.WriteTicket): ticket.wait() returns when the new entry was committed
+        """
+
+        return self.writer_service().update(new_record, url, datetime.utcnow(), etag, last_modified)
+
+    def merge_from(self, index_paths):
         """
-        # self.is_in_index(url,delete=True)
+        Adds all entries of other whoosh indexes (e.g. the shards of a partitioned crawl, see coordinator.py) to this index. 
+        Entries with an url that is already in this index replace the old ones. 
+
+        Args:
+            index_paths (list): The directories of the indexes to merge, the ones without an index are left out
+
+        Returns:
+            count (int): How many entries where added
+        """
+
+        self.flush()
         index = self.open_index()
-        date = datetime.utcnow()
+        sources = [open_dir(path) for path in index_paths if exists_in(path)]
+
+        def write():
+            count = 0
+            with index.writer() as writer:
+                for source in sources:
+                    with source.reader() as reader:
+                        for term in reader.lexicon("url"):
+                            writer.delete_by_term("url", term.decode("utf-8"))
+                        writer.add_reader(reader) # copies the postings, so content does not have to be stored
+                        count += reader.doc_count()
+            return count
+
+        return self.access.write(write, self.priority)
+
+    def rebuild(self, batches):
+        """
+        Builds the whoosh index again with create_schema in a new directory (e.g. after the schema or the analyzer changed), 
+        with one writer for all pages. The old index is used until the new one is done and replaces it. 
 
-        done = False
-        while not done:
+        Args:
+            batches (iterable): lists of (extract.PageRecord, url (str), date (datetime.datetime), etag (str), last_modified (str))
 
-            self.wish_and_wait()
-            try:
-                with index.writer() as writer:
-                    try:
-                        writer.delete_by_term("url", url)
-                    except IndexingError: # does not exists, so just add the new one
-                        pass
-                    writer.add_document(title=new_soup.title.text, content=new_soup.text, url=url, date=date)
-                done = True
+        Returns:
+            count (int): How many pages are in the new index
+        """
 
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
+        new_path = self.index_path.rstrip("/") + ".rebuild"
+        old_path = self.index_path.rstrip("/") + ".old"
+        shutil.rmtree(new_path, ignore_errors=True)
+        os.makedirs(new_path)
+
+        count = 0
+        index = create_in(new_path, self.create_schema())
+        with index.writer(limitmb=256) as writer:
+            for batch in batches:
+                for record, url, date, etag, last_modified in batch:
+                    self.add_document(writer, record, url, date, etag, last_modified)
+                    count += 1
+
+        # nobody may use the index while the directories are swapped
+        self.flush()
+        with self.access.exclusive():
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.isdir(self.index_path):
+                os.rename(self.index_path, old_path)
+            os.rename(new_path, self.index_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            # the searcher and the cached results belong to the old directory, the new index may start with the same generation
+            SharedSearcher.discard(self.index_path)
+            self.query_cache().clear()
+
+        return count
 
     def delete_from_index(self,url):
         """
@@ -205,75 +278,127 @@ class Index:
             url (str): the entry with this url will be deleted if it exists
 
         Returns:
-            value (bool): True if entry was deleted, False if it was not found
+            ticket (writerservice.WriteTicket): ticket.wait() returns when the delete was committed, ticket.result is the number of deleted entries
         """
 
-        index = self.open_index()
+        return self.writer_service().delete(url)
 
-        done = False
-        found = False
-        while not done:
-
-            self.wish_and_wait()
-            try:
-                try:
-                    with index.writer() as writer:
-                        writer.delete_by_term("url", url)
-                    found = True
-                except IndexingError: # if entry was not found
-                    pass
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
-        return found
+    def writer_service(self):
+        """
+        returns:
+            service (writerservice.IndexWriterService): The thread that writes all changes of the index in batches
+        """
+        return IndexWriterService.get_instance(self)
+
+    def flush(self):
+        """
+        Commits all changes given to add_to_Index, update_index and delete_from_index and waits until new searches find them
+        """
+        self.writer_service().flush()
+
+    def query_cache(self):
+        """
+        returns:
+            cache (querycache.QueryCache): The results of search and correct_string for the index, shared by all Index objects of the process
+        """
+        return QueryCache.get_instance(self.index_path)
+
+    @staticmethod
+    def cache_generation(shared, searcher):
+        """
+        The version of the index a searcher reads, results found with another version are not used from the cache.
+        The inode of the directory and the number of documents are part of it, because a rebuilt index (maybe by another process)
+        starts with a small generation again.
+        """
+        return shared.inode, searcher.reader().generation(), searcher.doc_count_all()
 
     def search(self, input_string, limit = 15):
         """
         Searches in the index for a search term.
         It searches in the title and content and is a default OR search. It uses BM25F as a scoring algorithm. 
-        If there are no matches the input_string will be corrected. Then it will be searched again. 
+        For showing the results page by page use search_page, which only creates the highlighters of one page. 
 
         Args: 
             input_string (str): A string containing the search term
-            limit (int): How many results to return for each page
+            limit (int): How many results to return, None for all of them
 
         Returns:
-            total_hits (int): The estimated number of total hits
+            total_hits (int): The number of total hits
             results (list): A list containing sets for each hit [(title, url, SavingHighlighter), ...]
         """
 
-        # helpful: https://whoosh.readthedocs.io/en/latest/searching.html
+        if limit is None: # like whoosh, all hits (at least 1, so the pages can be counted)
+            with self.access.reading(), self.shared_searcher().searcher() as searcher:
+                limit = max(searcher.doc_count(), 1)
+        total, _, results = self.search_results(input_string, 1, limit)
+        return total, results
 
-        index = self.open_index()
+    def search_page(self, input_string, pagenum = 1, pagelen = 15):
+        """
+        Searches in the index for a search term like search, but only returns one page of the results. 
+        Whoosh only keeps the best pagenum * pagelen hits, and highlighters are only created for the hits of the page, 
+        so a search with many hits does not need more memory than the page. 
 
-        # use MultifieldParser to search in different fields at once. 
-        query = MultifieldParser(["title", "content"], index.schema, group=OrGroup).parse(input_string)
+        Args: 
+            input_string (str): A string containing the search term
+            pagenum (int): Which page to return, the first one is 1
+            pagelen (int): How many results are on a page
 
-        done = False
-        while not done:
+        Returns:
+            total_hits (int): The number of total hits
+            pagecount (int): How many pages there are
+            results (list): The hits of the page [(title, url, SavingHighlighter), ...], empty if pagenum is bigger than pagecount
+        """
 
-            self.wish_and_wait()
-            try:
-                # scoring BM25F takes frequency in a document in the whole index as well as length of documents into account
-                with index.searcher(weighting = BM25F()) as searcher:
+        if pagenum < 1:
+            raise ValueError("pagenum must be >= 1")
+        return self.search_results(input_string, pagenum, pagelen)
 
-                    # find entries with all words in the content
-                    results = searcher.search(query,limit=limit)
-                    output = len(results), [(r["title"], r["url"], SavingHighlighter(r,"content")) for r in results]
+    def search_results(self, input_string, pagenum, pagelen):
+        """
+        Does the search of search and search_page, the results are saved in query_cache
 
-                done = True
+        Returns:
+            total_hits (int): The number of total hits
+            pagecount (int): How many pages there are
+            results (list): The hits of the page [(title, url, SavingHighlighter), ...]
+        """
 
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
+        # helpful: https://whoosh.readthedocs.io/en/latest/searching.html
+
+        # scoring BM25F takes frequency in a document in the whole index as well as length of documents into account
+        shared = self.shared_searcher()
+        with self.access.reading(), shared.searcher() as searcher: # BM25F is the default weighting of whoosh
+
+            key = ("search", normalize_query(input_string), pagenum, pagelen)
+            generation = self.cache_generation(shared, searcher)
+            if self.use_cache:
+                output = self.query_cache().get(key, generation)
+                if output is not None:
+                    return output
+
+            # use MultifieldParser to search in different fields at once. 
+            # the schema of the searcher, index.schema would read the TOC file again
+            query = MultifieldParser(["title", "content"], searcher.schema, group=OrGroup).parse(input_string)
+
+            # only the best hits up to the end of the page are kept, len(results) still counts all of them
+            results = searcher.search(query, limit=pagenum * pagelen)
+            total = len(results)
+            hits = results[(pagenum - 1) * pagelen : pagenum * pagelen]
+            output = total, (total + pagelen - 1) // pagelen, [(r["title"], r["url"], SavingHighlighter(r,"content")) for r in hits]
+
+            if self.use_cache:
+                # a highlighter keeps the matched words and their positions, but not the searcher
+                size = 200 + sum(300 + len(t) + len(url) + 100 * len(getattr(h, "tokens", ())) for t,url,h in output[2])
+                self.query_cache().put(key, generation, output, size)
 
         return output
     
     def get_highlights_and_favicon(self,results):
         """
-        Retrieves the webpages to create highlights and finds the favicon link if it exists.
+        Creates the highlights from the text saved in the index and uses the saved favicon. Only the pages without saved text 
+        (indexed before it was saved) are loaded (see load_page), these also give the favicon link if it exists. 
+        If live_highlights is True, all pages are loaded, so the highlights show the newest version. 
 
         Args:
             results (list): The results of Index.search [(title, url, SavingHighlighter), ...]
@@ -282,30 +407,78 @@ class Index:
             output (list): A list containing sets for each hit [(title, url, highlights, favicon_url), ...]
         """
 
+        stored = {} if self.live_highlights else self.stored_pages([url for _,url,_ in results])
+        missing = [url for _,url,_ in results if url not in stored]
+
+        # ask for new content parallel for all results that are not saved
+        # a host that has to be waited for longer than highlight_max_wait is skipped, so one slow server does not hold back the results
+        pages = {}
+        if missing:
+            with futures.ThreadPoolExecutor(max_workers=15) as executor:
+                pages = dict(zip(missing, executor.map(self.load_page, missing)))
+
         output = []
+        for t,url,highlighter in results:
+
+            if url in stored:
+                text, favicon = stored[url]
+                output.append((t, url, highlighter.highlight_text(text = text), favicon))
+            elif pages[url][0] == 1: # only use new info if the server is reachable
+                record = pages[url][1]
+                output.append((t, url, highlighter.highlight_text(text = record.text), record.favicon))
 
-        # ask for new content parallel for all results
-        with futures.ThreadPoolExecutor(max_workers=15) as executor:
-            res = executor.map(lambda p: get_page(*p),[(url,self.timeout_default,self.custom_headers) for _,url,_ in results])
-        responses_new = list(res)
+        return output
 
-        for (t,url,highlighter), (code, soup) in zip(results,responses_new):
+    def stored_pages(self, urls):
+        """
+        Gets the texts and favicons saved in the index
 
-            if code == 1: # only use new info if the server is reachable
+        Args:
+            urls (list): The urls of the entries
 
-                # get favicons of the pages
-                favicon_url = self.find_favicon(url,soup)
+        Returns:
+            pages (dict): url (str) -> (text (str), favicon (str or None)), only for urls that are in the index with a saved text
+        """
 
-                output.append((t, url, highlighter.highlight_text(text = soup.text), favicon_url))
+        pages = {}
+        with self.access.reading(), self.shared_searcher().searcher() as searcher:
+            for url in urls:
+                fields = searcher.document(url=url)
+                if fields and fields.get("compressed_text"):
+                    pages[url] = (zlib.decompress(fields["compressed_text"]).decode("utf-8"), fields.get("favicon"))
 
-        return output
+        return pages
         
-    def find_old(self, age_in_days : int = 30, limit = 1000):
+    def load_page(self, url):
+        """
+        Gets a page for the highlights, from the archive if it is in there, else it is downloaded
+
+        Args:
+            url (str): The url of the page
+
+        Returns:
+            code (int): 1 for successful, else see myfunctions.get_page
+            record (extract.PageRecord): The title, text, links and favicon of the webpage if code = 1
+        """
+        if self.archive is not None:
+            page = self.archive.get(url)
+            if page is not None:
+                record = extract_page(page.body, url, headers_encoding(page.headers))
+                return (1, record) if record else (0, None)
+        return get_page(url, self.timeout_default, self.custom_headers, max_wait=self.highlight_max_wait)
+
+    def find_old(self, age_in_days : int = 30, limit = 1000, skip = None, priority = None):
         """
         Finds old entries in the index, that are older than age_in_days days
 
         Args:
             age_in_days (int): Information that is older than that will be updated
+            limit (int): How many entries to return at most
+            skip (function): If given, entries where skip(url, date) is True are not returned and do not count for the limit
+            priority (function): If given, the entries are sorted by priority(url, date) (smallest first) before the limit is used
+
+        Returns:
+            output (list): tuples (url (str), date (datetime.datetime)), the oldest first if priority is None
         """
 
         # create input_string without using DateParserPlugin
@@ -314,60 +487,52 @@ class Index:
 
         # find all pages that are older than x
         # helpful: https://whoosh.readthedocs.io/en/latest/dates.html
-        index = self.open_index()
-        query = QueryParser("date", index.schema)
-
-        # query.add_plugin(DateParserPlugin)()
-        query = query.parse(input_string)
-
-        done = False
-        while not done:
-
-            self.wish_and_wait()
-            try:
-                with index.searcher() as searcher:
-                    results = searcher.search(query,limit=limit, sortedby = "date")
-                    #print("Results in find_old: ", results)
-                    output =  [(r["url"],r["date"]) for r in results]
-                done = True
-
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
+        with self.access.reading(), self.shared_searcher().searcher() as searcher:
+            query = QueryParser("date", searcher.schema)
+
+            # query.add_plugin(DateParserPlugin)()
+            query = query.parse(input_string)
+
+            if skip is None and priority is None:
+                results = searcher.search(query,limit=limit, sortedby = "date")
+                #print("Results in find_old: ", results)
+                output =  [(r["url"],r["date"]) for r in results]
+            elif priority is None:
+                output = []
+                for r in searcher.search(query,limit=None, sortedby = "date"):
+                    if len(output) >= limit:
+                        break
+                    if not skip(r["url"], r["date"]):
+                        output.append((r["url"],r["date"]))
+            else:
+                output = [(r["url"],r["date"]) for r in searcher.search(query,limit=None, sortedby = "date") 
+                          if skip is None or not skip(r["url"], r["date"])]
+                output = sorted(output, key=lambda entry: priority(*entry))[:limit]
 
         for _,date in output:
             print(date)
         return output
-    
-    def find_favicon(self, url,soup):
+
+    def find_validators(self, urls):
         """
-        gets an url and a soup and returns the full urls to the favicon. If non found then the entry is None
+        Gets the saved ETag, Last-Modified and content hash of entries to check whether they changed
 
         Args:
-            url (str): The original url
-            soup (bs4.BeautifulSoup): The html code in a soup to search in for the favicon links
+            urls (list): The urls of the entries
 
         Returns:
-            favicon_url (str): The url for the favicon
+            validators (dict): url (str) -> (etag (str), last_modified (str), content_hash (str)), only for urls that are in the index
         """
 
-        # get favicons of the pages
-        favicon_link = soup.find("link", attrs={'rel': re.compile("^(shortcut icon|icon)$", re.I)})
-
-        # try in case favicon_link does not have an href, is is None already
-        try:
-            favicon_url = favicon_link['href']
-
-            # check wether the link is a relative link
-            parsed_link = urlparse(favicon_url)
-            if (not parsed_link.scheme) and (not parsed_link.netloc):
-                favicon_url = urljoin(url,favicon_url)
-
-            return favicon_url
-        except:
-            return None
+        validators = {}
+        with self.access.reading(), self.shared_searcher().searcher() as searcher:
+            for url in urls:
+                fields = searcher.document(url=url)
+                if fields:
+                    validators[url] = (fields.get("etag"), fields.get("last_modified"), fields.get("content_hash"))
 
+        return validators
+    
     def correct_string(self,input_string):
         """
         Checks if a search_input can be corrected
@@ -379,27 +544,24 @@ class Index:
             corrected.string (str): The corrected input
         """
 
-        index = self.open_index()
-
-        query = MultifieldParser(["title", "content"], index.schema).parse(input_string)
-
-        done = False
         output = ""
-        while not done:
-
-            self.wish_and_wait()
-            try:
-                with index.searcher() as searcher:
-                    corrected = searcher.correct_query(query, input_string)
-                    if corrected.query != query: # if query changed
-                        output = corrected.string
-                done = True
-
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
-            
+        shared = self.shared_searcher()
+        with self.access.reading(), shared.searcher() as searcher:
+            key = ("correct", normalize_query(input_string))
+            generation = self.cache_generation(shared, searcher)
+            if self.use_cache:
+                cached = self.query_cache().get(key, generation)
+                if cached is not None:
+                    return cached
+
+            query = MultifieldParser(["title", "content"], searcher.schema).parse(input_string)
+            corrected = searcher.correct_query(query, input_string)
+            if corrected.query != query: # if query changed
+                output = corrected.string
+
+            if self.use_cache:
+                self.query_cache().put(key, generation, output, 100 + 2 * len(input_string) + len(output))
+
         return output
     
     def is_in_index(self,url):
@@ -413,28 +575,39 @@ class Index:
             value (bool): True if is in index, False if not
         """
 
-        index = self.open_index()
+        return url in self.are_in_index([url])
+
+    def are_in_index(self, urls):
+        """
+        Checks which urls have an entry in the index, e.g. all links of a page at once. 
+        The urls are looked up in the term dictionary of the url field (no query is parsed or scored). 
+        The postings are used instead of reader.doc_frequency, because that still counts deleted entries until their segment is merged. 
+
+        Args:
+            urls (iterable): The urls to look for
+
+        Returns:
+            found (set): The urls that are in the index
+        """
 
-        # check if old entry exists
-        query = QueryParser("url", index.schema).parse(url)
+        found = set()
+        with self.access.reading(), self.shared_searcher().searcher() as searcher:
+            reader = searcher.reader()
+            for url in urls:
+                if ("url", url) in reader and reader.postings("url", url).is_active():
+                    found.add(url)
 
-        done = False
-        found = False
-        while not done:
+        return found
 
-            self.wish_and_wait()
-            try:
-                with index.searcher() as searcher:
-                    results = searcher.search(query)
+    def all_urls(self):
+        """
+        Gets the urls of all entries in the index from the term dictionary of the url field
 
-                    # if found something and the url is the same for the best match
-                    if len(results)> 0 and results[0]["url"]==url:
-                        found = True
-                done = True
+        Returns:
+            urls (list): all urls in the index
+        """
 
-            except LockError:
-                done = False
-            finally:
-                self.wish_granted = False
+        with self.access.reading(), self.shared_searcher().searcher() as searcher:
+            urls = [term.decode("utf-8") for term in searcher.lexicon("url")]
 
-        return found
\ No newline at end of file
+        return urls
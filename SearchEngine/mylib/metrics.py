@@ -0,0 +1,259 @@
+""" Counters, gauges and histograms of the crawler, exported as a Prometheus text file and a rolling json log """
+
+import bisect
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+class Histogram:
+    """
+    Counts observed values in buckets like a Prometheus histogram
+
+    Attributes:
+        buckets (list): the upper bounds of the buckets, sorted
+        counts (list): how many values are in each bucket (not cumulative), the last one is +Inf
+        sum (float): the sum of all values
+        count (int): how many values where observed
+    """
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Args:
+            q (float): between 0 and 1
+
+        Returns:
+            value (float): The upper bound of the bucket that contains the q quantile, None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+# name -> (type, help, label names, buckets)
+metric_specs = {
+    "crawler_fetch_seconds" : ("histogram", "Time until a response was downloaded", ("host",), (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20)),
+    "crawler_responses_total" : ("counter", "Responses by status code (timeout, error or too_large if there was none)", ("host", "code"), None),
+    "crawler_bytes_total" : ("counter", "Downloaded bytes of the response bodies", ("host",), None),
+    "crawler_parse_seconds" : ("histogram", "Time to turn a page into a PageRecord", (), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    "crawler_index_commit_seconds" : ("histogram", "Time to write one batch into the whoosh index", (), (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)),
+    "crawler_indexed_documents_total" : ("counter", "Documents written into the whoosh index", (), None),
+    "crawler_pages_total" : ("counter", "Crawled pages by what happened to them", ("result",), None),
+    "crawler_frontier_size" : ("gauge", "Urls waiting in the frontier", (), None),
+    "crawler_frontier_later" : ("gauge", "Urls in the frontier that are tried again later", (), None),
+    "crawler_seen_urls" : ("gauge", "Urls in the seen store", (), None),
+    "search_cache_requests_total" : ("counter", "Lookups in the search result cache by result (hit or miss)", ("result",), None),
+    "search_cache_evictions_total" : ("counter", "Results removed from the search result cache to stay within its limits", (), None),
+    "search_cache_entries" : ("gauge", "Results in the search result cache", (), None),
+    "search_cache_bytes" : ("gauge", "Estimated size of the results in the search result cache", (), None),
+}
+
+class CrawlMetrics:
+    """
+    One shared collection of all metrics of this process. The downloads record themselves in myfunctions.request_url,
+    the crawler records parsing, index commits, page results and the frontier. Rates (pages/sec, bytes/sec) are computed
+    for the json log, in Prometheus they are rate() of the counters.
+
+    Attributes:
+        _instance (CrawlMetrics): The one shared instance, use get_instance
+        values (dict): name (str) -> dict label values (tuple) -> value (float or Histogram)
+        prometheus_path (str): Where export writes the Prometheus text file, None to not write it
+        json_path (str): Where export appends a json line, None to not write it
+        interval (float): After how many seconds maybe_export exports again
+        max_json_bytes (int): If the json log is bigger, it is moved to json_path + ".1" and a new one is started
+        started (float): time.time() when the metrics were created
+        last_export (float): time.time() of the last export
+        last_totals (dict): the totals of the last export, used to compute the rates
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {name : {} for name in metric_specs}
+        self.prometheus_path = None
+        self.json_path = None
+        self.interval = 10.0
+        self.max_json_bytes = 10 * 1024 * 1024
+        self.started = time.time()
+        self.last_export = self.started
+        self.last_totals = {"pages" : 0, "bytes" : 0, "responses" : 0}
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Get the shared instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def set_output(self, prometheus_path = None, json_path = None, interval : float = 10.0):
+        """
+        Sets where maybe_export and export write the metrics
+
+        Args:
+            prometheus_path (str): The Prometheus text file (e.g. for the textfile collector of the node exporter)
+            json_path (str): The json log, one line for each export
+            interval (float): After how many seconds maybe_export exports again
+        """
+        self.prometheus_path = prometheus_path
+        self.json_path = json_path
+        self.interval = interval
+
+    def inc(self, name, labels = (), value = 1):
+        """ Increases a counter """
+        with self.lock:
+            self.values[name][labels] = self.values[name].get(labels, 0) + value
+
+    def set(self, name, value, labels = ()):
+        """ Sets a gauge """
+        with self.lock:
+            self.values[name][labels] = value
+
+    def observe(self, name, value, labels = ()):
+        """ Adds a value to a histogram """
+        with self.lock:
+            histogram = self.values[name].get(labels)
+            if histogram is None:
+                histogram = self.values[name][labels] = Histogram(metric_specs[name][3])
+            histogram.observe(value)
+
+    def record_fetch(self, url, latency = None, code = None, size = 0):
+        """
+        Records one request
+
+        Args:
+            url (str): The requested url
+            latency (float): The seconds until the response was downloaded, None if there was no response
+            code (int or str): The status code or "timeout", "error" or "too_large"
+            size (int): The bytes of the body
+        """
+        host = (urlparse(url).netloc,)
+        if latency is not None:
+            self.observe("crawler_fetch_seconds", latency, host)
+        self.inc("crawler_responses_total", host + (str(code),))
+        if size:
+            self.inc("crawler_bytes_total", host, size)
+
+    def total(self, name):
+        """ The sum of a counter over all labels """
+        with self.lock:
+            return sum(self.values[name].values())
+
+    def value(self, name, labels = ()):
+        """ The value of a counter or gauge for one set of labels (0 if it was never set) """
+        with self.lock:
+            return self.values[name].get(tuple(labels), 0)
+
+    def prometheus_text(self):
+        """
+        Returns:
+            text (str): All metrics in the Prometheus text format
+        """
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, label_names, _) in metric_specs.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self.values[name].items()):
+                    label_text = ",".join(f'{n}="{self._escape(v)}"' for n, v in zip(label_names, labels))
+                    if kind != "histogram":
+                        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + [float("inf")], value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append(f'{name}_bucket{{{label_text + "," if label_text else ""}le="{le}"}} {cumulative}')
+                    suffix = f"{{{label_text}}}" if label_text else ""
+                    lines.append(f"{name}_sum{suffix} {value.sum}")
+                    lines.append(f"{name}_count{suffix} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def snapshot(self):
+        """
+        The most important numbers for the json log, with the rates since the last snapshot
+
+        Returns:
+            snapshot (dict): time, rates, totals, latency quantiles per host, parse and commit times, frontier and response codes
+        """
+        now = time.time()
+        totals = {"pages" : self.total("crawler_pages_total"), "bytes" : self.total("crawler_bytes_total"),
+                  "responses" : self.total("crawler_responses_total")}
+        elapsed = max(now - self.last_export, 1e-9)
+        rates = {key + "_per_second" : round((totals[key] - self.last_totals[key]) / elapsed, 3) for key in totals}
+        self.last_totals = totals
+        self.last_export = now
+
+        with self.lock:
+            hosts = {labels[0] : {"p50" : h.quantile(0.5), "p95" : h.quantile(0.95), "count" : h.count, "mean" : round(h.sum / h.count, 4)}
+                     for labels, h in self.values["crawler_fetch_seconds"].items() if h.count}
+            histogram = lambda name: self.values[name].get(())
+            parse, commit = histogram("crawler_parse_seconds"), histogram("crawler_index_commit_seconds")
+            return {
+                "time" : round(now, 3),
+                "uptime" : round(now - self.started, 3),
+                "rates" : rates,
+                "totals" : totals,
+                "fetch_seconds" : hosts,
+                "parse_seconds" : {"p50" : parse.quantile(0.5), "p95" : parse.quantile(0.95), "count" : parse.count} if parse else None,
+                "index_commit_seconds" : {"p50" : commit.quantile(0.5), "p95" : commit.quantile(0.95), "count" : commit.count} if commit else None,
+                "pages" : {labels[0] : value for labels, value in self.values["crawler_pages_total"].items()},
+                "codes" : {f"{labels[0]} {labels[1]}" : value for labels, value in self.values["crawler_responses_total"].items()},
+                "frontier" : {"waiting" : self.values["crawler_frontier_size"].get(()), "later" : self.values["crawler_frontier_later"].get(()),
+                              "seen" : self.values["crawler_seen_urls"].get(())},
+            }
+
+    def export(self):
+        """
+        Writes the Prometheus text file (replaced at once, so it is never read half written) and appends a line to the json log
+        """
+        if self.prometheus_path:
+            temporary = self.prometheus_path + ".tmp"
+            with open(temporary, "w") as file:
+                file.write(self.prometheus_text())
+            os.replace(temporary, self.prometheus_path)
+
+        if self.json_path:
+            if os.path.isfile(self.json_path) and os.path.getsize(self.json_path) > self.max_json_bytes:
+                os.replace(self.json_path, self.json_path + ".1")
+            with open(self.json_path, "a") as file:
+                file.write(json.dumps(self.snapshot()) + "\n")
+        else:
+            self.last_export = time.time()
+
+    def maybe_export(self):
+        """
+        Exports if the last export is longer ago than interval
+
+        Returns:
+            value (bool): True if exported
+        """
+        if time.time() - self.last_export >= self.interval:
+            self.export()
+            return True
+        return False
@@ -1,82 +1,220 @@
 import time
 import requests
 import os
+import re
+import hashlib
 import logging
-from bs4 import BeautifulSoup
 
-def thread_highlights(index, results, all_matches):
+from mylib.extract import extract_page
+from mylib.ratecontrol import HostRateController
+from mylib.httpsession import HttpSession, ResponseTooLarge
+from mylib.metrics import CrawlMetrics
+
+def thread_highlights(index, input_string, pagenum, pagelen, pages):
     """
-    The thread function that gets highlights and favicon in the background when given to a thread. Appends the results to global all_matches
+    The thread function that searches one page of results and gets highlights and favicon in the background when given to a thread. Saves the results in pages
 
     Args:
-        index (index.Index): The index to use the get_highlights_and_favicon from
-        results (list): The results of Index.search [(title, url, SavingHighlighter), ...]
+        index (index.Index): The index to use the search_page and get_highlights_and_favicon from
+        input_string (str): The search query
+        pagenum (int): The page to load, the first one is 1
+        pagelen (int): How many results are on a page
+        pages (dict): pagenum -> [(title, url, highlights, favicon_url), ...], the page is added here
     """
 
-    results_with_hf = index.get_highlights_and_favicon(results)
+    _, _, results = index.search_page(input_string, pagenum, pagelen)
 
-    all_matches.append(results_with_hf)
+    pages[pagenum] = index.get_highlights_and_favicon(results)
 
-def get_page(url, timeout_in_seconds, custom_headers, printing = False):
+def get_page(url, timeout_in_seconds, custom_headers, printing = False, max_wait = None):
         """
         retrieves a webpage given an url
 
         Args in one tuple:
             url (str): The url to retrieve from
-            timeout_in_seconds (int): used for requests timeout
+            timeout_in_seconds (int): the shortest timeout for requests, the HostRateController may give more time to slow hosts
             custom_headers (dict): Object used for header in requests
             printing (bool): Whether to print the result
+            max_wait (float): If given, give up (code -1) instead of waiting longer than that for the host to be allowed again
 
         Returns:
             code (int): 1 for successful, 0 for was not html or not ok, -1 for server is too slow, 503 for 503
-            soup (bs4.BeautifulSoup): The content of the webpage if code = 1
+            record (extract.PageRecord): The title, text, links and favicon of the webpage if code = 1
         """
 
-        try:
-            response = requests.get(url, timeout=timeout_in_seconds, headers=custom_headers)
+        code, response = fetch_page(url, timeout_in_seconds, custom_headers, printing, max_wait=max_wait)
+        if code == 1:
+            record = parse_page(response, url)
+            if record:
+                return 1, record
+            return 0, None
+        return code, None
+
+def fetch_page(url, timeout_in_seconds, custom_headers, printing = False, etag = None, last_modified = None, max_wait = None, attempts = 3):
+        """
+        downloads a webpage given an url without parsing it. If etag or last_modified are given the request is conditional, 
+        so the server can answer with 304 if the page did not change.
+        The request is sent by request_url, which keeps the politeness and the rate of each host.
 
+        Args:
+            url (str): The url to retrieve from
+            timeout_in_seconds (int): the shortest timeout for requests, the HostRateController may give more time to slow hosts
+            custom_headers (dict): Object used for header in requests
+            printing (bool): Whether to print the result
+            etag (str): The ETag header of the last version of the page
+            last_modified (str): The Last-Modified header of the last version of the page
+            max_wait (float): If given, give up (code -1) instead of waiting longer than that for the host to be allowed again
+            attempts (int): How often to try if the request times out or the connection fails
+
+        Returns:
+            code (int): 1 for successful html, 0 for was not html, not ok or too large, -1 for server is too slow, 503 for 503, 304 for not modified
+            response (requests.Response): The response if code = 1
+        """
+
+        headers = custom_headers
+        if etag or last_modified:
+            headers = dict(custom_headers)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            response = request_url(url, timeout_in_seconds, headers, max_wait, attempts)
+        except ResponseTooLarge:
             if printing:
-                print("\n",response.status_code, url)
-            
-            # if no error message and it is an html response
-            if response.ok and "text/html" in response.headers["content-type"]:
-
-                # analyse it and update index
-                soup = BeautifulSoup(response.content, 'html.parser') 
-                if soup and soup.text and soup.title:
-                    return 1, soup
-            
-            if response.status_code == 503: # Service Unavailable
-                return 503, None
+                print("\ntoo large", url)
             return 0, None
-            
-        except requests.exceptions.Timeout:
-
-            if timeout_in_seconds > 20:
-                return -1, None
-            
-            # the server seems to be too slow, give more time
-            timeout_in_seconds += 1
-
-            # Need to try again.
-            time.sleep(timeout_in_seconds / 2)
-            return get_page(url,timeout_in_seconds,custom_headers)
+
+        if response is None:
+            return -1, None
+
+        if printing:
+            print("\n",response.status_code, url)
+
+        if response.status_code == 304: # Not Modified
+            return 304, None
+        
+        # if no error message and it is an html response
+        if response.ok and "text/html" in response.headers.get("content-type", ""):
+            return 1, response
         
-        except requests.exceptions.ConnectionError:
+        if response.status_code in (429, 503): # Too Many Requests or Service Unavailable
+            return 503, None
+        return 0, None
 
-            if timeout_in_seconds > 20:
-                return -1, None
-            
-            # the server seems to be too slow, give more time
-            timeout_in_seconds += 1
+def request_url(url, timeout_in_seconds, headers, max_wait = None, attempts = 3):
+        """
+        Sends a GET request with the shared HttpSession, so open connections are reused. 
+        Every request waits for the shared HostRateController and tells it how long the host took and how it answered,
+        so the rate and the timeout of each host follow how the host is doing. Every attempt is counted in the shared metrics.CrawlMetrics.
 
-            # Need to try again.
-            time.sleep(timeout_in_seconds / 2)
-            return get_page(url,timeout_in_seconds,custom_headers)
+        Args:
+            url (str): The url to retrieve from
+            timeout_in_seconds (int): the shortest timeout for requests, the HostRateController may give more time to slow hosts
+            headers (dict): Object used for header in requests
+            max_wait (float): If given, give up instead of waiting longer than that for the host to be allowed again
+            attempts (int): How often to try if the request times out or the connection fails
 
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred: {e}")
-            return -1, None
+        Returns:
+            response (requests.Response): The response with any status code, None if the server is too slow or not reachable
+
+        Raises:
+            httpsession.ResponseTooLarge: If the response is bigger than HttpSession.max_bytes
+        """
+
+        controller = HostRateController.get_instance()
+        session = HttpSession.get_instance() # keeps the connections to the hosts open
+        metrics = CrawlMetrics.get_instance()
+
+        for _ in range(attempts):
+
+            # wait until the host may get the next request, the controller slows down after timeouts and errors
+            if not controller.wait(url, max_wait):
+                return None
+
+            timeout = max(timeout_in_seconds, controller.timeout(url))
+            sent = time.monotonic()
+            try:
+                response = session.get(url, timeout, headers)
+
+            except ResponseTooLarge:
+                controller.record(url, time.monotonic() - sent, 200)
+                metrics.record_fetch(url, time.monotonic() - sent, "too_large")
+                raise
+
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                # the server seems to be too slow, the controller gives it more time and fewer requests
+                controller.record(url, timed_out=True)
+                metrics.record_fetch(url, code="timeout")
+                continue
+
+            except requests.exceptions.RequestException as e:
+                print(f"An error occurred: {e}")
+                metrics.record_fetch(url, code="error")
+                return None
+
+            latency = time.monotonic() - sent
+            controller.record(url, latency, response.status_code, retry_after=response.headers.get("Retry-After"))
+            metrics.record_fetch(url, latency, response.status_code, len(response.content))
+            return response
+
+        return None
+
+def parse_page(response, url):
+        """
+        parses the html of a webpage into a compact record, the parsed html is not kept
+
+        Args:
+            response (requests.Response): The response with the html
+            url (str): The url of the page
+
+        Returns:
+            record (extract.PageRecord): The parsed page or None if it has no title or no text
+        """
+
+        return extract_page(response.content, url, page_encoding(response))
+
+def page_encoding(response):
+    """
+    Gets the charset of a response, but only if the server sent one (requests guesses ISO-8859-1 else)
+
+    Args:
+        response (requests.Response): The response
+
+    Returns:
+        encoding (str): The charset or None, then the parser finds it in the html
+    """
+    if "charset" in response.headers.get("content-type", "").lower():
+        return response.encoding
+    return None
+
+def page_validators(response):
+    """
+    Gets the headers that are needed for a conditional request of the same page later
+
+    Args:
+        response (requests.Response): The response of the page
+
+    Returns:
+        etag (str): The ETag header or None
+        last_modified (str): The Last-Modified header or None
+    """
+    return response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+def content_hash(title, text):
+    """
+    A hash of the content of a page, that does not change if only the whitespace changed
+
+    Args:
+        title (str): The title of the page
+        text (str): The text of the page
+
+    Returns:
+        hash (str): hex digest
+    """
+    normalized = re.sub(r"\s+", " ", title + "\n" + text).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
 
 def create_logger(folder,filename,level = logging.DEBUG, format = '%(asctime)s - %(levelname)s - %(message)s'):
     """
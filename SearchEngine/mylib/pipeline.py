@@ -0,0 +1,67 @@
+""" Stages of the concurrent crawl pipeline that run next to the fetching and parsing """
+
+import queue
+import threading
+
+class IndexWriterStage(threading.Thread):
+    """
+    The only stage that writes crawled pages into the whoosh index. Batches are given to it through a bounded queue,
+    so the crawler has to wait (backpressure) if the index can not keep up.
+
+    Attributes:
+        index (index.Index): The index to write to
+        on_indexed (function): Called with the list of urls of each batch after it was committed
+        queue (queue.Queue): The batches waiting to be written
+        error (Exception): The first error raised while writing, raised again in close
+    """
+
+    def __init__(self, index, on_indexed = None, maxsize : int = 4):
+        """
+        Args:
+            index (index.Index): The index to write to
+            on_indexed (function): Called with the list of urls of each batch after it was committed
+            maxsize (int): How many batches can wait before submit blocks
+        """
+        super().__init__(daemon=True, name="index-writer-stage")
+        self.index = index
+        self.on_indexed = on_indexed
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+
+    def submit(self, batch):
+        """
+        Adds a batch to the queue, blocks while the queue is full
+
+        Args:
+            batch (list): elements in the format of Crawler.preliminary_index (record, url, etag, last_modified)
+        """
+        if self.error:
+            raise self.error
+        if batch:
+            self.queue.put(batch)
+
+    def run(self):
+        """
+        Writes the batches until close is called
+        """
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            if self.error: # do not write anything after an error, the pages stay in the frontier
+                continue
+            try:
+                self.index.list_to_Index(batch)
+                if self.on_indexed:
+                    self.on_indexed([url for _, url, _, _ in batch])
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """
+        Writes everything that is still in the queue and stops the thread
+        """
+        self.queue.put(None)
+        self.join()
+        if self.error:
+            raise self.error
@@ -0,0 +1,65 @@
+""" Token buckets that limit how often requests are sent to a host """
+
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """
+    A token bucket that limits how often requests may be sent. A token is refilled every 1/rate seconds, up to capacity tokens.
+    Reservations may go into debt, so many callers asking at once are spaced out evenly instead of all waiting for the same token.
+
+    Attributes:
+        rate (float): How many tokens are refilled per second
+        capacity (int): How many tokens can be saved up for a burst
+        tokens (float): The tokens available right now (negative if already reserved in advance)
+        last (float): time.monotonic() of the last refill
+    """
+
+    def __init__(self, rate : float, capacity : int = 1):
+        """
+        Args:
+            rate (float): How many requests per second are allowed on average
+            capacity (int): How many requests may be sent at once after a quiet period
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_delay = None):
+        """
+        Takes one token, even if it is only available in the future
+
+        Args:
+            max_delay (float): If given, no token is taken if it is only available after more than max_delay seconds
+
+        Returns:
+            delay (float): How many seconds to wait before the token may be used, None if longer than max_delay
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            if max_delay is not None and delay > max_delay:
+                return None
+            self.tokens -= 1
+            return delay
+
+    def wait(self):
+        """
+        Blocks the current thread until one token may be used
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire(self):
+        """
+        Waits in the event loop until one token may be used
+        """
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,279 @@
+""" Decides which url of the frontier the crawler visits next and which urls are crawler traps """
+
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse, parse_qsl
+
+class DepthScorer:
+    """
+    The url with the smallest depth is visited first (breadth first), so the top level pages come before long trails of links.
+    Every scorer has the methods priority and links_found, a smaller priority is visited first.
+    """
+
+    def priority(self, url, depth):
+        """
+        Args:
+            url (str): The url in the frontier
+            depth (int): The depth of the url
+
+        Returns:
+            priority (tuple): The url with the smallest priority is visited next
+        """
+        return (depth,)
+
+    def links_found(self, url, links):
+        """
+        Called after a page was downloaded with all links on it to the same server (also the ones that were seen before)
+
+        Args:
+            url (str): The url of the downloaded page
+            links (list): The urls it links to
+
+        Returns:
+            changed (list): The urls whose priority changed
+        """
+        return []
+
+    def load(self, scores):
+        """
+        Called by the frontier with the scores saved by the last run, before the priorities of the waiting urls are computed
+
+        Args:
+            scores (iterable): tuples (url (str), score (float))
+        """
+        pass
+
+    def changes(self):
+        """
+        Called by the frontier at each commit to save the scores that changed since the last call
+
+        Returns:
+            scores (list): tuples (url (str), score (float)) to save
+            removed (list): urls whose score is not kept anymore
+        """
+        return [], []
+
+class InlinkScorer(DepthScorer):
+    """
+    The url most other pages link to is visited first, for the same number of links the smaller depth first.
+    At most max_urls counts are kept, when there are more the smallest ones are removed (these urls are visited last anyway).
+
+    Attributes:
+        inlinks (collections.defaultdict): url (str) -> how many downloaded pages link to it
+        max_urls (int): How many counts are kept at most
+        changed (set): urls whose count was not saved yet
+        removed (set): urls whose count was removed and not deleted from the frontier yet
+    """
+
+    def __init__(self, max_urls : int = 100000):
+        """
+        Args:
+            max_urls (int): How many counts are kept at most
+        """
+        self.inlinks = defaultdict(int)
+        self.max_urls = max_urls
+        self.changed = set()
+        self.removed = set()
+
+    def priority(self, url, depth):
+        return (-self.inlinks.get(url, 0), depth)
+
+    def links_found(self, url, links):
+        links = set(links)
+        links.discard(url)
+        for link in links:
+            self.inlinks[link] += 1
+        self.changed.update(links)
+        self.removed.difference_update(links)
+        if len(self.inlinks) > self.max_urls:
+            self._shrink()
+        return list(links)
+
+    def _shrink(self):
+        """ Removes the smallest counts until a quarter of max_urls is free again, so it does not happen for every page """
+        keep = self.max_urls * 3 // 4
+        for url, _ in sorted(self.inlinks.items(), key=lambda item: item[1])[:len(self.inlinks) - keep]:
+            del self.inlinks[url]
+            self.changed.discard(url)
+            self.removed.add(url)
+
+    def load(self, scores):
+        self.inlinks.update((url, int(score)) for url, score in scores)
+        if len(self.inlinks) > self.max_urls:
+            self._shrink()
+
+    def changes(self):
+        scores = [(url, self.inlinks[url]) for url in self.changed]
+        removed = list(self.removed)
+        self.changed = set()
+        self.removed = set()
+        return scores, removed
+
+class OpicScorer(DepthScorer):
+    """
+    Online Page Importance Computation: every page has some cash, the start page gets 1. When a page is downloaded
+    its cash is split between the pages it links to. The url with the most cash is visited first,
+    so the importance is estimated while crawling without computing a PageRank.
+    The cash is saved by the frontier, the history only belongs to this run.
+
+    Attributes:
+        cash (collections.defaultdict): url (str) -> cash of the url that was not given away yet
+        history (collections.defaultdict): url (str) -> all cash the url has got so far
+        changed (set): urls whose cash was not saved yet
+        removed (set): urls whose cash was given away and not deleted from the frontier yet
+    """
+
+    def __init__(self):
+        self.cash = defaultdict(float)
+        self.history = defaultdict(float)
+        self.changed = set()
+        self.removed = set()
+
+    def priority(self, url, depth):
+        # urls without cash (e.g. the start_url or from a sitemap) get the cash of a start page
+        return (-self.cash.get(url, 1.0), depth)
+
+    def links_found(self, url, links):
+        links = set(links)
+        links.discard(url)
+        cash = self.cash.pop(url, 1.0)
+        self.history[url] += cash
+        self.changed.discard(url)
+        self.removed.add(url)
+        if not links:
+            return []
+        share = cash / len(links)
+        for link in links:
+            self.cash[link] += share
+        self.changed.update(links)
+        self.removed.difference_update(links)
+        return list(links)
+
+    def load(self, scores):
+        self.cash.update(scores)
+
+    def changes(self):
+        scores = [(url, self.cash[url]) for url in self.changed]
+        removed = list(self.removed)
+        self.changed = set()
+        self.removed = set()
+        return scores, removed
+
+scorers = {"depth" : DepthScorer, "inlinks" : InlinkScorer, "opic" : OpicScorer}
+
+def create_scorer(name):
+    """
+    Args:
+        name (str): "depth", "inlinks" or "opic"
+
+    Returns:
+        scorer (DepthScorer): A new scorer of this kind
+    """
+    if name not in scorers:
+        raise ValueError(f"Unknown scorer {name}, use one of {', '.join(scorers)}")
+    return scorers[name]()
+
+class TrapDetector:
+    """
+    Finds urls that are most likely crawler traps: endless calendars, pagination, session ids or paths that repeat themselves.
+    Numbers in the path and the values of the query are replaced to get the pattern of an url.
+    If too many urls have the same pattern, the rest of them is not visited.
+    If path is given, the counts of the patterns are saved there in SQLite (at each commit), so a resumed crawl does not let a trap
+    fill the frontier again.
+
+    Attributes:
+        path (str): The SQLite file, None to keep the counts only in memory
+        max_length (int): longer urls are traps
+        max_segments (int): urls with more path segments are traps
+        max_repeats (int): urls where the same path segment appears more often are traps
+        max_per_pattern (int): how many urls with the same pattern are visited
+        patterns (collections.defaultdict): pattern (str) -> how many urls with it where checked
+        traps (int): how many traps where found
+    """
+
+    digits_re = re.compile(r"\d+")
+
+    def __init__(self, path : str = None, max_length : int = 300, max_segments : int = 12, max_repeats : int = 3, max_per_pattern : int = 1000):
+        """
+        Args:
+            path (str): The SQLite file, None to keep the counts only in memory
+            max_length (int): longer urls are traps
+            max_segments (int): urls with more path segments are traps
+            max_repeats (int): urls where the same path segment appears more often are traps
+            max_per_pattern (int): how many urls with the same pattern are visited
+        """
+        self.max_length = max_length
+        self.max_segments = max_segments
+        self.max_repeats = max_repeats
+        self.max_per_pattern = max_per_pattern
+        self.patterns = defaultdict(int)
+        self.traps = 0
+        self.changed = set()
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS patterns (pattern TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            self.connection.commit()
+            self.patterns.update(self.connection.execute("SELECT pattern, count FROM patterns"))
+
+    def pattern(self, url):
+        """
+        Args:
+            url (str): The url
+
+        Returns:
+            pattern (str): The url without numbers in the path and without the values of the query
+        """
+        parsed = urlparse(url)
+        keys = sorted(key for key, _ in parse_qsl(parsed.query, keep_blank_values=True))
+        return parsed.netloc + self.digits_re.sub("0", parsed.path) + "?" + "&".join(keys)
+
+    def is_trap(self, url):
+        """
+        Checks an url that is new to the crawler and counts its pattern. Call it only once for each url.
+
+        Args:
+            url (str): The new url
+
+        Returns:
+            value (bool): True if the url should not be visited
+        """
+        segments = [segment for segment in urlparse(url).path.split("/") if segment]
+
+        trap = len(url) > self.max_length or len(segments) > self.max_segments
+        if not trap and segments:
+            trap = max(segments.count(segment) for segment in set(segments)) > self.max_repeats
+        if not trap:
+            pattern = self.pattern(url)
+            with self.lock:
+                self.patterns[pattern] += 1
+                self.changed.add(pattern)
+                trap = self.patterns[pattern] > self.max_per_pattern
+
+        if trap:
+            self.traps += 1
+        return trap
+
+    def commit(self):
+        """ Saves the counts that changed since the last commit """
+        if self.connection is None:
+            return
+        with self.lock:
+            rows = [(pattern, self.patterns[pattern]) for pattern in self.changed]
+            self.changed = set()
+            self.connection.executemany("INSERT OR REPLACE INTO patterns (pattern, count) VALUES (?, ?)", rows)
+            self.connection.commit()
+
+    def close(self):
+        """ Saves the counts and closes the SQLite file """
+        if self.connection is None:
+            return
+        self.commit()
+        with self.lock:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,149 @@
+""" A cache for the results of the searches, emptied when a new generation of the index was committed """
+
+import os
+import threading
+from collections import OrderedDict
+
+from mylib.metrics import CrawlMetrics
+
+def normalize_query(input_string):
+    """
+    Args:
+        input_string (str): A search query
+
+    Returns:
+        query (str): The query without extra whitespace. The case is kept, because AND, OR and NOT are operators only in upper case
+    """
+    return " ".join((input_string or "").split())
+
+class QueryCache:
+    """
+    A least recently used cache for search results, with a limit for the number of entries and for their estimated size in bytes.
+    Every entry belongs to a generation of the whoosh index. When a lookup or a new entry has another generation
+    (a writer committed, the index was rebuilt), all entries are removed. Hits, misses and evictions are counted
+    in metrics.CrawlMetrics (search_cache_*), so the app shows them at /metrics.
+
+    Attributes:
+        _instances (dict): The cache of each index directory (absolute path)
+        max_entries (int): How many results are kept at most
+        max_bytes (int): How many bytes (estimated by the caller) the results may have together
+        entries (collections.OrderedDict): key -> (value, size), the least recently used first
+        size (int): The estimated bytes of all entries
+        generation (tuple): The version of the index the entries belong to (see index.Index.cache_generation)
+        hits (int): How many lookups found an entry
+        misses (int): How many lookups found nothing
+        evictions (int): How many entries were removed to stay within the limits
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, max_entries : int = 1000, max_bytes : int = 32 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int): How many results are kept at most
+            max_bytes (int): How many bytes (estimated by the caller) the results may have together
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.metrics = CrawlMetrics.get_instance()
+
+    @classmethod
+    def get_instance(cls, index_path):
+        """
+        Get the cache of an index directory
+
+        Args:
+            index_path (str): The directory of the whoosh index
+
+        Returns:
+            cache (QueryCache)
+        """
+        key = os.path.abspath(index_path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls()
+            return cls._instances[key]
+
+    def _check_generation(self, generation):
+        """ Removes all entries if they belong to another generation (with self.lock) """
+        if generation != self.generation:
+            self.entries.clear()
+            self.size = 0
+            self.generation = generation
+            self._update_gauges()
+
+    def _update_gauges(self):
+        self.metrics.set("search_cache_entries", len(self.entries))
+        self.metrics.set("search_cache_bytes", self.size)
+
+    def get(self, key, generation):
+        """
+        Args:
+            key (tuple): The key of the result, e.g. ("search", normalized query, page)
+            generation (tuple): The version of the index now
+
+        Returns:
+            value: The cached result, None if there is none
+        """
+        with self.lock:
+            self._check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self.metrics.inc("search_cache_requests_total", ("miss",))
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.metrics.inc("search_cache_requests_total", ("hit",))
+            return entry[0]
+
+    def put(self, key, generation, value, size):
+        """
+        Saves a result. The least recently used results are removed until the limits are kept.
+
+        Args:
+            key (tuple): The key of the result
+            generation (tuple): The version of the index the result was found in
+            value: The result
+            size (int): The estimated size of the result in bytes, a result bigger than max_bytes is not saved
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._check_generation(generation)
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+                self.metrics.inc("search_cache_evictions_total")
+            self._update_gauges()
+
+    def clear(self):
+        """ Removes all entries, e.g. after the index directory was replaced """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.generation = None
+            self._update_gauges()
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): hits, misses, hit_rate, evictions, entries, bytes and generation
+        """
+        with self.lock:
+            requests = self.hits + self.misses
+            return {"hits" : self.hits, "misses" : self.misses, "hit_rate" : round(self.hits / requests, 4) if requests else None,
+                    "evictions" : self.evictions, "entries" : len(self.entries), "bytes" : self.size, "generation" : self.generation}
@@ -0,0 +1,295 @@
+""" Adapts the request rate and timeout for each host to how the host is doing """
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from mylib.politeness import TokenBucket
+
+class HostState:
+    """
+    What the HostRateController knows about one host
+
+    Attributes:
+        host (str): The netloc of the host
+        bucket (politeness.TokenBucket): Limits the requests to the current rate
+        timeout (float): The timeout for the next request
+        latency (float): EWMA of the response times in seconds (None before the first response)
+        error_rate (float): EWMA of the errors (1 for an error, 0 for a success)
+        backoff_until (float): time.monotonic() until no request may be sent (503, 429 or Retry-After)
+        consecutive_errors (int): errors since the last success
+        max_rate (float): The highest rate the host allows (from the Crawl-delay in robots.txt), None if the host did not say
+        requests (int): How many requests where sent
+        errors (int): How many of them failed
+    """
+
+    def __init__(self, host, rate, timeout):
+        """
+        Args:
+            host (str): The netloc of the host
+            rate (float): The starting rate in requests per second
+            timeout (float): The starting timeout in seconds
+        """
+        self.host = host
+        self.bucket = TokenBucket(rate, 1)
+        self.timeout = timeout
+        self.latency = None
+        self.error_rate = 0.0
+        self.backoff_until = 0.0
+        self.consecutive_errors = 0
+        self.max_rate = None
+        self.requests = 0
+        self.errors = 0
+
+    def to_dict(self):
+        """ The state as a dict that can be saved as json """
+        return {
+            "rate" : round(self.bucket.rate, 3),
+            "timeout" : round(self.timeout, 3),
+            "latency" : None if self.latency is None else round(self.latency, 3),
+            "error_rate" : round(self.error_rate, 3),
+            "backoff_seconds" : round(max(0.0, self.backoff_until - time.monotonic()), 3),
+            "requests" : self.requests,
+            "errors" : self.errors,
+        }
+
+class HostRateController:
+    """
+    One shared controller for all requests of this process (crawler, update daemon and highlights).
+    It tracks the latency and errors of each host with an EWMA and changes the rate of each host with AIMD:
+    the rate grows by increase after each success and is multiplied by decrease after each error.
+    The timeout follows the latency and doubles after each timeout. 503 and 429 answers stop all requests to the host for a while,
+    as long as the Retry-After header says or else exponentially longer.
+    Because every host has its own state, a slow host only slows down the requests to itself.
+    If a schedule is set (see set_schedule), every request also waits for it, so several processes share the rate of a host.
+
+    Attributes:
+        _instance (HostRateController): The one shared instance, use get_instance
+        hosts (dict): netloc (str) -> HostState
+        initial_rate, min_rate, max_rate (float): requests per second
+        increase (float): added to the rate after a success
+        decrease (float): factor for the rate after an error
+        alpha (float): weight of the newest value in the EWMAs
+        min_timeout, max_timeout (float): bounds of the timeout in seconds
+        max_backoff (float): the longest time in seconds a host is paused
+        schedule (coordinator.HostSchedule): The schedule shared with other processes, None if this process crawls alone
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, initial_rate = 2.0, min_rate = 0.2, max_rate = 20.0, increase = 0.2, decrease = 0.5, alpha = 0.2,
+                 min_timeout = 2.0, max_timeout = 20.0, max_backoff = 300.0):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.alpha = alpha
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_backoff = max_backoff
+        self.schedule = None
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Get the shared instance
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def host(self, url):
+        """
+        Get the state of the host of url
+
+        Args:
+            url (str): any url on the host
+
+        Returns:
+            state (HostState)
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostState(host, self.initial_rate, self.min_timeout)
+            return self.hosts[host]
+
+    def timeout(self, url):
+        """
+        Args:
+            url (str): any url on the host
+
+        Returns:
+            timeout (float): The timeout to use for the next request to the host
+        """
+        return self.host(url).timeout
+
+    def limit_rate(self, rate):
+        """
+        Never lets the rate of any host grow above rate (e.g. the --host-rate of a crawl), the hosts that are faster already are slowed down
+
+        Args:
+            rate (float): The highest rate in requests per second
+        """
+        with self.lock:
+            self.max_rate = rate
+            self.initial_rate = min(self.initial_rate, rate)
+            for state in self.hosts.values():
+                state.bucket.rate = min(state.bucket.rate, rate)
+
+    def set_schedule(self, schedule):
+        """
+        Lets every request of wait (page downloads with their retries, robots.txt, sitemaps and favicons) also wait for a schedule
+        that is shared with other processes. acquire does not use it, the async crawler runs in one process.
+
+        Args:
+            schedule (coordinator.HostSchedule): The shared schedule, None to remove it
+        """
+        self.schedule = schedule
+
+    def set_crawl_delay(self, url, seconds):
+        """
+        Never sends requests to the host faster than one every seconds (the Crawl-delay of robots.txt)
+
+        Args:
+            url (str): any url on the host
+            seconds (float): The delay between two requests, None or 0 to remove the limit
+        """
+        state = self.host(url)
+        with self.lock:
+            state.max_rate = 1 / seconds if seconds else None
+            if state.max_rate:
+                state.bucket.rate = min(state.bucket.rate, state.max_rate)
+
+    def reserve(self, url, max_wait = None):
+        """
+        Reserves the next request to the host
+
+        Args:
+            url (str): The url to request
+            max_wait (float): If given, nothing is reserved if the request would have to wait longer
+
+        Returns:
+            delay (float): How many seconds to wait before sending the request, None if longer than max_wait
+        """
+        state = self.host(url)
+        backoff = max(0.0, state.backoff_until - time.monotonic())
+        if max_wait is not None and backoff > max_wait:
+            return None
+        delay = state.bucket.reserve(None if max_wait is None else max_wait - backoff)
+        if delay is None:
+            return None
+        return backoff + delay
+
+    def wait(self, url, max_wait = None):
+        """
+        Blocks the current thread until a request to the host of url is allowed
+
+        Args:
+            url (str): The url to request
+            max_wait (float): If given, do not wait longer than that
+
+        Returns:
+            value (bool): False if the request would have to wait longer than max_wait
+        """
+        delay = self.reserve(url, max_wait)
+        if delay is None:
+            return False
+        if delay:
+            time.sleep(delay)
+        if self.schedule is not None:
+            max_rate = self.host(url).max_rate
+            return self.schedule.wait(url, 1 / max_rate if max_rate else None, None if max_wait is None else max(max_wait - delay, 0))
+        return True
+
+    async def acquire(self, url):
+        """
+        Waits in the event loop until a request to the host of url is allowed
+        """
+        delay = self.reserve(url)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def record(self, url, latency = None, status = None, timed_out = False, retry_after = None):
+        """
+        Updates the state of the host after a request
+
+        Args:
+            url (str): The requested url
+            latency (float): The response time in seconds, None if there was no response
+            status (int): The http status code, None if there was no response
+            timed_out (bool): True if the request timed out
+            retry_after (str): The Retry-After header of the response
+        """
+        state = self.host(url)
+        with self.lock:
+            state.requests += 1
+
+            if latency is not None:
+                state.latency = latency if state.latency is None else (1 - self.alpha) * state.latency + self.alpha * latency
+
+            error = status is None or status in (429, 503) or status >= 500
+            state.error_rate = (1 - self.alpha) * state.error_rate + self.alpha * (1.0 if error else 0.0)
+
+            if error:
+                state.errors += 1
+                state.consecutive_errors += 1
+                # multiplicative decrease
+                state.bucket.rate = max(min(self.min_rate, state.max_rate or self.min_rate), state.bucket.rate * self.decrease)
+                if timed_out:
+                    state.timeout = min(self.max_timeout, state.timeout * 2)
+                if status in (429, 503):
+                    pause = self.parse_retry_after(retry_after)
+                    if pause is None:
+                        pause = 2 ** state.consecutive_errors
+                    state.backoff_until = time.monotonic() + min(self.max_backoff, pause)
+            else:
+                state.consecutive_errors = 0
+                # additive increase
+                state.bucket.rate = min(state.max_rate or self.max_rate, self.max_rate, state.bucket.rate + self.increase)
+                # the timeout slowly goes back to a few times the usual latency
+                if state.latency is not None:
+                    target = min(self.max_timeout, max(self.min_timeout, 4 * state.latency))
+                    state.timeout = max(target, state.timeout - 0.5)
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Args:
+            value (str): A Retry-After header, seconds or a http date
+
+        Returns:
+            seconds (float): How many seconds to wait, None if value is empty or not valid
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+    def state(self):
+        """
+        The current state of all hosts
+
+        Returns:
+            state (dict): netloc (str) -> dict with rate, timeout, latency, error_rate, backoff_seconds, requests and errors
+        """
+        with self.lock:
+            return {host : state.to_dict() for host, state in self.hosts.items()}
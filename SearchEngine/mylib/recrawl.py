@@ -0,0 +1,134 @@
+""" Decides which indexed pages are checked again, from how often each page changed before (Poisson change model) """
+
+import math
+from datetime import datetime
+
+def poisson_change_rate(checks, changes, observed_seconds, prior_rate, prior_checks = 2):
+    """
+    Estimates how often a page changes, if its changes are a Poisson process and only some checks are known
+    (a check only shows whether the page changed at least once since the check before).
+    Uses the estimator of Cho and Garcia-Molina (-log((n - X + 0.5) / (n + 0.5)) / mean interval), which does not become
+    infinite if every check found a change. It is mixed with prior_rate like prior_checks checks, so a page that was checked
+    only a few times without a change is still checked again.
+
+    Args:
+        checks (int): How many checks are in the history (n)
+        changes (int): How many of them found a changed page (X)
+        observed_seconds (float): The sum of the times between the checks and the checks before them
+        prior_rate (float): The changes per day assumed for a page without history
+        prior_checks (float): How many checks the prior counts as
+
+    Returns:
+        rate (float): The estimated changes per day
+    """
+    if checks <= 0 or observed_seconds <= 0:
+        return prior_rate
+    mean_interval = observed_seconds / checks / 86400
+    rate = -math.log((checks - changes + 0.5) / (checks + 0.5)) / mean_interval
+    return (rate * checks + prior_rate * prior_checks) / (checks + prior_checks)
+
+class RecrawlScheduler:
+    """
+    Chooses the pages to check again, so most pages in the index are up to date with a limited number of requests per day.
+    The change rate of each page is estimated from its history in the fetchlog.FetchLog, the probability that it changed since
+    the last check is 1 - exp(-rate * time since then). The pages with the highest probability are checked first.
+    A page is not checked again before min_interval, so pages that change all the time do not take the whole budget
+    (checking them more often would not keep them up to date anyway). The sitemap lastmod dates overrule the estimate.
+
+    Attributes:
+        fetch_log (fetchlog.FetchLog): The change history of the pages
+        daily_budget (int): How many pages may be checked in one day
+        min_interval (float): The shortest time in days between two checks of a page
+        prior_rate (float): The changes per day assumed for a page without history
+        history (dict): fetchlog.FetchLog.history, loaded by refresh
+        lastmods (dict): url (str) -> lastmod (datetime.datetime) from the sitemaps, loaded by refresh
+        now (datetime.datetime): The time of refresh, used for all probabilities until the next refresh
+        carry (float): The part of a request that was left over by the last batch_size
+    """
+
+    def __init__(self, fetch_log, daily_budget : int = 2000, min_interval_in_hours : float = 6, prior_days : float = 30):
+        """
+        Args:
+            fetch_log (fetchlog.FetchLog): The change history of the pages
+            daily_budget (int): How many pages may be checked in one day
+            min_interval_in_hours (float): The shortest time between two checks of a page
+            prior_days (float): A page without history is assumed to change once in this many days
+        """
+        self.fetch_log = fetch_log
+        self.daily_budget = daily_budget
+        self.min_interval = min_interval_in_hours / 24
+        self.prior_rate = 1 / prior_days
+        self.history = {}
+        self.lastmods = {}
+        self.now = datetime.utcnow()
+        self.carry = 0.0
+
+    def refresh(self, lastmods = None):
+        """
+        Loads the history again, call it before choosing the next pages
+
+        Args:
+            lastmods (dict): url (str) -> lastmod (datetime.datetime) from the sitemaps (discovery.Discovery.lastmods)
+        """
+        self.history = self.fetch_log.history()
+        self.lastmods = lastmods or {}
+        self.now = datetime.utcnow()
+
+    def change_rate(self, url):
+        """
+        Args:
+            url (str): The url of the page
+
+        Returns:
+            rate (float): The estimated changes per day
+        """
+        if url not in self.history:
+            return self.prior_rate
+        _, checks, changes, observed = self.history[url]
+        return poisson_change_rate(checks, changes, observed, self.prior_rate)
+
+    def last_seen(self, url, date):
+        """ The last time the page was known to be up to date: the last check or the date in the index, whichever is newer """
+        if url in self.history:
+            return max(self.history[url][0], date)
+        return date
+
+    def change_probability(self, url, date):
+        """
+        Args:
+            url (str): The url of the page
+            date (datetime.datetime): The date of the page in the index
+
+        Returns:
+            probability (float): How likely the page changed since it was seen the last time, 1 if its sitemap lastmod is newer, 0 if older
+        """
+        last = self.last_seen(url, date)
+        if url in self.lastmods:
+            return 1.0 if self.lastmods[url] > last else 0.0
+        age = max((self.now - last).total_seconds() / 86400, 0)
+        return 1 - math.exp(-self.change_rate(url) * age)
+
+    def skip(self, url, date):
+        """ Used as skip for index.Index.find_old: pages checked within min_interval and pages that did not change according to the sitemap """
+        if (self.now - self.last_seen(url, date)).total_seconds() / 86400 < self.min_interval:
+            return True
+        return url in self.lastmods and self.lastmods[url] <= self.last_seen(url, date)
+
+    def priority(self, url, date):
+        """ Used as priority for index.Index.find_old: the most likely changed page first, for the same probability the oldest one """
+        return (-self.change_probability(url, date), date)
+
+    def batch_size(self, seconds):
+        """
+        How many pages may be checked now, if this is called every seconds seconds, so the checks are spread over the day
+
+        Args:
+            seconds (float): The time since the last batch
+
+        Returns:
+            size (int): How many pages to check now
+        """
+        self.carry += self.daily_budget * seconds / 86400
+        size = int(self.carry)
+        self.carry -= size
+        return size
@@ -0,0 +1,157 @@
+""" A persistent set of all urls the crawler has already seen """
+
+import os
+import math
+import hashlib
+from array import array
+
+class BloomFilter:
+    """
+    A Bloom filter for 64 bit hashes. It never forgets an added hash, but can wrongly answer True with a probability of about error_rate
+    as long as not more than capacity hashes are added.
+
+    Attributes:
+        size (int): number of bits
+        hash_count (int): how many bits are set for each hash
+        bits (bytearray): the bits of the filter
+    """
+
+    def __init__(self, capacity : int, error_rate : float = 0.001):
+        """
+        Args:
+            capacity (int): how many hashes are expected
+            error_rate (float): the wanted probability for wrong positive answers
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        """ The bit positions of a 64 bit hash using double hashing """
+        h1 = value & 0xFFFFFFFF
+        h2 = (value >> 32) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        """ Sets the bits of a 64 bit hash """
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def update(self, values):
+        """ Adds all 64 bit hashes in values """
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+class SeenUrlStore:
+    """
+    The set of all urls the crawler has already seen (found, visited, indexed or saved for later).
+    Only a 64 bit hash of each url is kept in memory, in a set or if wanted in a BloomFilter.
+    The hashes are appended to a binary file when flush is called, so the store is loaded again when the next crawler is created.
+
+    Attributes:
+        path (str): The file where the hashes are saved (8 bytes each)
+        hashes (set or BloomFilter): The hashes of all seen urls
+        pending (array.array): The new hashes that are not written to the file yet
+        count (int): how many urls where added
+        file (io.BufferedWriter): the open file to append new hashes to
+    """
+
+    def __init__(self, path : str, bloom_capacity : int = 0, error_rate : float = 0.001):
+        """
+        Args:
+            path (str): The file where the hashes are saved
+            bloom_capacity (int): If bigger than 0 a BloomFilter for this many urls is used instead of a set (less memory, but a few urls may wrongly count as seen)
+            error_rate (float): the wanted probability for wrong positive answers of the BloomFilter
+        """
+        self.path = path
+        self.hashes = BloomFilter(bloom_capacity, error_rate) if bloom_capacity > 0 else set()
+        self.pending = array('Q')
+        self.count = 0
+
+        self.is_new = not os.path.isfile(path)
+        if not self.is_new:
+            self._load()
+
+        self.file = open(path, 'ab')
+
+    def _load(self, chunk_size = 65536):
+        """
+        Reads the hashes from the file chunk by chunk
+
+        Args:
+            chunk_size (int): how many hashes to read at once
+        """
+        with open(self.path, 'rb') as file:
+            while True:
+                data = file.read(8 * chunk_size)
+                if not data:
+                    break
+                chunk = array('Q')
+                chunk.frombytes(data[:len(data) - len(data) % 8]) # ignore a half written last hash
+                self.hashes.update(chunk)
+                self.count += len(chunk)
+
+    @staticmethod
+    def url_hash(url):
+        """
+        Hashes an url
+
+        Args:
+            url (str): the url to hash
+
+        Returns:
+            value (int): a 64 bit hash
+        """
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def __contains__(self, url):
+        return self.url_hash(url) in self.hashes
+
+    def __len__(self):
+        return self.count
+
+    def add(self, url):
+        """
+        Adds an url if it was not seen before
+
+        Args:
+            url (str): the url to add
+
+        Returns:
+            value (bool): True if the url is new, False if it was already seen
+        """
+        value = self.url_hash(url)
+        if value in self.hashes:
+            return False
+        self.hashes.add(value)
+        self.pending.append(value)
+        self.count += 1
+        return True
+
+    def add_many(self, urls):
+        """
+        Adds all urls that were not seen before
+
+        Args:
+            urls (iterable): the urls to add
+
+        Returns:
+            new_urls (list): the urls that where new
+        """
+        return [url for url in urls if self.add(url)]
+
+    def flush(self):
+        """ Writes the new hashes to the disk """
+        if not self.file.closed:
+            self.file.write(self.pending.tobytes())
+            self.file.flush()
+            self.pending = array('Q')
+
+    def close(self):
+        """ Writes the new hashes to the disk and closes the file """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
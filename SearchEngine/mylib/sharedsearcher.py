@@ -0,0 +1,144 @@
+""" One whoosh searcher for each index that is shared by all searches of a process """
+
+import os
+import threading
+from contextlib import contextmanager
+
+class SharedSearcher:
+    """
+    Keeps the opened whoosh index and one searcher for it, so a search does not have to open the index and read its files again.
+    Before a searcher is handed out, the generation of the index is checked (a directory listing): if a new one was committed,
+    the searcher is replaced. Every searcher counts how many searches use it, a replaced searcher is only closed when the last of them is done.
+    If nobody uses the old searcher, it is replaced with searcher.refresh().
+    A rebuilt index (Index.rebuild) is a new directory that may start with a generation the old one already had, so the index is
+    opened again if the inode of the directory changed.
+
+    Attributes:
+        _instances (dict): The shared instance for each index directory (absolute path)
+        index (whoosh.index.Index): The opened index, also used for writers
+        inode (int): The inode of the index directory when the index was opened
+        current (whoosh.searching.Searcher): The newest searcher, None before the first search
+        refs (dict): id of a searcher -> how many searches use it at the moment
+        retired (dict): id of a searcher -> replaced searchers that are still used
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, index, inode = None):
+        """
+        Args:
+            index (whoosh.index.Index): The opened index
+            inode (int): The inode of the index directory
+        """
+        self.index = index
+        self.inode = inode
+        self.lock = threading.Lock()
+        self.current = None
+        self.refs = {}
+        self.retired = {}
+
+    @classmethod
+    def get_instance(cls, index_path, open_index):
+        """
+        Get the shared instance of an index directory
+
+        Args:
+            index_path (str): The directory of the whoosh index
+            open_index (function): Opens or creates the index, only called the first time (or if the directory was removed or replaced)
+
+        Returns:
+            shared (SharedSearcher)
+        """
+        key = os.path.abspath(index_path)
+        with cls._instances_lock:
+            shared = cls._instances.get(key)
+            if shared is None or shared.inode != cls.directory_inode(key):
+                if shared is not None:
+                    shared.close()
+                index = open_index()
+                shared = cls._instances[key] = cls(index, cls.directory_inode(key))
+            return shared
+
+    @classmethod
+    def discard(cls, index_path):
+        """
+        Closes the shared instance of an index directory (e.g. after the directory was replaced), the next get_instance opens the index again
+
+        Args:
+            index_path (str): The directory of the whoosh index
+        """
+        with cls._instances_lock:
+            shared = cls._instances.pop(os.path.abspath(index_path), None)
+        if shared is not None:
+            shared.close()
+
+    @staticmethod
+    def directory_inode(path):
+        """ The inode of a directory, None if it does not exist """
+        try:
+            return os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def acquire(self):
+        """
+        Returns:
+            searcher (whoosh.searching.Searcher): A searcher of the newest generation, give it back with release
+        """
+        with self.lock:
+            if self.current is None:
+                self.current = self.index.searcher()
+            elif self.index.latest_generation() != self.current.reader().generation():
+                old = self.current
+                if self.refs.get(id(old), 0) == 0:
+                    # nobody uses it, so refresh may close its files
+                    self.current = old.refresh()
+                else:
+                    self.current = self.index.searcher()
+                    self.retired[id(old)] = old
+            self.refs[id(self.current)] = self.refs.get(id(self.current), 0) + 1
+            return self.current
+
+    def release(self, searcher):
+        """
+        Gives back a searcher of acquire, a replaced searcher is closed after its last search
+
+        Args:
+            searcher (whoosh.searching.Searcher): The searcher
+        """
+        with self.lock:
+            self.refs[id(searcher)] -= 1
+            if self.refs[id(searcher)] == 0:
+                del self.refs[id(searcher)]
+                if id(searcher) in self.retired:
+                    del self.retired[id(searcher)]
+                    searcher.close()
+
+    @contextmanager
+    def searcher(self):
+        """
+        Use with a with statement: with shared.searcher() as searcher: ...
+
+        Yields:
+            searcher (whoosh.searching.Searcher): A searcher of the newest generation
+        """
+        searcher = self.acquire()
+        try:
+            yield searcher
+        finally:
+            self.release(searcher)
+
+    def close(self):
+        """ Closes the searchers, the ones that are used at the moment after their last search """
+        with self.lock:
+            if self.current is not None:
+                if id(self.current) in self.refs:
+                    self.retired[id(self.current)] = self.current
+                else:
+                    self.current.close()
+            self.current = None
+            for key, searcher in list(self.retired.items()):
+                if key not in self.refs:
+                    searcher.close()
+                    del self.retired[key]
@@ -0,0 +1,239 @@
+""" SimHash fingerprints of pages and an LSH index to find near-duplicate pages before they are indexed """
+
+import hashlib
+import re
+import sqlite3
+import threading
+
+word_re = re.compile(r"\w+")
+
+def _feature_hash(feature):
+    """ 64 bit hash of a feature (str) """
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(title, text, shingle_size : int = 3, title_weight : int = 3, min_words : int = 20):
+    """
+    Computes the SimHash of a page: every shingle (some words in a row) votes for the bits of its hash.
+    Pages with almost the same text get fingerprints that differ only in a few bits.
+
+    Args:
+        title (str): The title of the page, its words count title_weight times
+        text (str): The visible text of the page
+        shingle_size (int): How many words are one feature
+        title_weight (int): How often the title words are counted
+        min_words (int): Pages with fewer words get no fingerprint, they are too short to compare
+
+    Returns:
+        fingerprint (int): 64 bit SimHash, None if the page is too short
+    """
+    words = word_re.findall(text.lower())
+    if len(words) < min_words:
+        return None
+
+    weights = {}
+    for i in range(max(1, len(words) - shingle_size + 1)):
+        shingle = " ".join(words[i:i + shingle_size])
+        weights[shingle] = weights.get(shingle, 0) + 1
+    for word in word_re.findall(title.lower()):
+        weights["title:" + word] = weights.get("title:" + word, 0) + title_weight
+
+    votes = [0] * 64
+    for feature, weight in weights.items():
+        h = _feature_hash(feature)
+        for bit in range(64):
+            if h >> bit & 1:
+                votes[bit] += weight
+            else:
+                votes[bit] -= weight
+
+    fingerprint = 0
+    for bit in range(64):
+        if votes[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(a, b):
+    """ How many bits of the fingerprints a and b are different """
+    return bin(a ^ b).count("1")
+
+class NearDuplicateIndex:
+    """
+    An LSH index of the SimHash fingerprints of all indexed pages, saved in SQLite. The 64 bits are split into max_distance + 1 bands,
+    two fingerprints that differ in at most max_distance bits are the same in at least one band, so only pages with a same band are compared.
+    If a page is a near-duplicate of an indexed page, the page is not indexed and remembered as a duplicate of that canonical url.
+    Pages that are mostly navigation can have close fingerprints, so by default the titles have to be the same too
+    (print views, session ids and other urls of the same page keep the title).
+
+    Attributes:
+        path (str): The SQLite file
+        max_distance (int): Fingerprints that differ in at most this many bits are near-duplicates
+        band_bits (int): The bits of one band
+        require_same_title (bool): Whether near-duplicates need the same title
+        fingerprints (dict): url (str) -> fingerprint (int)
+        titles (dict): url (str) -> hash (int) of the title, only if require_same_title
+        bands (dict): (band number (int), band value (int)) -> set of urls
+        duplicates (int): How many near-duplicates where found in this run
+    """
+
+    def __init__(self, path : str, max_distance : int = 3, require_same_title : bool = True):
+        """
+        Opens the database or creates it and loads the fingerprints
+
+        Args:
+            path (str): The SQLite file
+            max_distance (int): Fingerprints that differ in at most this many bits are near-duplicates
+            require_same_title (bool): Whether near-duplicates need the same title
+        """
+        self.path = path
+        self.max_distance = max_distance
+        self.require_same_title = require_same_title
+        self.band_bits = 64 // (max_distance + 1)
+        self.fingerprints = {}
+        self.titles = {}
+        self.bands = {}
+        self.duplicates = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (url TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, title TEXT NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS duplicates (url TEXT PRIMARY KEY, canonical TEXT NOT NULL)")
+        self.connection.commit()
+
+        for url, fingerprint, title in self.connection.execute("SELECT url, fingerprint, title FROM fingerprints"):
+            self._add(url, int(fingerprint, 16), int(title, 16))
+
+    @staticmethod
+    def title_hash(title):
+        """ 64 bit hash of the title without case and whitespace """
+        return _feature_hash(" ".join(title.lower().split()))
+
+    def _band_keys(self, fingerprint):
+        """ The keys of self.bands for a fingerprint """
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.max_distance + 1)]
+
+    def _add(self, url, fingerprint, title_hash):
+        """ Adds a fingerprint to the memory only """
+        self.fingerprints[url] = fingerprint
+        if self.require_same_title:
+            self.titles[url] = title_hash
+        for key in self._band_keys(fingerprint):
+            self.bands.setdefault(key, set()).add(url)
+
+    def _remove(self, url):
+        """ Removes the fingerprint of url from the memory only """
+        fingerprint = self.fingerprints.pop(url, None)
+        self.titles.pop(url, None)
+        if fingerprint is None:
+            return
+        for key in self._band_keys(fingerprint):
+            urls = self.bands.get(key)
+            if urls:
+                urls.discard(url)
+                if not urls:
+                    del self.bands[key]
+
+    def find(self, url, fingerprint, title_hash):
+        """
+        Args:
+            url (str): The url of the page (the page itself is not a duplicate of itself)
+            fingerprint (int): The SimHash of the page
+            title_hash (int): title_hash of the title of the page
+
+        Returns:
+            canonical (str): The url of an indexed page that is a near-duplicate, None if there is none
+        """
+        with self.lock:
+            for key in self._band_keys(fingerprint):
+                for candidate in self.bands.get(key, ()):
+                    if candidate == url or (self.require_same_title and self.titles[candidate] != title_hash):
+                        continue
+                    if hamming_distance(fingerprint, self.fingerprints[candidate]) <= self.max_distance:
+                        return candidate
+        return None
+
+    def check(self, url, title, text):
+        """
+        Checks whether a page is a near-duplicate of an indexed page. If it is not, its fingerprint is added,
+        else it is saved as a duplicate of the canonical url.
+
+        Args:
+            url (str): The url of the page
+            title (str): The title of the page
+            text (str): The text of the page
+
+        Returns:
+            canonical (str): The url of the page it is a near-duplicate of, None if it is not a duplicate (and should be indexed)
+        """
+        fingerprint = simhash(title, text)
+        if fingerprint is None:
+            return None
+        return self.check_fingerprint(url, fingerprint, self.title_hash(title))
+
+    def check_fingerprint(self, url, fingerprint, title_hash):
+        """
+        Like check, but with the fingerprint of the page (e.g. from the fingerprints of another NearDuplicateIndex)
+
+        Args:
+            url (str): The url of the page
+            fingerprint (int): The SimHash of the page
+            title_hash (int): title_hash of the title of the page
+
+        Returns:
+            canonical (str): The url of the page it is a near-duplicate of, None if it is not a duplicate (and should be indexed)
+        """
+        canonical = self.find(url, fingerprint, title_hash)
+        with self.lock:
+            if canonical is None:
+                self._remove(url)
+                self._add(url, fingerprint, title_hash)
+                self.connection.execute("INSERT OR REPLACE INTO fingerprints (url, fingerprint, title) VALUES (?, ?, ?)",
+                                        (url, format(fingerprint, "016x"), format(title_hash, "016x")))
+            else:
+                self.duplicates += 1
+                self.connection.execute("INSERT OR REPLACE INTO duplicates (url, canonical) VALUES (?, ?)", (url, canonical))
+        return canonical
+
+    def rows(self):
+        """
+        Returns:
+            rows (list): tuples (url (str), fingerprint (int), title hash (int)) of all saved fingerprints
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT url, fingerprint, title FROM fingerprints").fetchall()
+        return [(url, int(fingerprint, 16), int(title, 16)) for url, fingerprint, title in rows]
+
+    def remove(self, url):
+        """
+        Removes a page that is not in the index anymore
+
+        Args:
+            url (str): The url of the page
+        """
+        with self.lock:
+            self._remove(url)
+            self.connection.execute("DELETE FROM fingerprints WHERE url = ?", (url,))
+            self.connection.execute("DELETE FROM duplicates WHERE url = ? OR canonical = ?", (url, url))
+
+    def canonical(self, url):
+        """
+        Args:
+            url (str): any url
+
+        Returns:
+            canonical (str): The url of the indexed page that url is a duplicate of, None if url is not a known duplicate
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT canonical FROM duplicates WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def commit(self):
+        """ Writes the changes to the disk """
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """ Commits and closes the database """
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,157 @@
+""" A local http server with a generated website, so the crawler can be measured without crawling a real server """
+
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class SyntheticSite:
+    """
+    Serves a website of pages /page/0.html ... /page/{pages-1}.html on 127.0.0.1. Every page links to the next one (so all pages can be reached)
+    and to fan_out - 1 other random pages. The same seed always gives the same website. Pages in error_rate answer 500,
+    every answer waits latency seconds. The pages have ETags, a page changed with change gets a new ETag and text.
+
+    Attributes:
+        pages (int): How many pages the website has
+        fan_out (int): How many links each page has
+        latency (float): The seconds every answer waits
+        error_rate (float): The part of the pages that answer 500
+        page_size (int): About how many bytes of text each page has
+        seed (int): The seed of the random generator
+        versions (list): The version of each page, increased by change
+        requests (int): How many requests were answered
+        server (http.server.ThreadingHTTPServer): The server, None if it is not started
+    """
+
+    words = [f"w{k}" for k in range(2000)]
+
+    def __init__(self, pages : int = 500, fan_out : int = 8, latency : float = 0.01, error_rate : float = 0.01, page_size : int = 4000, seed : int = 0):
+        """
+        Args:
+            pages (int): How many pages the website has
+            fan_out (int): How many links each page has
+            latency (float): The seconds every answer waits
+            error_rate (float): The part of the pages that answer 500
+            page_size (int): About how many bytes of text each page has
+            seed (int): The seed of the random generator
+        """
+        self.pages = pages
+        self.fan_out = fan_out
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.seed = seed
+        self.versions = [0] * pages
+        self.errors = {i for i in range(pages) if random.Random(f"{seed}-error-{i}").random() < error_rate and i != 0}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def start_url(self):
+        """ The url of the first page """
+        return f"http://127.0.0.1:{self.server.server_address[1]}/page/0.html"
+
+    def start(self, port : int = 0):
+        """
+        Starts the server in a daemon thread
+
+        Args:
+            port (int): The port, a free one if 0
+
+        Returns:
+            site (SyntheticSite): self
+        """
+        handler = type("SyntheticSiteHandler", (_Handler,), {"site" : self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="synthetic-site")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the server """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def change(self, fraction):
+        """
+        Changes the text of some pages
+
+        Args:
+            fraction (float): The part of the pages that change
+
+        Returns:
+            changed (list): The numbers of the changed pages
+        """
+        rng = random.Random(f"{self.seed}-change-{sum(self.versions)}")
+        changed = rng.sample(range(self.pages), int(self.pages * fraction))
+        for i in changed:
+            self.versions[i] += 1
+        return changed
+
+    def links(self, i):
+        """ The numbers of the pages page i links to """
+        rng = random.Random(f"{self.seed}-links-{i}")
+        return [(i + 1) % self.pages] + [rng.randrange(self.pages) for _ in range(self.fan_out - 1)]
+
+    def page(self, i):
+        """
+        Returns:
+            body (bytes): The html of page i
+        """
+        rng = random.Random(f"{self.seed}-text-{i}-{self.versions[i]}")
+        text = []
+        size = 0
+        while size < self.page_size:
+            word = rng.choice(self.words)
+            text.append(word)
+            size += len(word) + 1
+        links = "".join(f'<li><a href="/page/{j}.html">Page {j}</a></li>' for j in self.links(i))
+        return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Page {i}</title><link rel=\"icon\" href=\"/favicon.ico\"></head>"
+                f"<body><nav><ul>{links}</ul></nav><main><h1>Page {i}</h1><p>{' '.join(text)}</p></main></body></html>").encode("utf-8")
+
+    def etag(self, i):
+        """ The ETag of page i """
+        return f'"{i}-{self.versions[i]}"'
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Answers the requests for a SyntheticSite (the class attribute site is set by SyntheticSite.start) """
+
+    site = None
+    protocol_version = "HTTP/1.1" # keep-alive like a real server
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.site
+        with site.lock:
+            site.requests += 1
+        if site.latency:
+            time.sleep(site.latency)
+
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        number = path[len("/page/"):-len(".html")] if path.startswith("/page/") and path.endswith(".html") else ""
+        if not number.isdigit() or int(number) >= site.pages:
+            return self.answer(404)
+
+        i = int(number)
+        if i in site.errors:
+            return self.answer(500)
+        if self.headers.get("If-None-Match") == site.etag(i):
+            return self.answer(304, headers={"ETag" : site.etag(i)})
+        self.answer(200, site.page(i), {"Content-Type" : "text/html; charset=utf-8", "ETag" : site.etag(i)})
+
+    def answer(self, status, body = b"", headers = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
@@ -11,22 +11,28 @@ logger = create_logger(folder = 'logs',filename = 'gugel.log', level=logging.INF
 
 class IndexUpdateDaemon(threading.Thread):
     """
-    A daemon that runs crawler.Crawler.crawl_updates() once a day at update_time (default 1 am)
+    A daemon that updates the index. If update_time is given it runs crawler.Crawler.crawl_updates() once a day at update_time, 
+    else it runs crawler.Crawler.recrawl() all the time: every interval seconds it checks the pages that most likely changed, 
+    so daily_budget pages are checked spread over the day. 
 
     Attributes:
-        info_dict (dict): a dict containing the keys: "start_url", "custom_header_name" and "index_path"
+        info_dict (dict): a dict containing the keys: "start_url", "custom_header_name", "index_path" and optionally "canonical"
         update_time (str): The time at which the deamon should update ("hh:mm")
+        daily_budget (int): How many pages the continuous daemon checks per day
+        interval (float): After how many seconds the continuous daemon checks the next pages
     """
 
-    def __init__(self,info_dict,update_time = ""):
+    def __init__(self,info_dict,update_time = "", daily_budget : int = 2000, interval : float = 600):
 
         if update_time:
             super().__init__(target=self._the_scheduled_daemon,daemon=True,name="updating-daemon")
         else:
-            super().__init__(target=self._the_direct_daemon,daemon=True,name="updating-daemon")
+            super().__init__(target=self._the_continuous_daemon,daemon=True,name="updating-daemon")
 
         self.info_dict = info_dict
         self.update_time = update_time
+        self.daily_budget = daily_budget
+        self.interval = interval
 
         logger.info('Initialized Daemon')
 
@@ -51,11 +57,38 @@ class IndexUpdateDaemon(threading.Thread):
         # just run once because the server restarts once a day. 
         self._daily_daemon_function()
 
+    def _the_continuous_daemon(self):
+        """
+        The function that runs continuesly, checks a few pages every interval seconds
+        """
+        logger.info('Update Daemon started continuous recrawling')
+        mycrawler = Crawler(self.info_dict["custom_header_name"],self.info_dict["path"], canonical_rules=self.info_dict.get("canonical"))
+        mycrawler.scheduler.daily_budget = self.daily_budget
+
+        last = time.time()
+        try:
+            while True:
+                now = time.time()
+                size = mycrawler.scheduler.batch_size(now - last)
+                last = now
+                if size:
+                    try:
+                        checked = mycrawler.recrawl(size)
+                        logger.info(f'Update Daemon checked {checked} pages')
+                    except Exception:
+                        logger.exception('Update Daemon failed, trying again next time')
+                time.sleep(max(self.interval - (time.time() - now), 0))
+        finally:
+            mycrawler.close()
+
     def _daily_daemon_function(self):
         """
         Runs the crawl_updates, is supposed to be run at the scheduled times. 
         """
         logger.info('Update Daemon started working routine')
-        mycrawler = Crawler(self.info_dict["custom_header_name"],self.info_dict["path"])
-        mycrawler.crawl_updates(age_in_days=30)
+        mycrawler = Crawler(self.info_dict["custom_header_name"],self.info_dict["path"], canonical_rules=self.info_dict.get("canonical"))
+        try:
+            mycrawler.crawl_updates(age_in_days=30)
+        finally:
+            mycrawler.close()
         logger.info('Update Daemon is done')
\ No newline at end of file
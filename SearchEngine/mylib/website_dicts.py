@@ -1,23 +1,27 @@
 custom_header_default_name = "2.0 (myemail@uos.de)"
 # custom_header crawler = "CrawlerforSearchEnginge/" + name
 # custom_header searcher = "SearchEnginge Gugel/" + name
+# "canonical" contains the rules for canonical.UrlCanonicalizer (the arguments of its __init__), {} for the default rules
 
 vm009 = {
     "start_url" : "https://vm009.rz.uos.de/crawl/index.html",
     "custom_header_name" : custom_header_default_name,
-    "path" : "vm009"
+    "path" : "vm009",
+    "canonical" : {}
 }
 
 uos = {
     "start_url" : "https://www.uni-osnabrueck.de/",
     "custom_header_name" : custom_header_default_name,
-    "path" : "uos"
+    "path" : "uos",
+    "canonical" : {"force_https" : True}
 }
 
 test = {
     "start_url" : "https://vm009.rz.uos.de/crawl/index.html",
     "custom_header_name" : custom_header_default_name,
-    "path" : "test"
+    "path" : "test",
+    "canonical" : {}
 }
 
 my_dicts = [vm009, uos, test]
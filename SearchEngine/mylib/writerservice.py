@@ -0,0 +1,242 @@
+""" A background thread that collects the changes of an index and writes them with one writer """
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+from mylib.metrics import CrawlMetrics
+
+class WriteTicket:
+    """
+    Returned for every change given to IndexWriterService, to wait until the change was committed (and new searches find it)
+
+    Attributes:
+        result: For a delete the number of deleted documents, else None
+        error (Exception): The error raised while writing, None if it worked
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def done(self, result = None, error = None):
+        """ Called by the service after the commit """
+        self.result = result
+        self.error = error
+        self.event.set()
+
+    def is_done(self):
+        """ True if the change was committed (or failed) """
+        return self.event.is_set()
+
+    def wait(self, timeout = None):
+        """
+        Waits until the change was committed
+
+        Args:
+            timeout (float): How many seconds to wait at most, None for no limit
+
+        Returns:
+            value (bool): True if it was committed, False after the timeout
+        """
+        if not self.event.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+class IndexWriterService(threading.Thread):
+    """
+    Collects add, update and delete operations for one whoosh index in a queue and writes them with one writer,
+    when max_documents operations are waiting, the oldest one waited max_delay seconds or flush is called.
+    Instead of a small segment for every page there is one for every batch. The commits do not merge segments, every merge_every-th commit
+    merges the small segments (whoosh MERGE_SMALL), so this is done in this thread too and nobody waits for it.
+    If an url has several operations in one batch, the last one counts. One service per index directory and process, see get_instance.
+
+    Attributes:
+        _instances (dict): The service of each index directory (absolute path)
+        index (index.Index): The Index that writes (its open_index, add_document, access and priority are used)
+        max_documents (int): How many operations are collected at most before they are committed
+        max_delay (float): How many seconds an operation waits at most before it is committed
+        merge_every (int): Every how many commits the segments are merged
+        queue (queue.Queue): The operations waiting to be collected
+        commits (int): How many commits were done
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, index, max_documents : int = 200, max_delay : float = 5.0, merge_every : int = 10):
+        """
+        Args:
+            index (index.Index): The Index that writes
+            max_documents (int): How many operations are collected at most before they are committed
+            max_delay (float): How many seconds an operation waits at most before it is committed
+            merge_every (int): Every how many commits the segments are merged
+        """
+        super().__init__(daemon=True, name="index-writer-service")
+        self.index = index
+        self.max_documents = max_documents
+        self.max_delay = max_delay
+        self.merge_every = merge_every
+        self.queue = queue.Queue()
+        self.commits = 0
+        self.closed = False
+        self.start()
+
+    @classmethod
+    def get_instance(cls, index):
+        """
+        Get the service of the index directory of index, started the first time
+
+        Args:
+            index (index.Index): The Index that writes
+
+        Returns:
+            service (IndexWriterService)
+        """
+        key = os.path.abspath(index.index_path)
+        with cls._instances_lock:
+            if key not in cls._instances or cls._instances[key].closed:
+                cls._instances[key] = cls(index)
+                atexit.register(cls._instances[key].close)
+            return cls._instances[key]
+
+    def add(self, record, url, date, etag = None, last_modified = None):
+        """
+        Adds a page (arguments like index.Index.add_document)
+
+        Returns:
+            ticket (WriteTicket)
+        """
+        return self.submit("add", url, (record, url, date, etag, last_modified))
+
+    def update(self, record, url, date, etag = None, last_modified = None):
+        """
+        Replaces the entry of url by a new one (added if there is none)
+
+        Returns:
+            ticket (WriteTicket)
+        """
+        return self.submit("update", url, (record, url, date, etag, last_modified))
+
+    def delete(self, url):
+        """
+        Deletes the entry of url
+
+        Returns:
+            ticket (WriteTicket): its result is the number of deleted documents
+        """
+        return self.submit("delete", url, None)
+
+    def submit(self, kind, url, args):
+        ticket = WriteTicket()
+        if self.closed:
+            ticket.done(error=RuntimeError("The index writer service is closed"))
+        else:
+            self.queue.put((kind, url, args, ticket))
+        return ticket
+
+    def flush(self, timeout = None):
+        """
+        Commits all operations that were given before and waits until they are committed
+
+        Args:
+            timeout (float): How many seconds to wait at most, None for no limit
+
+        Returns:
+            value (bool): True if they were committed, False after the timeout
+        """
+        return self.submit("flush", None, None).wait(timeout)
+
+    def close(self):
+        """ Commits everything that is still waiting and stops the thread """
+        if not self.closed:
+            ticket = self.submit("close", None, None)
+            self.closed = True
+            ticket.wait()
+            self.join()
+
+    def run(self):
+        """
+        Collects the operations and commits them until close is called
+        """
+        batch = []
+        waiting = [] # tickets of flush and close
+        first = None
+        running = True
+        while running:
+            timeout = None if not batch else max(first + self.max_delay - time.monotonic(), 0)
+            try:
+                kind, url, args, ticket = self.queue.get(timeout=timeout)
+                if kind in ("flush", "close"):
+                    waiting.append(ticket)
+                    running = kind != "close"
+                else:
+                    if not batch:
+                        first = time.monotonic()
+                    batch.append((kind, url, args, ticket))
+            except queue.Empty:
+                pass
+
+            if waiting or len(batch) >= self.max_documents or (batch and time.monotonic() - first >= self.max_delay):
+                error = self.commit(batch) if batch else None
+                for ticket in waiting:
+                    ticket.done(error=error)
+                batch = []
+                waiting = []
+
+    def commit(self, batch):
+        """
+        Writes a batch of operations with one writer
+
+        Args:
+            batch (list): tuples (kind (str), url (str), args (tuple), ticket (WriteTicket))
+
+        Returns:
+            error (Exception): The error raised while writing, None if it worked
+        """
+        # the last operation of an url counts. A delete only finds committed documents, so an add after another operation of the batch
+        # has to delete too
+        final = {}
+        for kind, url, args, _ in batch:
+            if kind == "add" and url in final:
+                kind = "update"
+            final[url] = (kind, args)
+
+        index = self.index.open_index()
+        merge = (self.commits + 1) % self.merge_every == 0
+
+        def write():
+            started = time.monotonic()
+            deleted = {}
+            writer = index.writer()
+            try:
+                for url, (kind, args) in final.items():
+                    if kind in ("update", "delete"):
+                        deleted[url] = writer.delete_by_term("url", url)
+                    if kind in ("add", "update"):
+                        self.index.add_document(writer, *args)
+                writer.commit(merge=merge)
+            except BaseException:
+                writer.cancel()
+                raise
+            return started, deleted
+
+        try:
+            started, deleted = self.index.access.write(write, self.index.priority)
+        except Exception as e:
+            for *_, ticket in batch:
+                ticket.done(error=e)
+            return e
+
+        self.commits += 1
+        metrics = CrawlMetrics.get_instance()
+        metrics.observe("crawler_index_commit_seconds", time.monotonic() - started)
+        metrics.inc("crawler_indexed_documents_total", value=sum(1 for kind, _ in final.values() if kind != "delete"))
+        for kind, url, _, ticket in batch:
+            ticket.done(deleted.get(url) if kind == "delete" else None)
+        return None
@@ -3,7 +3,7 @@
 
 from flask import Flask, request, render_template, jsonify
 import json
-import requests
+import http_session
 from bot.bot_guessing2 import GuessingBot2 as GuessingBot
 import datetime
 
@@ -46,7 +46,7 @@ def register_command():
     global CHANNEL_AUTHKEY, CHANNEL_NAME, CHANNEL_ENDPOINT
 
     # send a POST request to server /channels
-    response = requests.post(HUB_URL + '/channels', headers={'Authorization': 'authkey ' + HUB_AUTHKEY},
+    response = http_session.post(HUB_URL + '/channels', headers={'Authorization': 'authkey ' + HUB_AUTHKEY},
                              data=json.dumps({
             "name": CHANNEL_NAME,
             "endpoint": CHANNEL_ENDPOINT,
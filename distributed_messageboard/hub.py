@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 import json
 import datetime
 import requests
+import http_session
 
 db = SQLAlchemy()
 
@@ -51,7 +52,10 @@ def home_page():
 def health_check(endpoint, authkey):
     # make GET request to URL
     # add authkey to request header
-    response = requests.get(endpoint+'/health', headers={'Authorization': 'authkey '+authkey})
+    try:
+        response = http_session.get(endpoint+'/health', headers={'Authorization': 'authkey '+authkey})
+    except requests.exceptions.RequestException:
+        return False
     if response.status_code != 200:
         return False
     # TODO: check payload
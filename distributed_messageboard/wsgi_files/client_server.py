@@ -1,4 +1,5 @@
 from flask import Flask, request, render_template, url_for, redirect
+import http_session
 import requests
 import urllib.parse
 import datetime
@@ -16,7 +17,10 @@ def update_channels():
     if CHANNELS and LAST_CHANNEL_UPDATE and (datetime.datetime.now() - LAST_CHANNEL_UPDATE).seconds < 60:
         return CHANNELS
     # fetch list of channels from server
-    response = requests.get(HUB_URL + '/channels', headers={'Authorization': 'authkey ' + HUB_AUTHKEY})
+    try:
+        response = http_session.get(HUB_URL + '/channels', headers={'Authorization': 'authkey ' + HUB_AUTHKEY})
+    except requests.exceptions.RequestException as e:
+        return "Error fetching channels: "+str(e), 400
     if response.status_code != 200:
         return "Error fetching channels: "+str(response.text), 400
     channels_response = response.json()
@@ -46,7 +50,10 @@ def show_channel():
             break
     if not channel:
         return "Channel not found", 404
-    response = requests.get(channel['endpoint'], headers={'Authorization': 'authkey ' + channel['authkey']})
+    try:
+        response = http_session.get(channel['endpoint'], headers={'Authorization': 'authkey ' + channel['authkey']})
+    except requests.exceptions.RequestException as e:
+        return "Error fetching messages: "+str(e), 400
     if response.status_code != 200:
         return "Error fetching messages: "+str(response.text), 400
     messages = response.json()
@@ -69,9 +76,12 @@ def post_message():
     message_content = request.form['content']
     message_sender = request.form['sender']
     message_timestamp = datetime.datetime.now().isoformat()
-    response = requests.post(channel['endpoint'],
-                             headers={'Authorization': 'authkey ' + channel['authkey']},
-                             json={'content': message_content, 'sender': message_sender, 'timestamp': message_timestamp})
+    try:
+        response = http_session.post(channel['endpoint'],
+                                 headers={'Authorization': 'authkey ' + channel['authkey']},
+                                 json={'content': message_content, 'sender': message_sender, 'timestamp': message_timestamp})
+    except requests.exceptions.RequestException as e:
+        return "Error posting message: "+str(e), 400
     if response.status_code != 200:
         return "Error posting message: "+str(response.text), 400
     return redirect(url_for('show_channel')+'?channel='+urllib.parse.quote(post_channel))
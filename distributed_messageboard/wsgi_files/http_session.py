@@ -0,0 +1,62 @@
+## http_session.py - one shared requests session for the hub, the client and the channels
+##
+## a copy of ../http_session.py for the server, both copies must stay the same
+##
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+
+TIMEOUT = 10 # seconds
+CONNECTIONS_PER_HOST = 10
+MAX_BYTES = 1024 * 1024 # the biggest response body that is downloaded
+CHUNK_SIZE = 64 * 1024
+
+# the connections to the hub and the channels are kept open and reused for the next request
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=20, pool_maxsize=CONNECTIONS_PER_HOST, pool_block=True)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+session.headers['Accept-Encoding'] = DEFAULT_ACCEPT_ENCODING
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    # the response is bigger than MAX_BYTES and was not downloaded completely
+    pass
+
+
+def read_body(url, response):
+    # downloads the body of a streamed response, but not more than MAX_BYTES
+    try:
+        length = int(response.headers.get('content-length', 0))
+    except ValueError:
+        length = 0
+    if length > MAX_BYTES:
+        response.close()
+        raise ResponseTooLarge(f"{url} has {length} bytes", response=response)
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_BYTES:
+            response.close()
+            raise ResponseTooLarge(f"{url} has more than {MAX_BYTES} bytes", response=response)
+        chunks.append(chunk)
+
+    # everything was read, so the connection goes back into the pool for the next request
+    response._content = b''.join(chunks)
+    response.close()
+    return response
+
+
+def get(url, **kwargs):
+    # the same as requests.get, but with the shared session, a timeout and at most MAX_BYTES
+    kwargs.setdefault('timeout', TIMEOUT)
+    return read_body(url, session.get(url, stream=True, **kwargs))
+
+
+def post(url, **kwargs):
+    # the same as requests.post, but with the shared session, a timeout and at most MAX_BYTES
+    kwargs.setdefault('timeout', TIMEOUT)
+    return read_body(url, session.post(url, stream=True, **kwargs))